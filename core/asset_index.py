@@ -0,0 +1,150 @@
+import os
+import threading
+from collections import namedtuple
+
+from core import color_stats
+
+# In-memory index of the asset directories. inputs/, icons/ and fonts/ are
+# scanned once (and rescanned only when something in them changed, for the
+# long-running service), so resolving an asset never probes the filesystem:
+# no os.path.exists checks, extension retries or globbing per lookup.
+#
+# Assets resolve by path ("inputs/day3_hero.png"), by path with any or a
+# wrong extension ("inputs/day2_hero.jpeg" -> day2_hero.png) or by logical
+# name alone ("day3_hero").
+
+INDEX_DIRS = ("inputs", "icons", "fonts")
+EXTENSION_PREFERENCE = (".png", ".jpg", ".jpeg", ".webp") # Order tried when the extension doesn't match
+
+class AssetEntry(namedtuple("AssetEntry", "name path size mtime_ns")):
+    """One indexed file: logical name (file name without extension), path, size and mtime."""
+    __slots__ = ()
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the file contents; a stable cache key (computed on first use)."""
+        return color_stats.asset_hash(self.path)
+
+def _key(path: str) -> str:
+    return os.path.normpath(os.path.relpath(os.path.abspath(os.path.expanduser(path))))
+
+def _ext_rank(entry: AssetEntry) -> int:
+    ext = os.path.splitext(entry.path)[1].lower()
+    return EXTENSION_PREFERENCE.index(ext) if ext in EXTENSION_PREFERENCE else len(EXTENSION_PREFERENCE)
+
+class AssetIndex:
+    """Snapshot of the files in a set of asset directories."""
+
+    def __init__(self, dirs=INDEX_DIRS):
+        self.dirs = tuple(dirs)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._by_path = {}    # normalised path -> entry
+        self._by_stem = {}    # normalised path without extension -> [entries]
+        self._by_name = {}    # logical name -> [entries]
+        self.refresh()
+
+    def _scan(self) -> list:
+        entries = []
+        for directory in self.dirs:
+            try:
+                with os.scandir(directory) as it:
+                    for item in it:
+                        if item.is_file():
+                            st = item.stat()
+                            path = os.path.join(directory, item.name)
+                            name = os.path.splitext(item.name)[0]
+                            entries.append(AssetEntry(name, path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue # Missing directory: nothing to index
+        entries.sort(key=lambda e: e.path)
+        return entries
+
+    def refresh(self) -> bool:
+        """Rescans the directories; rebuilds the index only if a file was added,
+        removed or modified. Returns True if it was rebuilt."""
+        entries = self._scan()
+        signature = tuple(entries)
+        with self._lock:
+            if signature == self._signature:
+                return False
+            by_path, by_stem, by_name = {}, {}, {}
+            for entry in entries:
+                key = _key(entry.path)
+                by_path[key] = entry
+                by_stem.setdefault(os.path.splitext(key)[0], []).append(entry)
+                by_name.setdefault(entry.name, []).append(entry)
+            for group in list(by_stem.values()) + list(by_name.values()):
+                group.sort(key=_ext_rank)
+            self._by_path, self._by_stem, self._by_name = by_path, by_stem, by_name
+            self._signature = signature
+        return True
+
+    @property
+    def signature(self) -> tuple:
+        """The indexed entries as of the last scan; changes when any indexed file does."""
+        return self._signature
+
+    def lookup(self, path: str):
+        """Returns the entry for exactly `path`, or None if it isn't indexed."""
+        return self._by_path.get(_key(path))
+
+    def resolve(self, name_or_path: str):
+        """Resolves a path or logical name to an AssetEntry, or None if not found.
+
+        An exact path wins; otherwise the same file name with another image
+        extension; a bare name (no directory) matches across all directories.
+        """
+        if not name_or_path:
+            return None
+        entry = self.lookup(name_or_path)
+        if entry is not None:
+            return entry
+        key = _key(name_or_path)
+        candidates = self._by_stem.get(os.path.splitext(key)[0])
+        if not candidates and not os.path.dirname(name_or_path):
+            candidates = self._by_name.get(os.path.splitext(name_or_path)[0])
+        return candidates[0] if candidates else None
+
+    def indexes(self, path: str) -> bool:
+        """True if `path` lies in one of the indexed directories."""
+        directory = os.path.dirname(_key(path))
+        return any(directory == _key(d) for d in self.dirs)
+
+_index = None
+
+def get_index() -> AssetIndex:
+    """The process-wide index of INDEX_DIRS, scanned on first use."""
+    global _index
+    if _index is None:
+        _index = AssetIndex()
+    return _index
+
+def refresh_if_changed() -> bool:
+    """Picks up added, removed or modified assets (long-running service mode)."""
+    return get_index().refresh()
+
+def resolve(name_or_path: str):
+    """Resolves a path or logical name (e.g. "day3_hero") to an AssetEntry, or None.
+
+    Paths outside the indexed directories are looked up on disk instead,
+    trying the other image extensions like the index does.
+    """
+    index = get_index()
+    if not name_or_path or index.indexes(name_or_path) or not os.path.dirname(name_or_path):
+        return index.resolve(name_or_path)
+    root, _ = os.path.splitext(name_or_path)
+    for path in (name_or_path,) + tuple(root + ext for ext in EXTENSION_PREFERENCE):
+        try:
+            st = os.stat(os.path.expanduser(path))
+        except OSError:
+            continue
+        return AssetEntry(os.path.basename(root), path, st.st_size, st.st_mtime_ns)
+    return None
+
+def exists(path: str) -> bool:
+    """True if the exact file exists (answered from the index for indexed directories)."""
+    index = get_index()
+    if index.indexes(path):
+        return index.lookup(path) is not None
+    return os.path.isfile(os.path.expanduser(path))
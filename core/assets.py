@@ -0,0 +1,53 @@
+import os
+from PIL import Image
+
+from core import metrics, preview, raw_assets
+
+# Shared loaders for small, frequently reused image assets (icons, logo).
+# Decoded originals and their resized variants are cached per process.
+
+ICONS_DIR = "icons"
+
+_decoded = {}   # abs path -> decoded RGBA image
+_resized = {}   # (abs path, size) -> resized RGBA image
+
+def _decode_rgba(path: str) -> Image.Image:
+    abs_path = os.path.abspath(path)
+    img = _decoded.get(abs_path)
+    if img is None:
+        with raw_assets.open_image(abs_path) as src:
+            img = src.convert("RGBA")
+        _decoded[abs_path] = img
+    return img
+
+def load_icon(path: str, size: tuple) -> Image.Image:
+    """Returns the icon at `path` as an RGBA image resized to `size` (cached).
+
+    The returned image is shared; callers must treat it as read-only.
+    Raises OSError if the file can't be opened, like Image.open.
+    """
+    key = (os.path.abspath(path), tuple(size))
+    icon = _resized.get(key)
+    metrics.CACHE_LOOKUPS.inc(cache="icons", result="hit" if icon is not None else "miss")
+    if icon is None:
+        icon = _decode_rgba(path).resize(tuple(size), Image.Resampling.LANCZOS)
+        preview.tag_source(icon, "icon", preview.source_key(path), size)
+        _resized[key] = icon
+    return icon
+
+def preload_icons(icons_dir: str = ICONS_DIR) -> int:
+    """Decodes every raster image in `icons_dir`. Returns the number loaded."""
+    count = 0
+    try:
+        names = sorted(os.listdir(icons_dir))
+    except OSError as e:
+        print(f"Warning: Could not list icons directory '{icons_dir}': {e}")
+        return 0
+    for name in names:
+        path = os.path.join(icons_dir, name)
+        try:
+            _decode_rgba(path)
+            count += 1
+        except Exception:
+            continue # Not a raster image Pillow can read (e.g. SVG)
+    return count
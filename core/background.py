@@ -0,0 +1,66 @@
+from PIL import Image
+import numpy as np
+
+from core import preview, raw_assets
+
+# Fused background preparation: crop, scale, brightness and a constant-colour
+# tint overlay in one go, producing the final RGB page base without the chain
+# of full-page RGBA intermediates the generators used to build.
+
+def fit_crop_box(src_size: tuple, size: tuple, centering=(0.5, 0.5)) -> tuple:
+    """Source-space box that fill-crops `src_size` to the aspect ratio of `size`."""
+    src_w, src_h = src_size
+    target_w, target_h = size
+    scale = max(target_w / src_w, target_h / src_h)
+    crop_w = target_w / scale
+    crop_h = target_h / scale
+    left = (src_w - crop_w) * centering[0]
+    top = (src_h - crop_h) * centering[1]
+    return (left, top, left + crop_w, top + crop_h)
+
+def build_tone_lut(brightness: float = 1.0, tint=None) -> list:
+    """Builds a 768-entry RGB lookup table applying brightness, then a tint overlay.
+
+    `tint` is an (r, g, b, a) colour composited over the darkened pixels, the
+    same result as alpha-compositing a full-page overlay of that colour.
+    """
+    levels = np.arange(256, dtype=np.float32)
+    base = np.clip(levels * brightness, 0, 255)
+    channels = [base, base, base]
+    if tint is not None:
+        tint = tuple(tint)
+        alpha = (tint[3] if len(tint) > 3 else 255) / 255.0
+        channels = [base * (1.0 - alpha) + tint[c] * alpha for c in range(3)]
+    lut = np.concatenate(channels)
+    return np.clip(np.rint(lut), 0, 255).astype(np.uint8).tolist()
+
+def prepare_background(img: Image.Image, size: tuple, brightness: float = 1.0, tint=None, centering=(0.5, 0.5)) -> Image.Image:
+    """Returns `img` fill-cropped to `size`, darkened and tinted, as an RGB image.
+
+    The crop is folded into the resample (`resize(box=...)`) so only the
+    visible region is scaled, and brightness/tint are folded into a single
+    per-channel lookup table applied in one pass over the scaled pixels.
+    Mapped RGBX assets are scaled as they are and only converted at page size.
+    Scaling just the crop box samples slightly differently from resizing the
+    whole image and cropping afterwards (as the hotels and inclusions pages
+    used to), so their pixels differ by a few levels from those older renders.
+    """
+    if img.mode not in ("RGB", "RGBX"):
+        img = img.convert("RGB")
+    size = (int(size[0]), int(size[1]))
+    box = fit_crop_box(img.size, size, centering)
+    out = img.resize(size, Image.Resampling.LANCZOS, box=box)
+    if out.mode != "RGB":
+        out = out.convert("RGB")
+    if brightness != 1.0 or tint is not None:
+        out = out.point(build_tone_lut(brightness, tint))
+    return out
+
+def load_background(path: str, size: tuple, brightness: float = 1.0, tint=None, centering=(0.5, 0.5)) -> Image.Image:
+    """Opens the image asset at `path` and prepares it as a page background.
+
+    Raises like Image.open if the file can't be opened.
+    """
+    with raw_assets.open_image(path) as src:
+        img = preview.fit_image(src, size, lambda src, size: prepare_background(src, size, brightness, tint, centering))
+    return preview.tag_source(img, "background", preview.source_key(path), size, brightness, tint, centering)
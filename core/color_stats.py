@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from PIL import Image
+import numpy as np
+
+# Colour statistics (average, dominant and edge colours) of image assets.
+# Computed once per asset on a small downsampled copy and stored on disk keyed
+# by the asset's content hash, so repeated renders never re-scan the pixels.
+
+COLOR_STATS_CACHE_DIR = os.path.join(".cache", "color_stats")
+STATS_SAMPLE_SIZE = 128   # Longest side of the downsampled copy used for sampling
+EDGE_FRACTION = 0.05      # Edge strips cover 5% of the height/width (matches the hero fill sampling)
+DOMINANT_BITS = 5         # Bits per channel when bucketing colours for the dominant colour
+
+_stats_by_hash = {}       # content hash -> stats
+_hash_by_file = {}        # (path, mtime_ns, size) -> content hash
+
+def asset_hash(path: str) -> str:
+    """SHA-256 of the file contents, memoized on (path, mtime, size)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    digest = _hash_by_file.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _hash_by_file[key] = digest
+    return digest
+
+def _mean_color(pixels: np.ndarray) -> list:
+    return [int(c) for c in pixels.reshape(-1, 3).mean(axis=0)]
+
+def compute_color_stats(img: Image.Image, in_place: bool = False) -> dict:
+    """Computes average, dominant and edge colours of an image on a downsampled copy.
+
+    With `in_place=True` the image itself is downsampled, which lets a freshly
+    opened JPEG use draft-mode decoding instead of a full-size decode.
+    """
+    source_size = img.size
+    sample = img if in_place else img.copy()
+    sample.thumbnail((STATS_SAMPLE_SIZE, STATS_SAMPLE_SIZE), Image.Resampling.BOX)
+    if sample.mode != "RGB":
+        sample = sample.convert("RGB")
+    pixels = np.asarray(sample)
+    h, w = pixels.shape[:2]
+    strip_h = max(1, int(round(h * EDGE_FRACTION)))
+    strip_w = max(1, int(round(w * EDGE_FRACTION)))
+
+    # Dominant colour: most populated bucket of a coarse RGB histogram, averaged
+    flat = pixels.reshape(-1, 3)
+    shift = 8 - DOMINANT_BITS
+    q = (flat >> shift).astype(np.int32)
+    codes = (q[:, 0] << (2 * DOMINANT_BITS)) | (q[:, 1] << DOMINANT_BITS) | q[:, 2]
+    top_code = int(np.argmax(np.bincount(codes, minlength=1 << (3 * DOMINANT_BITS))))
+
+    return {
+        "source_size": list(source_size),
+        "average": _mean_color(pixels),
+        "dominant": _mean_color(flat[codes == top_code]),
+        "edges": {
+            "top": _mean_color(pixels[:strip_h]),
+            "bottom": _mean_color(pixels[h - strip_h:]),
+            "left": _mean_color(pixels[:, :strip_w]),
+            "right": _mean_color(pixels[:, w - strip_w:]),
+        },
+    }
+
+def get_color_stats(path: str):
+    """Returns the colour statistics of the image at `path`, or None on error.
+
+    Looks up the in-process cache, then the on-disk cache, and only decodes
+    the image when neither has an entry for the asset's content hash.
+    """
+    try:
+        digest = asset_hash(path)
+    except OSError as e:
+        print(f"Warning: Could not hash asset '{path}' for colour stats: {e}")
+        return None
+
+    stats = _stats_by_hash.get(digest)
+    if stats is not None:
+        return stats
+
+    cache_path = os.path.join(COLOR_STATS_CACHE_DIR, f"{digest}.json")
+    try:
+        with open(cache_path, "r") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        stats = None
+
+    if stats is None:
+        try:
+            with Image.open(path) as img:
+                stats = compute_color_stats(img, in_place=True)
+        except Exception as e:
+            print(f"Warning: Could not compute colour stats for '{path}': {e}")
+            return None
+        try:
+            os.makedirs(COLOR_STATS_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, cache_path) # Atomic, safe with concurrent writers
+        except OSError as e:
+            print(f"Warning: Could not write colour stats cache '{cache_path}': {e}")
+
+    _stats_by_hash[digest] = stats
+    return stats
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import random
+import time
+
+from core.frozen import Frozen
+
+# Deterministic rendering mode: every random choice is seeded from a hash of the
+# page inputs and encoder/PDF settings are pinned, so identical inputs always
+# produce byte-identical page images and PDFs (usable as content-addressed keys).
+
+_DETERMINISTIC = False
+
+# Fixed timestamp written as PDF CreationDate/ModDate in deterministic mode
+FIXED_PDF_DATE = time.gmtime(946684800) # 2000-01-01T00:00:00Z
+FIXED_PDF_TITLE = "Itinerary"
+
+# Encoder settings pinned in deterministic mode so Pillow defaults can't drift
+PINNED_JPEG_OPTIONS = {
+    "subsampling": 2,     # 4:2:0
+    "optimize": False,
+    "progressive": False,
+}
+
+def enable_deterministic_mode(enabled: bool = True):
+    """Turns deterministic rendering on (or off) for this process."""
+    global _DETERMINISTIC
+    _DETERMINISTIC = bool(enabled)
+
+def is_deterministic() -> bool:
+    """Returns True when deterministic rendering mode is active."""
+    return _DETERMINISTIC
+
+def _canonical(obj):
+    # Records hash by their fields; anything else non-JSON by its str()
+    if isinstance(obj, Frozen):
+        return obj.as_dict()
+    return str(obj)
+
+def canonical_hash(*parts) -> str:
+    """SHA-256 hex digest of the canonical JSON form of the given parts."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=_canonical)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def rng_for(*inputs):
+    """Returns a random source for the given page inputs.
+
+    In deterministic mode this is a random.Random seeded from a hash of the
+    inputs; otherwise it is the global random module (previous behaviour).
+    """
+    if not _DETERMINISTIC:
+        return random
+    return random.Random(int(canonical_hash(*inputs)[:16], 16))
+
+def jpeg_save_kwargs(quality: int = 95, dpi=None) -> dict:
+    """Keyword arguments for Image.save(..., "JPEG")."""
+    kwargs = {"quality": quality}
+    if dpi:
+        kwargs["dpi"] = tuple(dpi)
+    if _DETERMINISTIC:
+        kwargs.update(PINNED_JPEG_OPTIONS)
+    return kwargs
+
+def pdf_save_kwargs() -> dict:
+    """Extra keyword arguments for Image.save(..., "PDF") pinning the metadata."""
+    if not _DETERMINISTIC:
+        return {}
+    return {
+        "title": FIXED_PDF_TITLE,
+        "creationDate": FIXED_PDF_DATE,
+        "modDate": FIXED_PDF_DATE,
+    }
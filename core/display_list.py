@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from core import text_sprites
+
+# Two-phase rendering. A page's layout step measures everything once and
+# produces a DisplayList: an ordered list of drawing operations (positioned
+# text runs, image placements, shapes, blurred regions and nested layers).
+# paint() then executes the list on a Pillow canvas. Layout never touches the
+# canvas, so display lists can be kept, compared between renders (diff) and
+# handed to other backends.
+#
+# Ops are plain namedtuples. Colours and coordinates are stored exactly as
+# the page code passes them to ImageDraw, so painting is pixel-identical to
+# drawing directly.
+
+Text = namedtuple("Text", "xy text font fill anchor")
+Text.__doc__ = "A single-line text run drawn like ImageDraw.text (through the sprite cache)."
+Paste = namedtuple("Paste", "image xy mask")
+Paste.__doc__ = "An image placement, like canvas.paste(image, xy, mask)."
+Line = namedtuple("Line", "points fill width")
+Rect = namedtuple("Rect", "box fill outline")
+RoundedRect = namedtuple("RoundedRect", "box radius fill outline width")
+Blur = namedtuple("Blur", "box radius mask")
+Blur.__doc__ = "Frosted glass: the canvas region under `box` is Gaussian-blurred and pasted back through `mask`."
+Layer = namedtuple("Layer", "display_list xy mask")
+Layer.__doc__ = "A child DisplayList painted on its own canvas and pasted at `xy` (through `mask`, if any)."
+
+OP_TYPES = (Text, Paste, Line, Rect, RoundedRect, Blur, Layer)
+
+class DisplayList:
+    """Drawing operations for one canvas of `size` and `mode`.
+
+    `background` is a fill colour, or an Image used as the base canvas.
+    """
+
+    def __init__(self, size: tuple, mode: str = "RGB", background=(0, 0, 0)):
+        self.size = tuple(size)
+        self.mode = mode
+        self.background = background
+        self.ops = []
+
+    def add(self, op):
+        self.ops.append(op)
+        return op
+
+    def extend(self, ops):
+        self.ops.extend(ops)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops)
+
+    def __eq__(self, other):
+        return (isinstance(other, DisplayList) and self.size == other.size and self.mode == other.mode
+                and self.background == other.background and self.ops == other.ops)
+
+    def diff(self, other) -> list:
+        """Indices of the ops that differ from `other` (ops present in only one list included)."""
+        changed = [i for i, (a, b) in enumerate(zip(self.ops, other.ops)) if a != b]
+        changed.extend(range(min(len(self.ops), len(other.ops)), max(len(self.ops), len(other.ops))))
+        return changed
+
+    def counts(self) -> dict:
+        """Number of ops of each type, e.g. {"Text": 12, "Paste": 3}."""
+        counts = {}
+        for op in self.ops:
+            name = type(op).__name__
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+# --- Measuring (layout phase) ---
+
+class TextMeasurer:
+    """Stands in for an ImageDraw when only measuring text; textbbox results are cached.
+
+    Measures the way a draw on an RGB/RGBA canvas would (anti-aliased mode).
+    """
+    MAX_ENTRIES = 8192
+
+    def __init__(self):
+        self._draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def textbbox(self, xy, text, font=None, anchor=None, spacing=4, **kwargs):
+        if kwargs or tuple(xy) != (0, 0):
+            return self._draw.textbbox(xy, text, font=font, anchor=anchor, spacing=spacing, **kwargs)
+        key = (font, text, anchor, spacing)
+        with self._lock:
+            bbox = self._cache.get(key)
+            if bbox is not None:
+                self._cache.move_to_end(key)
+                return bbox
+        bbox = self._draw.textbbox((0, 0), text, font=font, anchor=anchor, spacing=spacing)
+        with self._lock:
+            self._cache[key] = bbox
+            if len(self._cache) > self.MAX_ENTRIES:
+                self._cache.popitem(last=False)
+        return bbox
+
+    def textlength(self, text, font=None, **kwargs):
+        return self._draw.textlength(text, font=font, **kwargs)
+
+_measurer = TextMeasurer()
+
+def measurer() -> TextMeasurer:
+    """The process-wide text measurer used by layout code."""
+    return _measurer
+
+# --- Painting ---
+
+def _new_canvas(display_list: DisplayList, consume_background: bool) -> Image.Image:
+    background = display_list.background
+    if isinstance(background, Image.Image):
+        canvas = background if consume_background else background.copy()
+        return canvas if canvas.mode == display_list.mode else canvas.convert(display_list.mode)
+    return Image.new(display_list.mode, display_list.size, background)
+
+def _paint_op(canvas: Image.Image, draw: ImageDraw.ImageDraw, op, layer_images: dict):
+    if isinstance(op, Text):
+        text_sprites.draw_text(draw, op.xy, op.text, fill=op.fill, font=op.font, anchor=op.anchor)
+    elif isinstance(op, Paste):
+        canvas.paste(op.image, op.xy, op.mask)
+    elif isinstance(op, Line):
+        draw.line(op.points, fill=op.fill, width=op.width)
+    elif isinstance(op, Rect):
+        draw.rectangle(op.box, fill=op.fill, outline=op.outline)
+    elif isinstance(op, RoundedRect):
+        draw.rounded_rectangle(op.box, radius=op.radius, fill=op.fill, outline=op.outline, width=op.width)
+    elif isinstance(op, Blur):
+        blurred = canvas.crop(op.box).filter(ImageFilter.GaussianBlur(op.radius))
+        canvas.paste(blurred, op.box[:2], op.mask)
+        blurred.close()
+    elif isinstance(op, Layer):
+        layer = layer_images.pop(id(op), None) or paint(op.display_list)
+        canvas.paste(layer, op.xy, op.mask)
+        layer.close()
+    else:
+        raise TypeError(f"Unknown display list op: {op!r}")
+
+def paint(display_list: DisplayList, consume_background: bool = False, threads: int = 1) -> Image.Image:
+    """Executes a display list and returns the painted canvas.
+
+    With `consume_background`, an Image background is painted on directly
+    instead of on a copy (the list can't be painted again afterwards).
+    With `threads` > 1 the top-level layers, which never read the parent
+    canvas, are painted concurrently before the ops run in order.
+    """
+    canvas = _new_canvas(display_list, consume_background)
+    layer_images = {}
+    layers = [op for op in display_list.ops if isinstance(op, Layer)]
+    if threads > 1 and len(layers) > 1:
+        with ThreadPoolExecutor(max_workers=min(threads, len(layers)), thread_name_prefix="paint-layer") as executor:
+            for op, image in zip(layers, executor.map(lambda op: paint(op.display_list), layers)):
+                layer_images[id(op)] = image
+    draw = ImageDraw.Draw(canvas)
+    for op in display_list.ops:
+        _paint_op(canvas, draw, op, layer_images)
+    return canvas
@@ -0,0 +1,80 @@
+import io
+import os
+from PIL import ImageFont
+
+from core import metrics
+
+# Process-wide font cache. Font files are read once and every (file, size)
+# face is created once; a pre-fork parent fills this so workers inherit it.
+
+FONTS_DIR = "fonts"
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+_font_bytes = {}   # abs path -> raw font file bytes
+_fonts = {}        # (abs path, size, index) -> FreeTypeFont
+_font_files = {}   # id(FreeTypeFont) -> abs path, for fonts created here
+_variants = {}     # (id(font), size) -> (font, variant) for fonts not created here
+_defaults = {}     # size -> ImageFont.load_default(size)
+
+def get_font(path: str, size: int, index: int = 0):
+    """Cached equivalent of ImageFont.truetype(path, size); raises OSError like it."""
+    abs_path = os.path.abspath(path)
+    key = (abs_path, int(size), index)
+    font = _fonts.get(key)
+    metrics.CACHE_LOOKUPS.inc(cache="fonts", result="hit" if font is not None else "miss")
+    if font is None:
+        data = _font_bytes.get(abs_path)
+        source = io.BytesIO(data) if data is not None else path
+        font = ImageFont.truetype(source, int(size), index=index)
+        _fonts[key] = font
+        _font_files[id(font)] = abs_path
+    return font
+
+def default_font(size: float = None):
+    """Cached equivalent of ImageFont.load_default(size), for fallbacks when a font file is missing.
+
+    A fresh default font per page would also grow every cache keyed by font
+    (sized variants, text sprites) on each render.
+    """
+    font = _defaults.get(size)
+    if font is None:
+        font = _defaults[size] = ImageFont.load_default(size)
+    return font
+
+def font_at_size(font, size: int):
+    """`font` at another size, cached like get_font (works for ImageFont.load_default fonts too)."""
+    size = int(size)
+    if font.size == size:
+        return font
+    path = _font_files.get(id(font))
+    if path is not None:
+        return get_font(path, size, font.index)
+    key = (id(font), size)
+    entry = _variants.get(key)
+    if entry is None:
+        entry = _variants[key] = (font, font.font_variant(size=size)) # Holds `font` so its id stays unique
+    return entry[1]
+
+def font_file(font):
+    """Path of the file a get_font() font was loaded from (even when read from memory), or None."""
+    return _font_files.get(id(font))
+
+def preload_font_files(fonts_dir: str = FONTS_DIR) -> int:
+    """Reads every font file in `fonts_dir` into memory. Returns the number loaded."""
+    count = 0
+    try:
+        names = sorted(os.listdir(fonts_dir))
+    except OSError as e:
+        print(f"Warning: Could not list fonts directory '{fonts_dir}': {e}")
+        return 0
+    for name in names:
+        if not name.lower().endswith(FONT_EXTENSIONS):
+            continue
+        path = os.path.abspath(os.path.join(fonts_dir, name))
+        try:
+            with open(path, "rb") as f:
+                _font_bytes[path] = f.read()
+            count += 1
+        except OSError as e:
+            print(f"Warning: Could not preload font '{path}': {e}")
+    return count
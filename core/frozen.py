@@ -0,0 +1,108 @@
+import numbers
+
+# Immutable __slots__ records for compiled configs and parsed input data.
+# Attributes are set once at construction and can't be changed afterwards,
+# so one instance can be shared by concurrent jobs and threads. Records
+# compare and hash by value (when all their values are hashable), and pickle
+# as a plain tuple of values.
+
+class Frozen:
+    """Base class for immutable records; subclasses list their fields in __slots__."""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        missing = [name for name in self.__slots__ if name not in values]
+        extra = [name for name in values if name not in self.__slots__]
+        if missing or extra:
+            raise TypeError(f"{type(self).__name__}: missing fields {missing}, unknown fields {extra}")
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def values(self) -> tuple:
+        """Field values in __slots__ order."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def as_dict(self) -> dict:
+        """Field names mapped to values (nested records are left as records)."""
+        return dict(zip(self.__slots__, self.values()))
+
+    def replace(self, **changes):
+        """Returns a copy with some fields replaced."""
+        values = self.as_dict()
+        values.update(changes)
+        return type(self)(**values)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __hash__(self):
+        return hash((type(self).__name__,) + self.values())
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        return (_rebuild, (type(self), self.values()))
+
+def _rebuild(cls, values):
+    obj = cls.__new__(cls)
+    for name, value in zip(cls.__slots__, values):
+        object.__setattr__(obj, name, value)
+    return obj
+
+# --- Field checks used when compiling JSON sections into records ---
+# Each returns the normalised value or raises ValueError describing the problem.
+
+def as_int(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, numbers.Real) or int(value) != value:
+        raise ValueError(f"expected an integer, got {value!r}")
+    return int(value)
+
+def as_number(value) -> float:
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        raise ValueError(f"expected a number, got {value!r}")
+    return value
+
+def as_text(value) -> str:
+    if not isinstance(value, str):
+        raise ValueError(f"expected a string, got {value!r}")
+    return value
+
+def as_int_pair(value) -> tuple:
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        raise ValueError(f"expected a pair of integers, got {value!r}")
+    return (as_int(value[0]), as_int(value[1]))
+
+def as_color(value) -> tuple:
+    """An RGB or RGBA colour given as a list of 0-255 integers."""
+    if (not isinstance(value, (list, tuple)) or len(value) not in (3, 4)
+            or not all(isinstance(c, int) and not isinstance(c, bool) and 0 <= c <= 255 for c in value)):
+        raise ValueError(f"expected an [r, g, b] or [r, g, b, a] colour of 0-255 integers, got {value!r}")
+    return tuple(value)
+
+def as_ink(value):
+    """A colour name (e.g. "white") or an RGB/RGBA list, as accepted by ImageDraw."""
+    if isinstance(value, str):
+        return value
+    return as_color(value)
+
+def compile_fields(section: str, data: dict, fields, errors: list) -> dict:
+    """Reads and checks (attr, key, default, check) fields from `data`.
+
+    Problems are appended to `errors` as "<section>.<key>: <problem>".
+    Returns the attribute values that passed.
+    """
+    values = {}
+    for attr, key, default, check in fields:
+        try:
+            values[attr] = check(data.get(key, default))
+        except ValueError as e:
+            errors.append(f"{section}.{key}: {e}")
+    return values
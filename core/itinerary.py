@@ -0,0 +1,271 @@
+import re
+
+from core.frozen import Frozen
+from core.validation import ValidationError
+
+# Parsed itinerary data model. itinerary_details.json is read once per job into
+# immutable records (Itinerary, Day, ScheduleItem, Hotel, Quote) with times and
+# dates already parsed into the labels the pages print. Page generators read
+# attributes instead of probing dicts, never modify their input, and each
+# section hashes by value, so it can be pickled to workers cheaply and used
+# directly as a cache key.
+
+MONTHS = ("JANUARY", "FEBRUARY", "MARCH", "APRIL", "MAY", "JUNE", "JULY",
+          "AUGUST", "SEPTEMBER", "OCTOBER", "NOVEMBER", "DECEMBER")
+
+# "14:00", "3pm", "3 PM", "03:00PM", "12.30 am"
+_CLOCK_RE = re.compile(r"^(\d{1,2})(?:[:.](\d{2}))?\s*([AP]M)?$", re.IGNORECASE)
+# Hotel check-in/out: "15th June 3pm", "18 Jun 15:00", "18 June 03:00PM", or just a time
+_STAY_RE = re.compile(r"^(?:(\d{1,2})(?:ST|ND|RD|TH)?\s+([A-Z]+)\s+)?(.+)$", re.IGNORECASE)
+
+class ScheduleItem(Frozen):
+    """One timeline entry of a day."""
+    __slots__ = ("time", "time_label", "activity", "subtitle")
+    # time: as given ("14:00"); time_label: as printed ("2:00 PM")
+
+class Day(Frozen):
+    """One itinerary day: number, title, hero image and schedule."""
+    __slots__ = ("day", "title", "hero_image", "schedule")
+    # hero_image: path as given in the JSON (relative to the inputs dir) or None
+
+class Hotel(Frozen):
+    """A hotel with its check-in/out already split into printed date and time labels."""
+    __slots__ = ("name", "stars", "short_address", "phone_number", "email_id",
+                 "check_in", "check_in_date", "check_in_time",
+                 "check_out", "check_out_date", "check_out_time", "amenities")
+
+class Quote(Frozen):
+    """Price quote and payment terms."""
+    __slots__ = ("amount", "currency", "details", "total_cost_per_person", "deposit", "balance_payment_time")
+
+class Itinerary(Frozen):
+    """A whole itinerary_details section."""
+    __slots__ = ("page1_text", "days", "inclusions", "exclusions", "hotels", "quote", "terms_and_conditions")
+    # page1_text: ((key, text), ...) cover text overrides
+
+    def page1_text_overrides(self) -> dict:
+        return dict(self.page1_text)
+
+# --- Time parsing ---
+
+def parse_clock(text: str):
+    """Parses a time of day into (hour 0-23, minute), or None."""
+    match = _CLOCK_RE.match(text.strip())
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2) or 0)
+    suffix = (match.group(3) or "").upper()
+    if suffix:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if suffix == "PM" else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return hour, minute
+
+def _twelve_hour(hour: int):
+    return hour % 12 or 12, "AM" if hour < 12 else "PM"
+
+def format_schedule_time(text: str):
+    """'HH:MM' (24-hour) -> 'H:MM AM/PM', or None if the time doesn't parse."""
+    clock = parse_clock(text)
+    if clock is None:
+        return None
+    hour, suffix = _twelve_hour(clock[0])
+    return f"{hour}:{clock[1]:02d} {suffix}"
+
+def _month_number(name: str):
+    name = name.upper()
+    if len(name) >= 3:
+        for number, month in enumerate(MONTHS, 1):
+            if month.startswith(name):
+                return number
+    return None
+
+def parse_stay_time(text) -> tuple:
+    """Splits a check-in/out string into printed (date, time) labels.
+
+    "15th June 3pm" -> ("15 JUNE", "3 PM"); a bare time gives an empty date.
+    Strings that don't parse fall back to (first word, rest), upper-cased.
+    """
+    if not isinstance(text, str):
+        return "N/A", "N/A"
+    match = _STAY_RE.match(text.strip())
+    if match:
+        day, month_name, clock_text = match.groups()
+        month = _month_number(month_name) if month_name else None
+        clock = parse_clock(clock_text)
+        if clock is not None and (day is None or (month is not None and 1 <= int(day) <= 31)):
+            date_label = f"{int(day):02d} {MONTHS[month - 1]}" if day is not None else ""
+            hour, suffix = _twelve_hour(clock[0])
+            time_label = f"{hour}:{clock[1]:02d} {suffix}" if clock[1] else f"{hour} {suffix}"
+            return date_label, time_label
+    print(f"Warning: Could not parse datetime string '{text}' with known formats.")
+    parts = text.split()
+    if len(parts) >= 2:
+        return parts[0].upper(), " ".join(parts[1:]).upper()
+    return text.upper(), ""
+
+# --- Building the model ---
+
+def _text(value, path: str, errors: list, default=None):
+    if value is None and default is not None:
+        return default
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        errors.append(f"{path}: expected a string, got {value!r}")
+        return default
+    return value
+
+def _object(value, path: str, errors: list):
+    if not isinstance(value, dict):
+        errors.append(f"{path}: expected an object, got {value!r}")
+        return None
+    return value
+
+def _list(value, path: str, errors: list):
+    if not isinstance(value, list):
+        errors.append(f"{path}: expected a list, got {value!r}")
+        return []
+    return value
+
+def _texts(value, path: str, errors: list) -> tuple:
+    return tuple(_text(item, f"{path}[{i}]", errors, "") for i, item in enumerate(_list(value, path, errors)))
+
+def parse_schedule_item(data, path: str, errors: list):
+    data = _object(data, path, errors)
+    if data is None:
+        return None
+    if "time" not in data or "activity" not in data:
+        missing = [key for key in ("time", "activity") if key not in data]
+        errors.append(f"{path}: missing {', '.join(missing)}")
+        return None
+    time = _text(data["time"], f"{path}.time", errors, "")
+    time_label = format_schedule_time(time)
+    if time_label is None:
+        errors.append(f"{path}.time: expected a time like \"14:00\" or \"2pm\", got {time!r}")
+        time_label = time
+    return ScheduleItem(
+        time=time,
+        time_label=time_label,
+        activity=_text(data["activity"], f"{path}.activity", errors, ""),
+        subtitle=_text(data.get("subtitle"), f"{path}.subtitle", errors, ""),
+    )
+
+def parse_day(data, path: str, errors: list):
+    data = _object(data, path, errors)
+    if data is None:
+        return None
+    hero_image = data.get("hero_image")
+    if hero_image is not None and not isinstance(hero_image, str):
+        errors.append(f"{path}.hero_image: expected a string, got {hero_image!r}")
+        hero_image = None
+    day = data.get("day", "?")
+    if isinstance(day, bool) or not isinstance(day, (int, str)):
+        errors.append(f"{path}.day: expected a number or string, got {day!r}")
+        day = "?"
+    schedule = _list(data.get("schedule", []), f"{path}.schedule", errors)
+    items = (parse_schedule_item(item, f"{path}.schedule[{i}]", errors) for i, item in enumerate(schedule))
+    return Day(
+        day=day,
+        title=_text(data.get("title"), f"{path}.title", errors, "Default Title"),
+        hero_image=hero_image or None,
+        schedule=tuple(item for item in items if item is not None),
+    )
+
+def parse_hotel(data, path: str, errors: list):
+    data = _object(data, path, errors)
+    if data is None:
+        return None
+    try:
+        stars = int(data.get("stars", 0))
+    except (ValueError, TypeError):
+        stars = 0
+    check_in = data.get("check_in_time", "N/A")
+    check_out = data.get("check_out_time", "N/A")
+    check_in_date, check_in_time = parse_stay_time(check_in)
+    check_out_date, check_out_time = parse_stay_time(check_out)
+    return Hotel(
+        name=_text(data.get("name"), f"{path}.name", errors, "Hotel Name N/A"),
+        stars=stars,
+        short_address=_text(data.get("short_address"), f"{path}.short_address", errors, "Address N/A"),
+        phone_number=_text(data.get("phone_number"), f"{path}.phone_number", errors, "Phone N/A"),
+        email_id=_text(data.get("email_id"), f"{path}.email_id", errors, "N/A"),
+        check_in=check_in if isinstance(check_in, str) else None,
+        check_in_date=check_in_date,
+        check_in_time=check_in_time,
+        check_out=check_out if isinstance(check_out, str) else None,
+        check_out_date=check_out_date,
+        check_out_time=check_out_time,
+        amenities=_texts(data.get("amenities", []), f"{path}.amenities", errors),
+    )
+
+def parse_quote(data, path: str, errors: list):
+    data = _object(data, path, errors)
+    if data is None:
+        return None
+    terms = data.get("payment_terms") or {}
+    terms = _object(terms, f"{path}.payment_terms", errors) or {}
+    return Quote(
+        amount=_text(data.get("amount"), f"{path}.amount", errors, "N/A"),
+        currency=_text(data.get("currency"), f"{path}.currency", errors, ""),
+        details=_text(data.get("details"), f"{path}.details", errors, ""),
+        total_cost_per_person=_text(data.get("total_cost_per_person"), f"{path}.total_cost_per_person", errors, "N/A"),
+        deposit=_text(terms.get("deposit"), f"{path}.payment_terms.deposit", errors, "N/A"),
+        balance_payment_time=_text(terms.get("balance_payment_time"), f"{path}.payment_terms.balance_payment_time", errors, "N/A"),
+    )
+
+def parse_itinerary(details: dict, path: str = "itinerary_details") -> Itinerary:
+    """Builds an Itinerary from an itinerary_details object.
+
+    Raises ValidationError (a ValueError) listing every malformed entry with its JSON path.
+    """
+    errors = []
+    details = _object(details, path, errors)
+    if details is None:
+        raise ValidationError("Invalid itinerary details", errors)
+
+    page1_text = _object(details.get("page1_text") or {}, f"{path}.page1_text", errors) or {}
+    page1_text = tuple(sorted((key, _text(value, f"{path}.page1_text.{key}", errors, "")) for key, value in page1_text.items()))
+
+    days = _list(details.get("days", []), f"{path}.days", errors)
+    days = tuple(parse_day(day, f"{path}.days[{i}]", errors) for i, day in enumerate(days))
+
+    hotels = details.get("hotel_details", [])
+    if isinstance(hotels, dict): # A single hotel may be given without the list
+        hotels = [hotels]
+    hotels = tuple(parse_hotel(hotel, f"{path}.hotel_details[{i}]", errors)
+                   for i, hotel in enumerate(_list(hotels, f"{path}.hotel_details", errors)))
+
+    itinerary = Itinerary(
+        page1_text=page1_text,
+        days=tuple(day for day in days if day is not None),
+        inclusions=_texts(details.get("inclusions", []), f"{path}.inclusions", errors),
+        exclusions=_texts(details.get("exclusions", []), f"{path}.exclusions", errors),
+        hotels=tuple(hotel for hotel in hotels if hotel is not None),
+        quote=parse_quote(details.get("quote", {}), f"{path}.quote", errors),
+        terms_and_conditions=_texts(details.get("terms_and_conditions", []), f"{path}.terms_and_conditions", errors),
+    )
+    if errors:
+        raise ValidationError("Invalid itinerary details", errors)
+    return itinerary
+
+def _coerce(records, cls, parse, path: str) -> tuple:
+    # Records pass through; raw dicts (e.g. from direct generator calls) are parsed
+    errors = []
+    result = tuple(record if isinstance(record, cls) else parse(record, f"{path}[{i}]", errors)
+                   for i, record in enumerate(records))
+    if errors:
+        raise ValidationError(f"Invalid {path}", errors)
+    return result
+
+def to_days(days) -> tuple:
+    """Days as Day records, parsing any raw day dicts."""
+    return _coerce(days, Day, parse_day, "days")
+
+def to_hotels(hotels) -> tuple:
+    """Hotels as Hotel records, parsing raw hotel dicts; a single hotel may be passed on its own."""
+    if isinstance(hotels, (Hotel, dict)):
+        hotels = [hotels]
+    return _coerce(hotels, Hotel, parse_hotel, "hotel_details")
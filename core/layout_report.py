@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+# Layout check results. The layout functions take an optional LayoutReport and
+# record, for each region they fill (a day panel's schedule, a hotel card, an
+# inclusions column, the cover text), how much space it has and how much its
+# content needs, with any overflow spelled out. The page check_* functions run
+# only that measuring side (no image decoding, no painting), so a whole
+# itinerary is checked in milliseconds.
+
+Region = namedtuple("Region", "page name axis capacity used overflows")
+Region.__doc__ = "Space of one layout region along `axis` (\"width\" or \"height\", in px) and its overflows."
+
+class LayoutReport:
+    """Regions and overflows found while laying out one itinerary."""
+
+    def __init__(self):
+        self.page = None   # Page the layout functions are currently reporting for
+        self.regions = []
+        self.skipped = []  # (page, reason) for pages that couldn't be checked
+
+    def add(self, name: str, axis: str, capacity, used, overflows=()) -> Region:
+        region = Region(self.page, name, axis, int(round(capacity)), int(round(used)), tuple(o for o in overflows if o))
+        self.regions.append(region)
+        return region
+
+    def skip(self, reason: str):
+        self.skipped.append((self.page, reason))
+
+    @property
+    def ok(self) -> bool:
+        return not any(region.overflows for region in self.regions)
+
+    def overflows(self) -> list:
+        return [f"{region.page} / {region.name}: {overflow}" for region in self.regions for overflow in region.overflows]
+
+    def as_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "regions": [{**region._asdict(), "overflows": list(region.overflows), "remaining": region.capacity - region.used}
+                        for region in self.regions],
+            "skipped": [{"page": page, "reason": reason} for page, reason in self.skipped],
+        }
+
+    def print(self, name: str = "itinerary"):
+        for region in self.regions:
+            status = "OVERFLOW" if region.overflows else "ok"
+            print(f"  {region.page} / {region.name}: {region.used}/{region.capacity} px {region.axis} "
+                  f"({region.capacity - region.used:+d} px) {status}")
+            for overflow in region.overflows:
+                print(f"      - {overflow}")
+        for page, reason in self.skipped:
+            print(f"  {page}: not checked ({reason})")
+        overflows = self.overflows()
+        if overflows:
+            print(f"Warning: {name} has {len(overflows)} layout overflow(s).")
+        else:
+            print(f"Layout of {name} fits.")
@@ -0,0 +1,343 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics registry: counters, gauges and latency histograms with Prometheus
+# style labels (pages_rendered_total{kind="hotels",source="cache"}). Every
+# process records into its own registry. Worker processes send back what
+# changed during a job (since(), like the page cache stats) and the parent
+# merges it, so the parent's registry covers the whole run. Counts kept
+# elsewhere (text sprite cache, page cache) are mirrored in by collectors
+# just before each read. Exposed as Prometheus text (GET /metrics on the
+# service, --metrics-port for CLI/batch runs) and dumped as JSON at the end of
+# CLI/batch runs.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0) # Seconds
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name: str, help_text: str, labels: tuple):
+        self._registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {} # label values tuple -> value
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+class Counter(_Metric):
+    """A count that only goes up."""
+    kind = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._synced = {} # label values -> last total passed to sync() in this process
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def sync(self, total: float, **labels):
+        """Mirrors a cumulative count kept elsewhere in this process: adds what it grew by since the last sync."""
+        key = self._key(labels)
+        with self._registry.lock:
+            grown = total - self._synced.get(key, 0)
+            self._synced[key] = total
+            if grown > 0:
+                self._values[key] = self._values.get(key, 0) + grown
+
+    def value(self, **labels) -> float:
+        """The current count for these labels, after running the collectors (0 if never counted)."""
+        key = self._key(labels)
+        self._registry.collect()
+        with self._registry.lock:
+            return self._values.get(key, 0)
+
+class Gauge(_Metric):
+    """A value that goes up and down (queue depth, utilization)."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    """Observations (latencies in seconds) counted into fixed buckets, with their sum and count."""
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._registry.lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["buckets"][index] += 1 # Per bucket; exposition makes them cumulative
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+class Registry:
+    """A set of named metrics; see the module comment."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get(self, cls, name: str, help_text: str, labels, **kwargs):
+        with self.lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help_text, tuple(labels), **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels=()) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def add_collector(self, fn):
+        """Registers fn(), called before every read to update metrics from counts kept elsewhere."""
+        with self.lock:
+            self._collectors.append(fn)
+
+    def collect(self):
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception as e:
+                print(f"Warning: Metrics collector failed: {e}")
+
+    # --- Snapshots (plain data: picklable, JSON-able) ---
+
+    def snapshot(self) -> dict:
+        """Every metric with its samples: {name: {type, help, labels, [buckets,] samples: [[label values, value]]}}."""
+        self.collect()
+        with self.lock:
+            result = {}
+            for name, metric in self._metrics.items():
+                entry = {"type": metric.kind, "help": metric.help, "labels": list(metric.labels)}
+                if metric.kind == "histogram":
+                    entry["buckets"] = list(metric.buckets)
+                    entry["samples"] = [[list(key), {"buckets": list(state["buckets"]), "sum": state["sum"],
+                                                     "count": state["count"]}]
+                                        for key, state in metric._values.items()]
+                else:
+                    entry["samples"] = [[list(key), value] for key, value in metric._values.items()]
+                result[name] = entry
+            return result
+
+    def since(self, before: dict) -> dict:
+        """What changed since an earlier snapshot(): counter and histogram increases, gauges that moved."""
+        delta = {}
+        for name, entry in self.snapshot().items():
+            old = {tuple(key): value for key, value in before.get(name, {}).get("samples", [])}
+            samples = []
+            for key, value in entry["samples"]:
+                previous = old.get(tuple(key))
+                if previous is None or (entry["type"] == "gauge" and value != previous):
+                    samples.append([key, value])
+                elif entry["type"] == "gauge":
+                    continue
+                elif entry["type"] == "counter":
+                    if value != previous:
+                        samples.append([key, value - previous])
+                elif value["count"] != previous["count"]:
+                    samples.append([key, {"buckets": [a - b for a, b in zip(value["buckets"], previous["buckets"])],
+                                          "sum": value["sum"] - previous["sum"],
+                                          "count": value["count"] - previous["count"]}])
+            if samples:
+                delta[name] = {**entry, "samples": samples}
+        return delta
+
+    def merge(self, delta: dict):
+        """Adds a since() delta from another process (gauges take its values)."""
+        for name, entry in delta.items():
+            if entry["type"] == "counter":
+                metric = self.counter(name, entry["help"], entry["labels"])
+            elif entry["type"] == "gauge":
+                metric = self.gauge(name, entry["help"], entry["labels"])
+            else:
+                metric = self.histogram(name, entry["help"], entry["labels"], entry["buckets"])
+            with self.lock:
+                for key, value in entry["samples"]:
+                    key = tuple(key)
+                    if metric.kind == "gauge":
+                        metric._values[key] = value
+                    elif metric.kind == "counter":
+                        metric._values[key] = metric._values.get(key, 0) + value
+                    else:
+                        state = metric._values.setdefault(key, {"buckets": [0] * (len(metric.buckets) + 1),
+                                                                "sum": 0.0, "count": 0})
+                        state["buckets"] = [a + b for a, b in zip(state["buckets"], value["buckets"])]
+                        state["sum"] += value["sum"]
+                        state["count"] += value["count"]
+
+    # --- Exposition ---
+
+    def prometheus_text(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, entry in sorted(self.snapshot().items()):
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            for key, value in sorted(entry["samples"]):
+                labels = list(zip(entry["labels"], key))
+                if entry["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(entry["buckets"]) + [math.inf], value["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self) -> dict:
+        """JSON form: counters and gauges by label set, histograms with count, sum, mean and cumulative buckets."""
+        result = {}
+        for name, entry in sorted(self.snapshot().items()):
+            samples = []
+            for key, value in sorted(entry["samples"]):
+                sample = {"labels": dict(zip(entry["labels"], key))}
+                if entry["type"] == "histogram":
+                    cumulative = 0
+                    buckets = {}
+                    for bound, count in zip(list(entry["buckets"]) + [math.inf], value["buckets"]):
+                        cumulative += count
+                        buckets[_number(bound)] = cumulative
+                    sample.update(count=value["count"], sum=round(value["sum"], 6),
+                                  mean=round(value["sum"] / value["count"], 6) if value["count"] else 0.0, buckets=buckets)
+                else:
+                    sample["value"] = value
+                samples.append(sample)
+            result[name] = {"type": entry["type"], "help": entry["help"], "samples": samples}
+        return result
+
+    def dump_json(self, path: str):
+        """Writes as_dict() to path."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+REGISTRY = Registry()
+
+# Module-level shortcuts on the process registry
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+add_collector = REGISTRY.add_collector
+snapshot = REGISTRY.snapshot
+since = REGISTRY.since
+merge = REGISTRY.merge
+prometheus_text = REGISTRY.prometheus_text
+dump_json = REGISTRY.dump_json
+
+# A forked worker must not inherit the lock held by one of the parent's threads
+os.register_at_fork(after_in_child=lambda: setattr(REGISTRY, "lock", threading.RLock()))
+
+# Metrics recorded by several modules
+STAGE_SECONDS = histogram("stage_seconds", "Latency of one processing stage (JPEG encode, PDF assembly, pipeline stage, ...).",
+                          ("stage",))
+BYTES_WRITTEN = counter("bytes_written_total", "Bytes written, by output kind (page images, PDFs).", ("kind",))
+CACHE_LOOKUPS = counter("cache_lookups_total", "Font, icon, text sprite and page cache lookups.", ("cache", "result"))
+QUEUE_DEPTH = gauge("queue_depth", "Items waiting in a queue (pipeline stage queues, jobs not yet finished).", ("queue",))
+WORKERS = gauge("workers", "Worker processes in a pool.", ("pool",))
+WORKER_BUSY = counter("worker_busy_seconds_total", "Seconds the workers of a pool spent on jobs.", ("pool",))
+WORKER_UTILIZATION = gauge("worker_utilization", "Share of a pool's worker time spent on jobs since it started (0-1).",
+                           ("pool",))
+
+class PoolUsage:
+    """Feeds the worker metrics of one pool: call job_done() with each job's time in the worker."""
+
+    def __init__(self, pool: str, size: int):
+        self.pool = pool
+        self.size = size
+        self.started = time.perf_counter()
+        self.busy = 0.0
+        WORKERS.set(size, pool=pool)
+        add_collector(self.update)
+
+    def job_done(self, seconds: float):
+        WORKER_BUSY.inc(seconds, pool=self.pool)
+        with REGISTRY.lock:
+            self.busy += seconds
+        self.update()
+
+    def update(self):
+        available = self.size * (time.perf_counter() - self.started)
+        WORKER_UTILIZATION.set(round(min(1.0, self.busy / available), 4) if available > 0 else 0.0, pool=self.pool)
+
+def serve_http(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY):
+    """Serves GET /metrics (Prometheus text) on a background thread. Returns the server (call shutdown() to stop)."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes would flood the run's output
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
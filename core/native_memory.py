@@ -0,0 +1,36 @@
+import ctypes
+import ctypes.util
+
+# Handing freed native (C heap) memory back to the OS. Pillow allocates page
+# images in blocks of up to 16 MiB with malloc. glibc maps the first such
+# blocks, but every unmapped block raises its mmap threshold, so later ones
+# come from the malloc arena of the thread that allocates them: the prefetch
+# threads (decoding and fitting backgrounds and heroes) and the background
+# save threads each get an arena of their own. A freed block stays in its
+# arena while anything above it is in use, and as page images of different
+# sizes come and go the arenas keep more and more free memory resident: the
+# process grows with every itinerary although nothing is alive. trim() is
+# called once an itinerary's pages are done and returns the free pages of
+# every arena (malloc_trim). Keeping every block mapped instead (a fixed
+# M_MMAP_THRESHOLD) also bounds RSS, but costs a page fault per page of every
+# image and made renders about 25% slower.
+
+_malloc_trim = None
+
+def _load():
+    global _malloc_trim
+    if _malloc_trim is None:
+        try:
+            _malloc_trim = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6").malloc_trim
+            _malloc_trim.argtypes = [ctypes.c_size_t]
+        except (OSError, AttributeError): # Not glibc (macOS, Windows, musl)
+            _malloc_trim = False
+    return _malloc_trim
+
+def trim() -> bool:
+    """Returns the free memory of every malloc arena to the OS. Returns False where that isn't possible."""
+    malloc_trim = _load()
+    if not malloc_trim:
+        return False
+    malloc_trim(0)
+    return True
@@ -0,0 +1,179 @@
+import functools
+import hashlib
+import importlib
+import io
+import os
+import threading
+import uuid
+from PIL import Image
+
+from core import determinism, metrics
+
+# Shared page cache. Pages such as the hotel and inclusions/exclusions pages
+# are often identical across clients (same hotel, standard lists). Each
+# cacheable page gets a key: a canonical hash of exactly the inputs it is drawn
+# from (its data records, the files it reads, the code that draws it). Its
+# encoded JPEG is stored under .cache/pages/<key>.jpg. The cache lives on disk,
+# so every batch/service worker process shares it. Entries are evicted least
+# recently used first (hits bump the file's mtime) once the directory exceeds
+# its byte bound. Off by default; batch and service runs turn it on.
+
+PAGE_CACHE_DIR = os.path.join(".cache", "pages")
+PAGE_CACHE_BYTES = 512 * 1024 * 1024
+
+_enabled = False
+_cache_dir = PAGE_CACHE_DIR
+_max_bytes = PAGE_CACHE_BYTES
+_lock = threading.Lock()
+_total_bytes = None # Size of the cache directory as last seen by this process
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+def set_enabled(enabled: bool = True, cache_dir: str = PAGE_CACHE_DIR, max_bytes: int = PAGE_CACHE_BYTES):
+    """Turns the page cache on (or off) for this process and the workers it forks."""
+    global _enabled, _cache_dir, _max_bytes, _total_bytes
+    _enabled = bool(enabled)
+    _cache_dir = cache_dir
+    _max_bytes = max_bytes
+    _total_bytes = None
+
+def is_enabled() -> bool:
+    return _enabled
+
+# --- Keys ---
+
+def file_input(path: str) -> list:
+    """A file as a key input: its path, size and modification time (size None if missing)."""
+    abs_path = os.path.abspath(path)
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return [abs_path, None]
+    return [abs_path, st.st_size, st.st_mtime_ns]
+
+@functools.lru_cache(maxsize=None)
+def code_input(*module_names) -> str:
+    """Hash of the given modules' source, so cached pages are redrawn after code changes."""
+    digest = hashlib.sha256()
+    for name in module_names:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def page_key(kind: str, **inputs) -> str:
+    """Cache key of a `kind` page drawn from `inputs` (records, file_input()s, plain values)."""
+    # Deterministic mode pins the JPEG encoder settings, so it changes the bytes
+    return f"{kind}-{determinism.canonical_hash(kind, inputs, determinism.is_deterministic())[:40]}"
+
+# --- Storage ---
+
+def _entry_path(key: str) -> str:
+    return os.path.join(_cache_dir, f"{key}.jpg")
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path) # Readers in other processes never see a partial file
+
+def _count(name: str, amount: int = 1):
+    with _lock:
+        _stats[name] += amount
+
+def fetch_page(key: str, output_path: str):
+    """On a hit, writes the cached page to output_path and returns it as a (lazily decoded) image.
+
+    Returns None on a miss.
+    """
+    entry = _entry_path(key)
+    try:
+        with open(entry, "rb") as f:
+            data = f.read()
+        os.utime(entry) # Most recently used
+    except OSError:
+        _count("misses")
+        return None
+    _count("hits")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    _write_atomic(output_path, data)
+    return Image.open(io.BytesIO(data))
+
+def store_file(key: str, path: str):
+    """Adds the page saved at `path` under `key`, evicting old entries if over the size bound."""
+    global _total_bytes
+    with open(path, "rb") as f:
+        data = f.read()
+    os.makedirs(_cache_dir, exist_ok=True)
+    _write_atomic(_entry_path(key), data)
+    _count("stores")
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = _scan()[1]
+        else:
+            _total_bytes += len(data)
+        if _total_bytes > _max_bytes:
+            _evict()
+
+def _scan():
+    # [(mtime, size, path)] of the cache entries, and their total size
+    entries = []
+    for name in os.listdir(_cache_dir):
+        if not name.endswith(".jpg"):
+            continue
+        path = os.path.join(_cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue # Evicted by another process
+        entries.append((st.st_mtime_ns, st.st_size, path))
+    return entries, sum(size for _, size, _ in entries)
+
+def _evict():
+    # Other processes add entries too, so the directory is rescanned first
+    global _total_bytes
+    entries, total = _scan()
+    for _, size, path in sorted(entries):
+        if total <= _max_bytes:
+            break
+        try:
+            os.remove(path)
+            _stats["evictions"] += 1
+        except OSError:
+            pass
+        total -= size
+    _total_bytes = total
+
+def stats() -> dict:
+    """Hit/miss/store/eviction counts of this process, with the hit rate."""
+    with _lock:
+        counts = dict(_stats)
+    lookups = counts["hits"] + counts["misses"]
+    counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+    return counts
+
+def _collect_metrics():
+    with _lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    metrics.CACHE_LOOKUPS.sync(hits, cache="pages", result="hit")
+    metrics.CACHE_LOOKUPS.sync(misses, cache="pages", result="miss")
+
+metrics.add_collector(_collect_metrics)
+
+def stats_since(before: dict) -> dict:
+    """Counts since an earlier stats() snapshot (e.g. for one job), with that period's hit rate."""
+    counts = {name: value - before.get(name, 0) for name, value in stats().items() if name != "hit_rate"}
+    lookups = counts["hits"] + counts["misses"]
+    counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+    return counts
+
+def add_stats(total: dict, counts: dict) -> dict:
+    """Sums per-job counts (e.g. from different worker processes) into `total`, updating its hit rate."""
+    for name, value in counts.items():
+        if name != "hit_rate":
+            total[name] = total.get(name, 0) + value
+    lookups = total.get("hits", 0) + total.get("misses", 0)
+    total["hit_rate"] = total.get("hits", 0) / lookups if lookups else 0.0
+    return total
+
+def format_stats(counts: dict) -> str:
+    return (f"{counts.get('hits', 0)} hits, {counts.get('misses', 0)} misses "
+            f"(hit rate {counts.get('hit_rate', 0.0):.0%}), {counts.get('evictions', 0)} evicted")
@@ -0,0 +1,205 @@
+import hashlib
+import io
+import os
+import time
+from PIL import Image
+
+from core import determinism
+
+# Book PDFs: several itineraries in one file. Pages are the rendered page
+# JPEGs, embedded as they are (DCTDecode, no re-encoding). Each distinct JPEG
+# stream is written once as an image XObject that every page showing it
+# references, so identical pages (e.g. hotel or inclusions pages shared by
+# several tour options) cost their bytes once. Only whole identical pages are
+# shared: a hero, logo or background repeated on otherwise different pages is
+# part of each page's own JPEG and stored with every one of them. Objects are streamed to the file as pages are added; only the small
+# page/outline tables are kept until close(). The output can be any writable
+# binary stream (offsets are counted, never sought), so stream_pages() can hand
+# out a PDF piece by piece while its later pages are still being rendered.
+
+BOOK_RESOLUTION = 100.0 # Pixels per inch, as in the single-itinerary PDFs
+
+_COLOR_SPACES = {"RGB": "/DeviceRGB", "L": "/DeviceGray", "CMYK": "/DeviceCMYK"}
+
+def _pdf_text(text: str) -> bytes:
+    # PDF text string as UTF-16BE hex, so any title is safe
+    return b"<FEFF" + text.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+def _pdf_date(t) -> bytes:
+    return time.strftime("(D:%Y%m%d%H%M%SZ)", t).encode("ascii")
+
+def pdf_jpeg(path: str) -> bytes:
+    """A page JPEG re-encoded as Pillow's PDF writer embeds it (its default quality), as in save_pdf PDFs."""
+    with Image.open(path) as img:
+        rgb = img.convert("RGB")
+    buffer = io.BytesIO()
+    rgb.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+class PdfBook:
+    """Writes a PDF of JPEG pages with identical pages stored once.
+
+    `output` is a file path or a writable binary stream (left open). Call
+    add_section() to start a bookmarked section, add_page() for every page,
+    then close(). Usable as a context manager.
+    """
+
+    def __init__(self, output, title: str = "Itineraries", resolution: float = BOOK_RESOLUTION):
+        owned = isinstance(output, (str, os.PathLike))
+        self.path = output if owned else None
+        self.title = title
+        self.resolution = resolution
+        self._out = open(output, "wb") if owned else output
+        self._owned = owned
+        self._closed = False
+        self._position = 0
+        self._offsets = [None, None, None] # Index = object number; 1 catalog and 2 page tree are written last
+        self._pages = []       # Page object numbers
+        self._sections = []    # (title, index of first page)
+        self._images = {}      # sha256 of the JPEG -> (image object, content object, page size)
+        self.stats = {"pages": 0, "images": 0, "image_bytes": 0, "deduplicated_bytes": 0}
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._owned:
+            self._out.close()
+
+    def _write(self, data: bytes):
+        self._out.write(data)
+        self._position += len(data)
+
+    def _reserve(self) -> int:
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _object(self, number: int, body: bytes, stream: bytes = None):
+        self._offsets[number] = self._position
+        self._write(b"%d 0 obj\n" % number + body)
+        if stream is not None:
+            self._write(b"\nstream\n" + stream + b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def add_section(self, title: str):
+        """Starts a bookmarked section (e.g. one itinerary) at the next page."""
+        self._sections.append((title, len(self._pages)))
+
+    def add_page(self, jpeg) -> bool:
+        """Adds a page showing a JPEG (file path or bytes). Returns True if an identical page was already in the book."""
+        if isinstance(jpeg, (bytes, bytearray)):
+            data = bytes(jpeg)
+        else:
+            with open(jpeg, "rb") as f:
+                data = f.read()
+        digest = hashlib.sha256(data).digest()
+        entry = self._images.get(digest)
+        shared = entry is not None
+        if shared:
+            self.stats["deduplicated_bytes"] += len(data)
+        else:
+            with Image.open(io.BytesIO(data)) as img: # Header only; nothing is decoded
+                if img.format != "JPEG" or img.mode not in _COLOR_SPACES:
+                    raise ValueError(f"Book pages must be RGB, greyscale or CMYK JPEGs, got {img.format} {img.mode}")
+                width, height = img.size
+                color_space = _COLOR_SPACES[img.mode]
+                # Adobe CMYK JPEGs store inverted values
+                decode = b" /Decode [1 0 1 0 1 0 1 0]" if img.mode == "CMYK" and "adobe" in img.info else b""
+            image_obj = self._reserve()
+            self._object(image_obj, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                         b"/BitsPerComponent 8 /Filter /DCTDecode%s /Length %d >>"
+                         % (width, height, color_space.encode("ascii"), decode, len(data)), data)
+            page_w, page_h = width * 72.0 / self.resolution, height * 72.0 / self.resolution
+            # Pages showing the same image share one content stream too
+            content = b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (page_w, page_h)
+            content_obj = self._reserve()
+            self._object(content_obj, b"<< /Length %d >>" % len(content), content)
+            entry = self._images[digest] = (image_obj, content_obj, (page_w, page_h))
+            self.stats["images"] += 1
+            self.stats["image_bytes"] += len(data)
+
+        image_obj, content_obj, (page_w, page_h) = entry
+        page_obj = self._reserve()
+        self._object(page_obj, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] "
+                     b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+                     % (page_w, page_h, image_obj, content_obj))
+        self._pages.append(page_obj)
+        self.stats["pages"] += 1
+        return shared
+
+    def _write_outlines(self) -> int:
+        sections = [(title, first) for title, first in self._sections if first < len(self._pages)]
+        if not sections:
+            return None
+        root = self._reserve()
+        items = [self._reserve() for _ in sections]
+        for i, ((title, first), item) in enumerate(zip(sections, items)):
+            links = b" /Parent %d 0 R" % root
+            if i > 0:
+                links += b" /Prev %d 0 R" % items[i - 1]
+            if i < len(items) - 1:
+                links += b" /Next %d 0 R" % items[i + 1]
+            self._object(item, b"<< /Title " + _pdf_text(title) + links
+                         + b" /Dest [%d 0 R /Fit] >>" % self._pages[first])
+        self._object(root, b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>"
+                     % (items[0], items[-1], len(items)))
+        return root
+
+    def close(self) -> dict:
+        """Writes the page tree, bookmarks, metadata and cross-reference table. Returns the stats."""
+        if self._closed:
+            return self.stats
+        self._closed = True
+        kids = b" ".join(b"%d 0 R" % page for page in self._pages)
+        self._object(2, b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(self._pages))
+        outlines = self._write_outlines()
+        catalog = b"<< /Type /Catalog /Pages 2 0 R"
+        if outlines is not None:
+            catalog += b" /Outlines %d 0 R /PageMode /UseOutlines" % outlines
+        self._object(1, catalog + b" >>")
+        created = determinism.FIXED_PDF_DATE if determinism.is_deterministic() else time.gmtime()
+        info = self._reserve()
+        self._object(info, b"<< /Title " + _pdf_text(self.title) + b" /CreationDate " + _pdf_date(created)
+                     + b" /ModDate " + _pdf_date(created) + b" >>")
+
+        xref_offset = self._position
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self._offsets))
+        for offset in self._offsets[1:]:
+            self._write(b"%010d 00000 n \n" % offset)
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (len(self._offsets), info, xref_offset))
+        if self._owned:
+            self._out.close()
+        return self.stats
+
+class _Chunks:
+    # Write target that collects bytes until they are taken
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data: bytes):
+        self._parts.append(bytes(data))
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def stream_pages(jpegs, title: str = "Itineraries", resolution: float = BOOK_RESOLUTION):
+    """Yields a PDF of `jpegs` (paths or bytes) piece by piece.
+
+    The header comes first, then each page as soon as `jpegs` produces it
+    (it may be a generator still rendering the later pages), and the page
+    tree and cross-reference table last.
+    """
+    chunks = _Chunks()
+    book = PdfBook(chunks, title, resolution)
+    yield chunks.take()
+    for jpeg in jpegs:
+        book.add_page(jpeg)
+        yield chunks.take()
+    book.close()
+    yield chunks.take()
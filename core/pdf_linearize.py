@@ -0,0 +1,330 @@
+import os
+import uuid
+from PIL import PdfParser
+
+# Linearized ("fast web view") PDFs. The page writers (Pillow's PDF plugin,
+# the book writer) put the page tree and cross-reference table at the end of
+# the file, so a viewer opening a multi-megabyte raster PDF over the network
+# shows nothing until it has all of it. linearize_pdf() rewrites a finished
+# PDF in the linearized layout (PDF 1.4, Annex F): a linearization dictionary
+# and the first page's cross-reference table up front, then the catalog, the
+# hint stream (where every page and shared object starts), the cover page's
+# objects, the other pages in order, objects shared between pages, and the
+# main cross-reference table last. Objects are copied as they are; image
+# streams are not re-encoded. Off by default; --linearize turns it on.
+
+_enabled = False
+
+def set_enabled(enabled: bool = True):
+    """Turns linearizing of finished PDFs on (or off) for this process and the workers it forks."""
+    global _enabled
+    _enabled = bool(enabled)
+
+def is_enabled() -> bool:
+    return _enabled
+
+# --- Serializing copied objects ---
+
+def _refs(value):
+    # Indirect references in a value (streams: in their dictionary), in order
+    if isinstance(value, PdfParser.IndirectReference):
+        yield value
+    elif isinstance(value, PdfParser.PdfStream):
+        yield from _refs(value.dictionary)
+    elif isinstance(value, (dict, PdfParser.PdfDict)):
+        for key, item in value.items():
+            yield from _refs(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _refs(item)
+
+def _serialize(value, numbers: dict) -> bytes:
+    if isinstance(value, PdfParser.IndirectReference):
+        return b"%d 0 R" % numbers[value]
+    if isinstance(value, (dict, PdfParser.PdfDict)):
+        return b"<<" + b"".join(bytes(PdfParser.PdfName(key)) + b" " + _serialize(item, numbers) + b"\n"
+                                for key, item in value.items() if item is not None) + b">>"
+    if isinstance(value, list):
+        return b"[" + b" ".join(_serialize(item, numbers) for item in value) + b"]"
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(PdfParser.PdfBinary(value)) # Hex: safe for any string bytes
+    if isinstance(value, float):
+        return (b"%.6f" % value).rstrip(b"0").rstrip(b".")
+    return PdfParser.pdf_repr(value)
+
+def _object_bytes(number: int, value, numbers: dict) -> bytes:
+    if isinstance(value, PdfParser.PdfStream):
+        dictionary = {key: item for key, item in value.dictionary.items() if key != b"Length"}
+        dictionary[b"Length"] = len(value.buf)
+        return (b"%d 0 obj\n" % number + _serialize(dictionary, numbers) + b"\nstream\n"
+                + bytes(value.buf) + b"\nendstream\nendobj\n")
+    return b"%d 0 obj\n" % number + _serialize(value, numbers) + b"\nendobj\n"
+
+# --- Hint tables ---
+
+class _BitWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self._bits = 0
+        self._count = 0
+
+    def write(self, value: int, nbits: int):
+        for shift in range(nbits - 1, -1, -1):
+            self._bits = (self._bits << 1) | ((value >> shift) & 1)
+            self._count += 1
+            if self._count == 8:
+                self.data.append(self._bits)
+                self._bits = self._count = 0
+
+    def flush(self):
+        # Each hint table item starts on a byte boundary
+        if self._count:
+            self.write(0, 8 - self._count)
+
+def _hint_stream(pages: list, first_page_offset: int, shared: list, shared_start: tuple, outlines: tuple = None):
+    """The primary hint stream data and the offsets of its shared object and outline tables.
+
+    `pages` holds (object count, byte length, shared object ids) per page;
+    `shared` the byte length of each shared object entry (first page objects
+    first); `shared_start` the (object number, offset) of the shared objects
+    section; `outlines` the (first object number, offset, object count,
+    length) of the outline objects in the first page section, if any.
+    """
+    w = _BitWriter()
+    counts = [count for count, _, _ in pages]
+    lengths = [length for _, length, _ in pages]
+    least_count, least_length = min(counts), min(lengths)
+    count_bits = (max(counts) - least_count).bit_length()
+    length_bits = (max(lengths) - least_length).bit_length()
+    nshared_bits = max(len(ids) for _, _, ids in pages).bit_length()
+    id_bits = max(len(shared) - 1, 0).bit_length()
+    # Page offset hint table header. Content stream offsets are given as 0 and
+    # content lengths as the page lengths, as Acrobat writes them
+    for value, nbits in ((least_count, 32), (first_page_offset, 32), (count_bits, 16), (least_length, 32),
+                         (length_bits, 16), (0, 32), (0, 16), (least_length, 32), (length_bits, 16),
+                         (nshared_bits, 16), (id_bits, 16), (0, 16), (1, 16)):
+        w.write(value, nbits)
+    for count in counts:
+        w.write(count - least_count, count_bits)
+    w.flush()
+    for length in lengths:
+        w.write(length - least_length, length_bits)
+    w.flush()
+    for _, _, ids in pages:
+        w.write(len(ids), nshared_bits)
+    w.flush()
+    for _, _, ids in pages:
+        for shared_id in ids:
+            w.write(shared_id, id_bits)
+    w.flush()
+    w.flush() # No numerators, content stream offsets...
+    for length in lengths:
+        w.write(length - least_length, length_bits) # ...content stream lengths
+    w.flush()
+
+    shared_offset = len(w.data)
+    least_shared = min(shared)
+    shared_bits = (max(shared) - least_shared).bit_length()
+    nfirst = pages[0][0]
+    # Shared object hint table: one object per group
+    for value, nbits in ((shared_start[0], 32), (shared_start[1], 32), (nfirst, 32), (len(shared), 32),
+                         (0, 16), (least_shared, 32), (shared_bits, 16)):
+        w.write(value, nbits)
+    for length in shared:
+        w.write(length - least_shared, shared_bits)
+    w.flush()
+    for _ in shared:
+        w.write(0, 1) # No MD5 signatures
+    w.flush()
+
+    outline_offset = None
+    if outlines:
+        outline_offset = len(w.data)
+        for value in outlines: # Generic hint table
+            w.write(value, 32)
+    return bytes(w.data), shared_offset, outline_offset
+
+# --- Layout ---
+
+def _collect(pdf, start, skip, objects: dict) -> list:
+    # Objects reachable from `start` (not through /Parent or into `skip`), in order
+    order = []
+    stack = [start]
+    seen = set()
+    while stack:
+        ref = stack.pop()
+        if ref in seen or ref in skip:
+            continue
+        seen.add(ref)
+        value = objects.get(ref)
+        if value is None:
+            value = objects[ref] = pdf.read_indirect(ref)
+        order.append(ref)
+        body = value.dictionary if isinstance(value, PdfParser.PdfStream) else value
+        if isinstance(body, (dict, PdfParser.PdfDict)):
+            children = [item for key, item in body.items() if key != b"Parent"]
+        else:
+            children = [body]
+        stack.extend(reversed([child for item in children for child in _refs(item)]))
+    return order
+
+def linearize_pdf(path: str, output_path: str = None) -> dict:
+    """Rewrites the PDF at `path` linearized, into output_path (default: in place).
+
+    Returns the page and object counts and the file and first page sizes.
+    """
+    with open(path, "rb") as f:
+        pdf = PdfParser.PdfParser(f=f)
+        try:
+            pages = list(pdf.pages)
+            if not pages:
+                raise ValueError("PDF has no pages")
+            objects = {}
+            page_set = set(pages)
+            # Objects of each page; ones used by several pages are shared
+            page_objects = [_collect(pdf, page, page_set - {page}, objects) for page in pages]
+            owners = {}
+            for i, refs in enumerate(page_objects):
+                for ref in refs:
+                    owners.setdefault(ref, set()).add(i)
+            first_page = page_objects[0]
+            first_set = set(first_page)
+            shared = [ref for refs in page_objects[1:] for ref in refs
+                      if len(owners[ref]) > 1 and ref not in first_set]
+            shared = list(dict.fromkeys(shared))
+            other_pages = [[ref for ref in refs if len(owners[ref]) == 1] for refs in page_objects[1:]]
+
+            root_ref = pdf.root_ref
+            root = objects[root_ref] = pdf.read_indirect(root_ref)
+            assigned = set(owners)
+            document = [root_ref]
+            assigned.add(root_ref)
+            # A viewer opening on the bookmarks needs them with the first page
+            outlines = []
+            if root.get(b"PageMode") == b"UseOutlines" and isinstance(root.get(b"Outlines"), PdfParser.IndirectReference):
+                outlines = _collect(pdf, root[b"Outlines"], assigned | {pdf.pages_ref}, objects)
+            assigned.update(outlines)
+            rest = [ref for ref in _collect(pdf, root_ref, assigned - {root_ref}, objects) if ref not in assigned]
+            assigned.update(rest)
+            if pdf.info_ref is not None and pdf.info_ref not in assigned:
+                rest.extend(ref for ref in _collect(pdf, pdf.info_ref, assigned, objects) if ref not in assigned)
+        finally:
+            pdf.close()
+
+    # Main section objects are numbered from 1, the first page section after them
+    main_order = [ref for refs in other_pages for ref in refs] + shared + rest
+    first_section = first_page + outlines
+    numbers = {ref: i + 1 for i, ref in enumerate(main_order)}
+    main_size = len(main_order) + 1
+    lin_number = main_size
+    numbers.update({ref: lin_number + 1 + i for i, ref in enumerate(document)})
+    hint_number = lin_number + 1 + len(document)
+    numbers.update({ref: hint_number + 1 + i for i, ref in enumerate(first_section)})
+    size = hint_number + 1 + len(first_section)
+    info_number = numbers.get(pdf.info_ref) if pdf.info_ref is not None else None
+
+    document_bytes = [_object_bytes(numbers[ref], objects[ref], numbers) for ref in document]
+    first_bytes = [_object_bytes(numbers[ref], objects[ref], numbers) for ref in first_section]
+    other_bytes = [[_object_bytes(numbers[ref], objects[ref], numbers) for ref in refs] for refs in other_pages]
+    shared_bytes = [_object_bytes(numbers[ref], objects[ref], numbers) for ref in shared]
+    rest_bytes = [_object_bytes(numbers[ref], objects[ref], numbers) for ref in rest]
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+
+    def lin_dict(length, hint_offset, hint_length, first_end, main_xref_entry):
+        # Fixed width, so its size doesn't depend on the offsets it holds
+        return (b"%d 0 obj\n<< /Linearized 1 /L %010d /H [ %010d %010d ] /O %d /E %010d /N %d /T %010d >>\nendobj\n"
+                % (lin_number, length, hint_offset, hint_length, numbers[pages[0]], first_end, len(pages),
+                   main_xref_entry))
+
+    def first_xref(offsets, main_xref_offset):
+        trailer = b"/Size %d /Root %d 0 R" % (size, numbers[root_ref])
+        if info_number:
+            trailer += b" /Info %d 0 R" % info_number
+        return (b"xref\n%d %d\n" % (lin_number, size - lin_number)
+                + b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+                + b"trailer\n<< " + trailer + b" /Prev %010d >>\nstartxref\n0\n%%%%EOF\n" % main_xref_offset)
+
+    def hint_object(data, shared_offset, outline_offset):
+        tables = b"/S %d" % shared_offset
+        if outline_offset is not None:
+            tables += b" /O %d" % outline_offset
+        return (b"%d 0 obj\n<< /Length %d %s >>\nstream\n" % (hint_number, len(data), tables)
+                + data + b"\nendstream\nendobj\n")
+
+    # Sizes that don't depend on offsets fix the layout; then the offsets are filled in
+    lin_length = len(lin_dict(0, 0, 0, 0, 0))
+    xref_length = len(first_xref([0] * (size - lin_number), 0))
+    document_start = len(header) + lin_length + xref_length
+    hint_offset = document_start + sum(map(len, document_bytes))
+    page_lengths = [sum(map(len, first_bytes))] + [sum(map(len, page)) for page in other_bytes]
+    shared_index = {ref: i for i, ref in enumerate(first_section)}
+    shared_index.update({ref: len(first_section) + i for i, ref in enumerate(shared)})
+    page_hints = [(len(first_section), page_lengths[0], [])]
+    for refs, own, length in zip(page_objects[1:], other_pages, page_lengths[1:]):
+        own_set = set(own)
+        page_hints.append((len(own), length, [shared_index[ref] for ref in refs if ref not in own_set]))
+    shared_lengths = [len(data) for data in first_bytes + shared_bytes]
+    outline_hint = None
+    if outlines:
+        outline_bytes = first_bytes[len(first_page):]
+        outline_hint = (numbers[outlines[0]], hint_offset + page_lengths[0] - sum(map(len, outline_bytes)),
+                        len(outlines), sum(map(len, outline_bytes)))
+
+    def build_hints(shared_section_offset):
+        # Hint table offsets are given as if the hint stream weren't in the file
+        shared_start = (numbers[shared[0]], shared_section_offset) if shared else (0, 0)
+        return _hint_stream(page_hints, hint_offset, shared_lengths, shared_start, outline_hint)
+
+    hint_length = len(hint_object(*build_hints(0)))
+    first_start = hint_offset + hint_length
+    first_end = first_start + page_lengths[0]
+    shared_section = first_end + sum(page_lengths[1:])
+    hint_data = hint_object(*build_hints(shared_section - hint_length))
+    rest_start = shared_section + sum(map(len, shared_bytes))
+    main_xref_offset = rest_start + sum(map(len, rest_bytes))
+
+    offsets = {}
+    position = first_start
+    for ref, data in zip(first_section, first_bytes):
+        offsets[ref] = position
+        position += len(data)
+    for ref, data in zip([ref for refs in other_pages for ref in refs] + shared + rest,
+                         [data for page in other_bytes for data in page] + shared_bytes + rest_bytes):
+        offsets[ref] = position
+        position += len(data)
+    position = document_start
+    for ref, data in zip(document, document_bytes):
+        offsets[ref] = position
+        position += len(data)
+
+    main_xref = (b"xref\n0 %d\n0000000000 65535 f \n" % main_size
+                 + b"".join(b"%010d 00000 n \n" % offsets[ref] for ref in main_order))
+    main_entry = main_xref_offset + len(b"xref\n0 %d" % main_size) # The end of line before entry 0
+    first_xref_offset = len(header) + lin_length
+    trailer = b"trailer\n<< /Size %d /Root %d 0 R" % (main_size, numbers[root_ref])
+    if info_number:
+        trailer += b" /Info %d 0 R" % info_number
+    tail = main_xref + trailer + b" >>\nstartxref\n%d\n%%%%EOF\n" % first_xref_offset
+    length = main_xref_offset + len(tail)
+
+    first_offsets = [hint_offset if number == hint_number else offsets[ref]
+                     for number, ref in sorted([(numbers[ref], ref) for ref in document + first_section]
+                                               + [(hint_number, None)], key=lambda item: item[0])]
+    chunks = [header,
+              lin_dict(length, hint_offset, hint_length, first_end, main_entry),
+              first_xref([len(header)] + first_offsets, main_xref_offset),
+              *document_bytes, hint_data, *first_bytes,
+              *[data for page in other_bytes for data in page], *shared_bytes, *rest_bytes, tail]
+
+    output_path = output_path or path
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    written = os.path.getsize(tmp_path)
+    if written != length:
+        os.remove(tmp_path)
+        raise RuntimeError(f"linearized layout is {written} bytes, expected {length}")
+    os.replace(tmp_path, output_path)
+    return {"pages": len(pages), "objects": size - 1, "bytes": length, "first_page_bytes": first_end}
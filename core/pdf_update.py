@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import time
+from PIL import Image, PdfParser
+
+from core import determinism, pdf_book
+
+# Incremental PDF updates. Next to a PDF we record, per page, the key of the
+# inputs it was drawn from (<pdf>.pages.json, with the PDF's size and mtime so
+# a PDF rewritten since is never patched). When only some pages changed, their
+# new images, contents and page objects are appended to the file together with
+# a new page list and a cross-reference section that points at them (PDF
+# incremental update); every other byte of the file stays as it is. Pages are
+# encoded exactly like Pillow's PDF writer does in a full rebuild.
+
+MANIFEST_SUFFIX = ".pages.json"
+PDF_RESOLUTION = 100.0 # Pixels per inch, as in save_pdf
+
+def manifest_path(pdf_path: str) -> str:
+    return pdf_path + MANIFEST_SUFFIX
+
+def _file_state(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def recorded_pages(pdf_path: str):
+    """The [{"file", "key"}] pages recorded for pdf_path, in page order.
+
+    Returns None if there is no record or the PDF changed since it was written.
+    """
+    try:
+        with open(manifest_path(pdf_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("pdf") != _file_state(pdf_path):
+            return None
+        return list(manifest["pages"])
+    except (OSError, ValueError, KeyError, AttributeError, TypeError):
+        return None
+
+def record_pages(pdf_path: str, pages: list):
+    """Records the (file, key) of every page of pdf_path, in page order."""
+    manifest = {"pdf": _file_state(pdf_path), "pages": [{"file": file, "key": key} for file, key in pages]}
+    with open(manifest_path(pdf_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+def _page_objects(pdf, page_ref) -> list:
+    # The page object and the image/content objects only it uses
+    page = pdf.read_indirect(page_ref)
+    refs = [page_ref]
+    contents = page.get(b"Contents")
+    if isinstance(contents, PdfParser.IndirectReference):
+        refs.append(contents)
+    xobjects = page.get(b"Resources", {}).get(b"XObject", {})
+    refs.extend(ref for ref in xobjects.values() if isinstance(ref, PdfParser.IndirectReference))
+    return refs
+
+def update_pdf(pdf_path: str, pages: list, resolution: float = PDF_RESOLUTION) -> dict:
+    """Gives pdf_path a new page list by appending an incremental update.
+
+    `pages` is the new page list in order, as (file, key, jpeg path) tuples:
+    a page whose key is recorded for the PDF keeps its objects (jpeg path
+    None), any other page is embedded from its JPEG. Recorded pages missing
+    from the list are dropped. Raises ValueError if the PDF has no matching
+    record. Returns the kept, embedded and dropped page counts and the
+    bytes appended.
+    """
+    recorded = recorded_pages(pdf_path)
+    if recorded is None:
+        raise ValueError("no page record for this PDF")
+    size_before = os.path.getsize(pdf_path)
+    stats = {"kept": 0, "embedded": 0, "dropped": 0, "bytes_appended": 0}
+    with open(pdf_path, "r+b") as f:
+        pdf = PdfParser.PdfParser(f=f, filename=pdf_path)
+        try:
+            if len(pdf.pages) != len(recorded):
+                raise ValueError(f"PDF has {len(pdf.pages)} pages, {len(recorded)} recorded")
+            old_refs = {entry["key"]: ref for entry, ref in zip(recorded, pdf.pages) if entry["key"]}
+            kept_keys = {key for _, key, source in pages if source is None}
+            missing = kept_keys - set(old_refs)
+            if missing:
+                raise ValueError(f"{len(missing)} page(s) to keep are not in the PDF")
+            # Objects of pages that are replaced or dropped, freed in the new cross-reference section
+            dropped_pages = [ref for entry, ref in zip(recorded, pdf.pages) if entry["key"] not in kept_keys]
+            dropped = [obj for ref in dropped_pages for obj in _page_objects(pdf, ref)]
+            stats["dropped"] = len(dropped_pages)
+
+            pdf.start_writing()
+            f.write(b"\n") # The last %%EOF may lack its end of line
+            kids = []
+            for _, key, source in pages:
+                if source is None:
+                    kids.append(old_refs[key])
+                    stats["kept"] += 1
+                    continue
+                stream = pdf_book.pdf_jpeg(source) # As Pillow's writer embeds it in a full rebuild
+                with Image.open(io.BytesIO(stream)) as img:
+                    width, height = img.size
+                page_w, page_h = width * 72.0 / resolution, height * 72.0 / resolution
+                image_ref = pdf.write_obj(None, stream=stream, Type=PdfParser.PdfName("XObject"),
+                                          Subtype=PdfParser.PdfName("Image"), Width=width, Height=height,
+                                          Filter=PdfParser.PdfName("DCTDecode"), BitsPerComponent=8,
+                                          ColorSpace=PdfParser.PdfName("DeviceRGB"))
+                contents_ref = pdf.write_obj(None, stream=b"q %f 0 0 %f 0 0 cm /image Do Q\n" % (page_w, page_h))
+                kids.append(pdf.write_page(None, Resources=PdfParser.PdfDict(
+                                               ProcSet=[PdfParser.PdfName("PDF"), PdfParser.PdfName("ImageC")],
+                                               XObject=PdfParser.PdfDict(image=image_ref)),
+                                           MediaBox=[0, 0, page_w, page_h], Contents=contents_ref))
+                stats["embedded"] += 1
+            for ref in dropped:
+                del pdf.xref_table[ref.object_id]
+            pdf.write_obj(pdf.pages_ref, Type=PdfParser.PdfName("Pages"), Count=len(kids), Kids=kids)
+            pdf.info.ModDate = determinism.FIXED_PDF_DATE if determinism.is_deterministic() else time.gmtime()
+            pdf.write_xref_and_trailer()
+        finally:
+            pdf.close()
+    record_pages(pdf_path, [(file, key) for file, key, _ in pages])
+    stats["bytes_appended"] = os.path.getsize(pdf_path) - size_before
+    return stats
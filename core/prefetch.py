@@ -0,0 +1,248 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from core import metrics
+
+# Thread-pool prefetching and background saving. Pillow releases the GIL while
+# decoding, resampling and encoding, so decoding/fitting the heroes and
+# backgrounds of a job, and JPEG-encoding finished pages, can run alongside
+# the drawing on the main thread even in a single process.
+#
+# Prefetched work is keyed by (function, args). Page code asks for the same
+# call through fetch(), which hands over the prefetched result, or just runs
+# the function when nothing was prefetched or prefetching is off.
+
+PREFETCH_THREADS = 4
+SHARED_RESULT_BYTES = 256 * 1024 * 1024 # Default bound of the shared result cache (see share_results)
+
+_enabled = True
+_state = None
+_state_lock = threading.Lock()
+_local = threading.local() # .captured: list collecting save_image() calls (see captured_saves)
+_save_hooks = {}           # abs output path -> [fn(path)] to call once written (see when_saved)
+_save_hooks_lock = threading.Lock()
+_failed_saves = []         # abs output paths whose save failed since the last wait_for_saves()
+
+class _State:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(max_workers=PREFETCH_THREADS, thread_name_prefix="prefetch")
+        self.pending = {} # (fn, args) -> Future
+        self.saves = []   # Futures of background saves
+        self.lock = threading.Lock()
+
+class _SharedResults:
+    def __init__(self, max_bytes: int):
+        self.pid = os.getpid()
+        self.max_bytes = max_bytes
+        self.results = OrderedDict() # (fn, args) -> (result, bytes)
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+_shared = None
+
+def _result_bytes(result) -> int:
+    # Images (also inside tuples, e.g. (image, flag)) by their pixel data
+    if isinstance(result, tuple):
+        return sum(_result_bytes(item) for item in result)
+    size = getattr(result, "size", None)
+    bands = getattr(result, "getbands", None)
+    if isinstance(size, tuple) and bands is not None:
+        return size[0] * size[1] * len(bands())
+    return 0
+
+def share_results(max_bytes: int = SHARED_RESULT_BYTES):
+    """Makes fetch() keep its results and hand the same object to every later identical call.
+
+    Only for processes that lay pages out without painting them (previews):
+    callers share the objects and must not modify them. Least recently used
+    results are dropped beyond `max_bytes`. Applies to this process only;
+    forked children don't inherit it.
+    """
+    global _shared
+    with _state_lock:
+        if _shared is None or _shared.pid != os.getpid():
+            _shared = _SharedResults(max_bytes)
+
+def _get_shared():
+    shared = _shared
+    return shared if shared is not None and shared.pid == os.getpid() else None
+
+def set_enabled(enabled: bool = True):
+    """Turns prefetching and background saving on or off for this process."""
+    global _enabled
+    _enabled = enabled
+
+def is_enabled() -> bool:
+    return _enabled
+
+def _get_state() -> _State:
+    global _state
+    with _state_lock:
+        # Threads don't survive fork: a forked worker starts its own pool
+        if _state is None or _state.pid != os.getpid():
+            _state = _State()
+        return _state
+
+def prefetch(fn, *args):
+    """Starts `fn(*args)` on the thread pool, for a later fetch() of the same call.
+
+    Arguments must be hashable. Does nothing when prefetching is disabled.
+    """
+    if not _enabled:
+        return
+    key = (fn, args)
+    shared = _get_shared()
+    if shared is not None and key in shared.results:
+        return
+    state = _get_state()
+    with state.lock:
+        if key not in state.pending:
+            state.pending[key] = state.executor.submit(fn, *args)
+
+def fetch(fn, *args):
+    """Returns `fn(*args)`, taking over a prefetched result if there is one.
+
+    Each prefetched result is handed out once, so the caller owns it. If the
+    prefetch failed, the call is simply repeated so the caller's own error
+    handling sees the exception. With share_results(), results are kept and shared.
+    """
+    shared = _get_shared()
+    if shared is None:
+        return _fetch(fn, args)
+    key = (fn, args)
+    with shared.lock:
+        entry = shared.results.get(key)
+        if entry is not None:
+            shared.results.move_to_end(key)
+            return entry[0]
+    result = _fetch(fn, args)
+    size = _result_bytes(result)
+    with shared.lock:
+        if key not in shared.results:
+            shared.results[key] = (result, size)
+            shared.bytes += size
+            while shared.bytes > shared.max_bytes and len(shared.results) > 1:
+                _, (_, dropped) = shared.results.popitem(last=False)
+                shared.bytes -= dropped
+    return result
+
+def _fetch(fn, args):
+    future = None
+    if _state is not None and _state.pid == os.getpid():
+        with _state.lock:
+            future = _state.pending.pop((fn, args), None)
+    if future is not None:
+        try:
+            return future.result()
+        except Exception:
+            pass
+    return fn(*args)
+
+def wait_pending():
+    """Blocks until every prefetch started so far has finished (results stay fetchable)."""
+    if _state is None or _state.pid != os.getpid():
+        return
+    with _state.lock:
+        futures = list(_state.pending.values())
+    wait(futures)
+
+def discard():
+    """Drops prefetched results nobody fetched (e.g. their page failed)."""
+    if _state is None or _state.pid != os.getpid():
+        return
+    with _state.lock:
+        futures = list(_state.pending.values())
+        _state.pending.clear()
+    for future in futures:
+        future.cancel()
+
+def when_saved(path: str, fn):
+    """Calls fn(path) once a save_image() to `path` has been written (on the thread that wrote it)."""
+    with _save_hooks_lock:
+        _save_hooks.setdefault(os.path.abspath(path), []).append(fn)
+
+def drop_save_hooks(paths):
+    """Drops the when_saved hooks of paths that won't be saved (e.g. their page failed)."""
+    with _save_hooks_lock:
+        for path in paths:
+            _save_hooks.pop(os.path.abspath(path), None)
+
+def run_save(img, path: str, args=(), kwargs=None):
+    """Performs a save_image() call (e.g. one collected by captured_saves), then its when_saved hooks."""
+    try:
+        start = time.perf_counter()
+        img.save(path, *args, **(kwargs or {}))
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="page_encode")
+        metrics.BYTES_WRITTEN.inc(os.path.getsize(path), kind="page_image")
+    except Exception:
+        with _save_hooks_lock:
+            _failed_saves.append(os.path.abspath(path))
+        raise
+    finally:
+        with _save_hooks_lock:
+            hooks = _save_hooks.pop(os.path.abspath(path), []) if _save_hooks else []
+    for fn in hooks:
+        try:
+            fn(path)
+        except Exception as e:
+            print(f"Warning: After saving {path}: {e}")
+
+def _save(img, path, args, kwargs):
+    try:
+        run_save(img, path, args, kwargs)
+    except Exception as e:
+        print(f"Error saving page {path}: {e}")
+        raise
+
+def save_image(img, path: str, *args, **kwargs):
+    """Saves `img` like img.save(), on a background thread when enabled.
+
+    The image must not be modified or closed until wait_for_saves() returns.
+    Inside captured_saves() the call is recorded for the caller to run instead.
+    """
+    captured = getattr(_local, "captured", None)
+    if captured is not None:
+        captured.append((img, path, args, kwargs))
+        return
+    if not _enabled:
+        run_save(img, path, args, kwargs)
+        return
+    state = _get_state()
+    future = state.executor.submit(_save, img, path, args, kwargs)
+    with state.lock:
+        state.saves.append(future)
+
+def wait_for_saves() -> list:
+    """Blocks until all background saves are written.
+
+    Returns the absolute paths of the saves that failed since the last call,
+    whether they ran in the background, inline or through run_save().
+    """
+    if _state is not None and _state.pid == os.getpid():
+        with _state.lock:
+            saves = _state.saves
+            _state.saves = []
+        wait(saves) # Failures are reported by _save and recorded by run_save
+    with _save_hooks_lock:
+        failed = list(_failed_saves)
+        _failed_saves.clear()
+    return failed
+
+@contextmanager
+def captured_saves():
+    """Collects this thread's save_image() calls instead of running them.
+
+    Yields a list of (img, path, args, kwargs); the caller saves them itself,
+    e.g. in a separate encode stage.
+    """
+    previous = getattr(_local, "captured", None)
+    _local.captured = []
+    try:
+        yield _local.captured
+    finally:
+        _local.captured = previous
@@ -0,0 +1,329 @@
+import hashlib
+import html
+import io
+import math
+import os
+import shutil
+import threading
+import weakref
+
+from PIL import Image, ImageColor
+
+from core import asset_index, determinism
+from core import fonts as font_cache
+from core.display_list import Blur, DisplayList, Layer, Line, Paste, Rect, RoundedRect, Text
+
+# Browser previews. A page's display list (see core.display_list) is written
+# as SVG in the page's own pixel coordinates: text runs become <text> in the
+# same fonts (served as @font-face files), shapes become SVG shapes and
+# images are referenced as small downscaled copies. No page is painted, so a
+# preview costs layout plus, at most, a reduce/encode per image not seen before.
+#
+# Image copies are written once into an assets directory under a content
+# key. Images produced by the shared loaders are tagged with their source
+# (file, size, settings) so their copies are found again without touching
+# the pixels; other images (masks, gradients) are keyed by their reduced pixels.
+# In a preview process (draft_images()) the loaders never decode or fit an
+# asset at page size: they decode it reduced (JPEG DCT scaling, else
+# Image.reduce) and fit it straight to the preview copy's size, and the
+# copy stands in for the page-sized image through display_size().
+
+PREVIEW_REDUCE = 4           # Images are referenced at 1/PREVIEW_REDUCE of their size...
+PREVIEW_MIN_REDUCE_SIZE = 256 # ...unless both sides are smaller than this
+PREVIEW_JPEG_QUALITY = 70
+PREVIEW_PAGE_WIDTH = 620     # CSS width of a page in the HTML preview
+
+_sources = {} # id(image) -> {"ref": weakref to the image, "key": source key, "display_size": full size of a draft}
+_sources_lock = threading.Lock()
+_draft_pid = None # Process whose loaders fit reduced drafts (see draft_images)
+
+def _forget(image_id: int):
+    with _sources_lock:
+        _sources.pop(image_id, None)
+
+def _tag(img: Image.Image, **fields):
+    with _sources_lock:
+        entry = _sources.get(id(img))
+        if entry is None or entry["ref"]() is not img:
+            ref = weakref.ref(img, lambda _, image_id=id(img): _forget(image_id))
+            entry = _sources[id(img)] = {"ref": ref}
+        entry.update(fields)
+
+def _tags_of(img: Image.Image) -> dict:
+    with _sources_lock:
+        entry = _sources.get(id(img))
+    return entry if entry and entry["ref"]() is img else {}
+
+def tag_source(img: Image.Image, *key) -> Image.Image:
+    """Records what `img` was made from (e.g. path and loader settings). Returns img."""
+    _tag(img, key=determinism.canonical_hash(*key))
+    return img
+
+def draft_images():
+    """Makes the image loaders in this process fit reduced drafts (see fit_image).
+
+    Only for processes that lay pages out without painting them (previews).
+    Applies to this process only; forked children don't inherit it.
+    """
+    global _draft_pid
+    _draft_pid = os.getpid()
+
+def fit_image(src: Image.Image, size: tuple, fit) -> Image.Image:
+    """Returns fit(src, size), the asset `src` scaled to `size` by a loader.
+
+    With draft_images(), `src` is decoded reduced and fitted to the preview
+    copy's size (1/PREVIEW_REDUCE) instead; display_size() of the result is `size`.
+    """
+    size = (int(size[0]), int(size[1]))
+    if _draft_pid != os.getpid() or max(size) < PREVIEW_MIN_REDUCE_SIZE:
+        return fit(src, size)
+    small = (-(-size[0] // PREVIEW_REDUCE), -(-size[1] // PREVIEW_REDUCE)) # As Image.reduce() sizes it
+    scale = max(small[0] / src.width, small[1] / src.height)
+    needed = (max(1, math.ceil(src.width * scale)), max(1, math.ceil(src.height * scale)))
+    src.draft(src.mode, needed) # JPEGs decode at 1/2, 1/4 or 1/8 scale; a no-op for other formats
+    factor = min(src.width // needed[0], src.height // needed[1])
+    if factor >= 2:
+        src = src.reduce(factor)
+    img = fit(src, small)
+    _tag(img, display_size=size)
+    return img
+
+def display_size(img: Image.Image) -> tuple:
+    """The size `img` stands for on the page: its own, or the full size of a draft from fit_image()."""
+    return _tags_of(img).get("display_size") or img.size
+
+def source_key(path: str) -> tuple:
+    """Identity of an asset file for tag_source(): its path, size and mtime."""
+    entry = asset_index.resolve(path) if isinstance(path, str) else None
+    return (entry.path, entry.size, entry.mtime_ns) if entry else (path,)
+
+def _source_of(img: Image.Image):
+    return _tags_of(img).get("key")
+
+def _css_color(ink) -> str:
+    if ink is None:
+        return "none"
+    if isinstance(ink, str):
+        ink = ImageColor.getrgb(ink)
+    if isinstance(ink, (int, float)):
+        ink = (int(ink),) * 3
+    r, g, b = (int(c) for c in ink[:3])
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def _num(value) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".") if isinstance(value, float) else str(value)
+
+class PreviewAssets:
+    """Downscaled image copies and font files referenced by previews.
+
+    Files go to `asset_dir`; pages reference them as `href_prefix` + file name.
+    """
+
+    def __init__(self, asset_dir: str, href_prefix: str = ""):
+        self.asset_dir = asset_dir
+        self.href_prefix = href_prefix
+        self._images = {} # (source key, mode, size) -> href
+        self._fonts = {}  # font file -> (family, href)
+        self._lock = threading.Lock()
+        os.makedirs(asset_dir, exist_ok=True)
+
+    def _write(self, name: str, write) -> str:
+        path = os.path.join(self.asset_dir, name)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        return self.href_prefix + name
+
+    def image_href(self, img: Image.Image) -> str:
+        source = _source_of(img)
+        size = display_size(img)
+        key = (source, img.mode, size)
+        if source is not None:
+            with self._lock:
+                href = self._images.get(key)
+            if href is not None:
+                return href
+            # Written by an earlier preview (or process)?
+            name = determinism.canonical_hash(*key)[:20] + (".jpg" if img.mode == "RGB" else ".png")
+            if os.path.exists(os.path.join(self.asset_dir, name)):
+                href = self.href_prefix + name
+                with self._lock:
+                    self._images[key] = href
+                return href
+        small = img
+        if size == img.size and max(img.size) >= PREVIEW_MIN_REDUCE_SIZE: # Drafts are already reduced
+            small = img.reduce(PREVIEW_REDUCE)
+        if small.mode not in ("RGB", "RGBA", "L", "LA"):
+            small = small.convert("RGBA")
+        if small.mode == "RGB":
+            buffer = io.BytesIO()
+            small.save(buffer, "JPEG", quality=PREVIEW_JPEG_QUALITY)
+            data, ext = buffer.getvalue(), ".jpg"
+        else:
+            buffer = io.BytesIO()
+            small.save(buffer, "PNG")
+            data, ext = buffer.getvalue(), ".png"
+        if source is not None:
+            name = determinism.canonical_hash(*key)[:20] + ext
+        else:
+            name = hashlib.sha256(data).hexdigest()[:20] + ext
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        href = self._write(name, write)
+        if source is not None:
+            with self._lock:
+                self._images[key] = href
+        return href
+
+    def font_family(self, font):
+        """CSS font family for a Pillow font, registering its file; None for bitmap/default fonts."""
+        path = font_cache.font_file(font) or (font.path if isinstance(getattr(font, "path", None), str) else None)
+        if path is None or not os.path.exists(path):
+            return None
+        with self._lock:
+            entry = self._fonts.get(path)
+        if entry is None:
+            family = "f" + determinism.canonical_hash(os.path.abspath(path))[:10]
+            href = self._write(family + os.path.splitext(path)[1].lower(), lambda tmp_path: shutil.copyfile(path, tmp_path))
+            entry = (family, href)
+            with self._lock:
+                self._fonts[path] = entry
+        return entry[0]
+
+    def font_face_css(self) -> str:
+        with self._lock:
+            fonts = sorted(self._fonts.values())
+        return "".join(f'@font-face{{font-family:"{family}";src:url("{href}");}}' for family, href in fonts)
+
+# --- SVG ---
+
+class _SvgWriter:
+    def __init__(self, assets: PreviewAssets, id_prefix: str = ""):
+        self.assets = assets
+        self.id_prefix = id_prefix # Keeps ids unique when several pages share one HTML document
+        self.defs = []
+        self.next_id = 0
+
+    def _id(self, prefix: str) -> str:
+        self.next_id += 1
+        return f"{self.id_prefix}{prefix}{self.next_id}"
+
+    def _image(self, img: Image.Image, x, y, extra: str = "") -> str:
+        w, h = display_size(img)
+        return (f'<image href="{html.escape(self.assets.image_href(img))}" x="{_num(x)}" y="{_num(y)}" '
+                f'width="{w}" height="{h}" preserveAspectRatio="none"{extra}/>')
+
+    def _mask(self, mask: Image.Image, x=0, y=0) -> str:
+        mask_id = self._id("m")
+        w, h = mask.size
+        self.defs.append(f'<mask id="{mask_id}" maskUnits="userSpaceOnUse" x="{_num(x)}" y="{_num(y)}" '
+                         f'width="{w}" height="{h}">{self._image(mask, x, y)}</mask>')
+        return mask_id
+
+    def _text(self, op: Text) -> str:
+        x, y = op.xy
+        family = self.assets.font_family(op.font)
+        size = getattr(op.font, "size", 11)
+        try:
+            ascent, descent = op.font.getmetrics()
+        except AttributeError:
+            ascent, descent = size, 0
+        anchor = op.anchor or "la"
+        # Pillow positions text by `anchor` (default: left, ascender); SVG by the baseline
+        y += {"a": ascent, "t": ascent, "m": (ascent - descent) / 2, "s": 0, "b": -descent, "d": -descent}.get(anchor[1], ascent)
+        text_anchor = {"l": "start", "m": "middle", "r": "end"}.get(anchor[0], "start")
+        font_family = f'"{family}",serif' if family else "sans-serif"
+        return (f'<text x="{_num(x)}" y="{_num(y)}" font-family=\'{font_family}\' font-size="{size}" '
+                f'fill="{_css_color(op.fill)}" text-anchor="{text_anchor}" xml:space="preserve">{html.escape(op.text)}</text>')
+
+    def op(self, op, background) -> str:
+        if isinstance(op, Text):
+            return self._text(op)
+        if isinstance(op, Paste):
+            x, y = op.xy[:2]
+            if op.mask is None or op.mask is op.image or op.image.mode in ("RGBA", "LA"):
+                return self._image(op.image, x, y)
+            return f'<g mask="url(#{self._mask(op.mask, x, y)})">{self._image(op.image, x, y)}</g>'
+        if isinstance(op, Line):
+            points = " ".join(f"{_num(px)},{_num(py)}" for px, py in op.points)
+            return (f'<polyline points="{points}" fill="none" stroke="{_css_color(op.fill)}" '
+                    f'stroke-width="{op.width}"/>')
+        if isinstance(op, (Rect, RoundedRect)):
+            x0, y0, x1, y1 = op.box
+            width = op.width if isinstance(op, RoundedRect) else 1
+            radius = f' rx="{op.radius}"' if isinstance(op, RoundedRect) else ""
+            inset = width / 2 if op.outline is not None else 0 # Pillow draws outlines inside the box
+            stroke = f' stroke="{_css_color(op.outline)}" stroke-width="{width}"' if op.outline is not None else ""
+            return (f'<rect x="{_num(x0 + inset)}" y="{_num(y0 + inset)}" width="{_num(x1 - x0 - 2 * inset)}" '
+                    f'height="{_num(y1 - y0 - 2 * inset)}"{radius} fill="{_css_color(op.fill)}"{stroke}/>')
+        if isinstance(op, Blur):
+            if not isinstance(background, Image.Image):
+                return "" # Blurring a flat colour changes nothing
+            x0, y0 = op.box[:2]
+            filter_id = self._id("b")
+            clip_id = self._id("c")
+            self.defs.append(f'<filter id="{filter_id}"><feGaussianBlur stdDeviation="{op.radius}"/></filter>')
+            self.defs.append(f'<clipPath id="{clip_id}"><rect x="{x0}" y="{y0}" width="{op.box[2] - x0}" height="{op.box[3] - y0}"/></clipPath>')
+            mask = f' mask="url(#{self._mask(op.mask, x0, y0)})"' if op.mask is not None else ""
+            blurred = self._image(background, 0, 0, f' filter="url(#{filter_id})"')
+            return f'<g{mask}><g clip-path="url(#{clip_id})">{blurred}</g></g>'
+        if isinstance(op, Layer):
+            x, y = op.xy[:2]
+            w, h = op.display_list.size
+            body = self.body(op.display_list)
+            if op.mask is not None:
+                body = f'<g mask="url(#{self._mask(op.mask)})">{body}</g>'
+            return f'<svg x="{_num(x)}" y="{_num(y)}" width="{w}" height="{h}">{body}</svg>'
+        raise TypeError(f"Unknown display list op: {op!r}")
+
+    def body(self, display_list: DisplayList) -> str:
+        w, h = display_list.size
+        background = display_list.background
+        if isinstance(background, Image.Image):
+            parts = [self._image(background, 0, 0)]
+        elif display_list.mode == "RGBA" and isinstance(background, tuple) and background[3:] == (0,):
+            parts = [] # Transparent layer
+        else:
+            parts = [f'<rect width="{w}" height="{h}" fill="{_css_color(background)}"/>']
+        parts.extend(self.op(op, background) for op in display_list.ops)
+        return "".join(parts)
+
+def svg_document(display_list: DisplayList, assets: PreviewAssets, width=None, standalone: bool = True,
+                 id_prefix: str = "") -> str:
+    """The display list as an SVG document (viewBox in page pixels, shown `width` wide).
+
+    Without `standalone`, the xmlns and @font-face style are left out for inlining in HTML.
+    """
+    writer = _SvgWriter(assets, id_prefix)
+    body = writer.body(display_list)
+    w, h = display_list.size
+    size = f' width="{width}" height="{_num(h * width / w)}"' if width else ""
+    style = f"<style>{assets.font_face_css()}</style>" if standalone else ""
+    xmlns = ' xmlns="http://www.w3.org/2000/svg"' if standalone else ""
+    return (f'<svg{xmlns} viewBox="0 0 {w} {h}"{size}>{style}'
+            f'<defs>{"".join(writer.defs)}</defs>{body}</svg>')
+
+def write_svg(display_list: DisplayList, path: str, assets: PreviewAssets, width=None) -> str:
+    """Writes one page as a standalone SVG file. Returns the path."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(svg_document(display_list, assets, width))
+    return path
+
+def html_document(pages: list, assets: PreviewAssets, title: str = "Itinerary preview") -> str:
+    """An HTML page showing every (caption, display list) page as inline SVG."""
+    sections = [f'<figure>{svg_document(display_list, assets, standalone=False, id_prefix=f"p{i}-")}'
+                f'<figcaption>{html.escape(caption)}</figcaption></figure>' for i, (caption, display_list) in enumerate(pages, 1)]
+    return ("<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+            f"<title>{html.escape(title)}</title><style>{assets.font_face_css()}"
+            f"body{{background:#555;margin:0;padding:16px}}figure{{margin:0 auto 16px;width:{PREVIEW_PAGE_WIDTH}px}}"
+            "svg{display:block;width:100%;height:auto;background:#fff}"
+            "figcaption{color:#eee;font:12px sans-serif;padding:4px 0}</style></head>"
+            f"<body>{''.join(sections)}</body></html>")
+
+def write_html(pages: list, path: str, assets: PreviewAssets, title: str = "Itinerary preview") -> str:
+    """Writes every (caption, display list) page into one HTML file. Returns the path."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html_document(pages, assets, title))
+    return path
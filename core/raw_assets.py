@@ -0,0 +1,150 @@
+import json
+import mmap
+import os
+from PIL import Image
+
+from core import asset_index, color_stats
+
+# Memory-mappable raw pixel store for image assets. compile_assets() decodes
+# every image in inputs/ and icons/ once into an uncompressed pixel file plus a
+# manifest; open_image() then maps those files instead of inflating PNG/JPEG
+# data on every render. Mapped pages live in the OS page cache, so all worker
+# processes share a single copy of each asset.
+#
+# Pixels are stored in layouts Pillow can map without copying (see
+# Image.frombuffer): RGB sources as 4-byte RGBX, RGBA as RGBA and greyscale
+# as L. Sources that changed since compilation fall back to a normal decode.
+
+RAW_ASSETS_DIR = os.path.join(".cache", "raw_assets")
+MANIFEST_NAME = "manifest.json"
+COMPILE_DIRS = ("inputs", "icons")
+
+_RAW_MODES = {"RGB": "RGBX", "RGBA": "RGBA", "L": "L"}
+_BYTES_PER_PIXEL = {"RGBX": 4, "RGBA": 4, "L": 1}
+
+_manifest = None  # source key -> entry, loaded on first use
+_maps = {}        # raw file path -> open mmap
+
+def _source_key(path: str) -> str:
+    return os.path.normpath(os.path.relpath(os.path.abspath(os.path.expanduser(path))))
+
+def _storage_mode(img: Image.Image) -> str:
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        return "RGBA"
+    if img.mode == "L":
+        return "L"
+    return "RGB"
+
+def load_manifest(raw_dir: str = RAW_ASSETS_DIR) -> dict:
+    """Loads (once per process) and returns the compiled-asset manifest; empty if none."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(raw_dir, MANIFEST_NAME), "r") as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def compile_assets(source_dirs=COMPILE_DIRS, raw_dir: str = RAW_ASSETS_DIR) -> int:
+    """Compiles every raster image in `source_dirs` into raw pixel files.
+
+    Up-to-date entries are kept as they are. Returns the number of images
+    (re)compiled.
+    """
+    global _manifest
+    os.makedirs(raw_dir, exist_ok=True)
+    manifest = dict(load_manifest(raw_dir))
+    compiled = 0
+    for source_dir in source_dirs:
+        try:
+            names = sorted(os.listdir(source_dir))
+        except OSError as e:
+            print(f"Warning: Could not list asset directory '{source_dir}': {e}")
+            continue
+        for name in names:
+            path = os.path.join(source_dir, name)
+            if not os.path.isfile(path):
+                continue
+            key = _source_key(path)
+            st = os.stat(path)
+            entry = manifest.get(key)
+            if (entry and entry["mtime_ns"] == st.st_mtime_ns and entry["bytes"] == st.st_size
+                    and os.path.exists(os.path.join(raw_dir, entry["file"]))):
+                continue
+            try:
+                with Image.open(path) as src:
+                    mode = _storage_mode(src)
+                    img = src.convert(mode)
+            except Exception:
+                continue # Not a raster image Pillow can read (JSON, SVG, ...)
+
+            raw_mode = _RAW_MODES[mode]
+            digest = color_stats.asset_hash(path)
+            raw_name = f"{digest}.{raw_mode}.raw"
+            _write_atomic(os.path.join(raw_dir, raw_name), lambda f: f.write(img.tobytes("raw", raw_mode)))
+            manifest[key] = {
+                "file": raw_name,
+                "mode": mode,
+                "raw_mode": raw_mode,
+                "size": list(img.size),
+                "stride": img.size[0] * _BYTES_PER_PIXEL[raw_mode],
+                "mtime_ns": st.st_mtime_ns,
+                "bytes": st.st_size,
+                "hash": digest,
+            }
+            compiled += 1
+            print(f"Compiled {key} -> {raw_name} ({img.size[0]}x{img.size[1]} {raw_mode})")
+
+    _write_atomic(os.path.join(raw_dir, MANIFEST_NAME),
+                  lambda f: f.write(json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")))
+    _manifest = manifest
+    return compiled
+
+def _map_file(path: str) -> mmap.mmap:
+    mapped = _maps.get(path)
+    if mapped is None:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _maps[path] = mapped
+    return mapped
+
+def open_raw(path: str, raw_dir: str = RAW_ASSETS_DIR):
+    """Maps the compiled pixels of the asset at `path` as a read-only image.
+
+    Returns None if the asset isn't compiled or its source changed since.
+    RGB assets come back in their stored RGBX layout.
+    """
+    entry = load_manifest(raw_dir).get(_source_key(path))
+    if entry is None:
+        return None
+    try:
+        indexed = asset_index.get_index().lookup(path) # Avoids a stat for indexed assets
+        if indexed is not None:
+            mtime_ns, size = indexed.mtime_ns, indexed.size
+        else:
+            st = os.stat(path)
+            mtime_ns, size = st.st_mtime_ns, st.st_size
+        if entry["mtime_ns"] != mtime_ns or entry["bytes"] != size:
+            return None # Stale; recompile to use the mapped copy again
+        mapped = _map_file(os.path.join(raw_dir, entry["file"]))
+    except (OSError, ValueError):
+        return None
+    raw_mode = entry["raw_mode"]
+    return Image.frombuffer(raw_mode, tuple(entry["size"]), mapped, "raw", raw_mode, entry["stride"], 1)
+
+def open_image(path: str) -> Image.Image:
+    """Opens an image asset, mapping its compiled pixels when available.
+
+    Falls back to Image.open (and raises like it) for uncompiled assets.
+    """
+    img = open_raw(path)
+    if img is None:
+        img = Image.open(os.path.expanduser(path))
+    return img
@@ -0,0 +1,242 @@
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import determinism, metrics, page_cache, pdf_book
+from core.workers import create_worker_pool, pool_size
+
+# Minimal local HTTP render service. POST /render with an itinerary details
+# document (same shape as inputs/itinerary_details.json) returns the PDF.
+# Renders run on a pre-forked worker pool shared by all requests; pages
+# identical to ones rendered before come from the shared page cache.
+# POST /preview with the same document returns an HTML preview laid out in the
+# request thread (no painting); its images and fonts are served from
+# GET /preview/assets/<name>.
+# POST /render/stream renders like /render but answers with a chunked PDF that
+# starts as soon as the first page is rendered: the worker reports each page
+# as it is saved and the request thread writes it out right away, with the
+# page tree and cross-reference table at the end.
+# GET /metrics returns the service's metrics (every job's worker-side counts
+# merged in) in the Prometheus text format.
+
+SERVICE_OUTPUT_DIR = os.path.join("outputs", "service")
+PREVIEW_ASSETS_DIR = os.path.join(SERVICE_OUTPUT_DIR, "preview_assets")
+PREVIEW_ASSETS_URL = "/preview/assets/"
+DEFAULT_HOST = "127.0.0.1"
+STREAM_PAGE_TIMEOUT = 300 # Seconds to wait for the next page of a streamed render (worker lost?)
+
+_ASSET_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".ttf": "font/ttf", ".otf": "font/otf", ".ttc": "font/collection"}
+
+def _queued_pages(pages, timeout: float):
+    # Page paths from a streamed render until its None; queue.Empty if a page takes too long
+    while True:
+        path = pages.get(timeout=timeout)
+        if path is None:
+            return
+        yield path
+
+def serve(config_data: dict, port: int = 8080, host: str = DEFAULT_HOST, num_workers: int = None, preload=None, render=None,
+          validate=None, preview=None, stream=None):
+    """Runs the render service until interrupted.
+
+    `render((name, config, details, output_dir))` must return
+    (name, pdf_path_or_None, elapsed_seconds, page_cache_stats, metrics_delta);
+    it runs inside the workers.
+    `validate(config, details)` returns a ValidationReport; it runs in the
+    request thread, so invalid jobs are answered 400 without using a worker.
+    `preview(config, details, asset_dir, asset_url)` returns the HTML preview
+    (or None), referencing files it writes to asset_dir as asset_url + name.
+    `stream((name, config, details, output_dir), pages)` renders in the
+    workers too, putting each page's JPEG path on the `pages` queue as soon
+    as it is saved and then None; it returns (name, page count,
+    elapsed_seconds, page_cache_stats, metrics_delta).
+    """
+    # Fork the workers before the server starts any threads
+    pool = create_worker_pool(num_workers, preload=preload, preload_args=(config_data,))
+    manager = multiprocessing.Manager() if stream is not None else None # Carries page queues to the workers
+    cache_stats = {} # Page cache counts summed over every job served
+    cache_stats_lock = threading.Lock()
+    usage = metrics.PoolUsage("service", pool_size(num_workers))
+
+    def add_cache_stats(job_cache_stats: dict) -> dict:
+        with cache_stats_lock:
+            page_cache.add_stats(cache_stats, job_cache_stats)
+            return dict(cache_stats)
+
+    def job_done(elapsed: float, job_metrics: dict):
+        metrics.merge(job_metrics)
+        usage.job_done(elapsed)
+
+    class RenderHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Needed for chunked responses
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error_json(self, status: int, message: str):
+            self._send(status, json.dumps({"error": message}).encode("utf-8"))
+
+        def _read_body(self):
+            """Reads the request body. Returns None if its length is unknown (the connection is then closed)."""
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0 or "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+                self.close_connection = True # The next request on this connection can't be found
+                return None
+            return self.rfile.read(length)
+
+        def _send_chunk(self, data: bytes):
+            if data:
+                self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+
+        def _stream_render(self, details_data: dict):
+            job_name = uuid.uuid4().hex
+            output_dir = os.path.join(SERVICE_OUTPUT_DIR, job_name)
+            start = time.perf_counter()
+            pages = manager.Queue()
+            metrics.QUEUE_DEPTH.inc(queue="service_jobs")
+            result = pool.apply_async(stream, ((job_name, config_data, details_data, output_dir), pages))
+            try:
+                paths = _queued_pages(pages, STREAM_PAGE_TIMEOUT)
+                try:
+                    first_page = next(paths, None) # The status is only known once the first page is there
+                except queue.Empty:
+                    first_page = None
+                if first_page is None:
+                    self._send_error_json(500, "Rendering failed")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/pdf")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                first_byte = time.perf_counter() - start
+                size = 0
+                try:
+                    pdf_pages = (pdf_book.pdf_jpeg(path) for path in itertools.chain([first_page], paths))
+                    for chunk in pdf_book.stream_pages(pdf_pages, title=determinism.FIXED_PDF_TITLE):
+                        self._send_chunk(chunk)
+                        size += len(chunk)
+                    self.wfile.write(b"0\r\n\r\n")
+                    metrics.BYTES_WRITTEN.inc(size, kind="pdf_stream")
+                except (queue.Empty, OSError, ValueError) as e:
+                    # Too late for an error status: the client gets a truncated chunked body
+                    print(f"Error: Streaming job {job_name} aborted: {e}")
+                    self.close_connection = True
+                    return
+                _, num_pages, elapsed, job_cache_stats, _ = result.get()
+                total_cache_stats = add_cache_stats(job_cache_stats)
+                print(f"Service job {job_name} streamed {num_pages} page(s) in {elapsed:.2f}s ({size} bytes, first page "
+                      f"after {first_byte:.2f}s); {job_cache_stats['hits']} cached page(s), "
+                      f"page cache overall: {page_cache.format_stats(total_cache_stats)}")
+            finally:
+                try:
+                    # The worker may still be writing into output_dir; failed jobs count in the metrics too
+                    _, _, elapsed, _, job_metrics = result.get(timeout=STREAM_PAGE_TIMEOUT)
+                    job_done(elapsed, job_metrics)
+                except Exception:
+                    pass
+                metrics.QUEUE_DEPTH.dec(queue="service_jobs")
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, metrics.prometheus_text().encode("utf-8"), metrics.PROMETHEUS_CONTENT_TYPE)
+                return
+            name = self.path[len(PREVIEW_ASSETS_URL):] if self.path.startswith(PREVIEW_ASSETS_URL) else ""
+            content_type = _ASSET_TYPES.get(os.path.splitext(name)[1].lower())
+            if preview is None or not content_type or "/" in name or name.startswith("."):
+                self._send_error_json(404, f"Unknown path {self.path}")
+                return
+            try:
+                with open(os.path.join(PREVIEW_ASSETS_DIR, name), "rb") as f:
+                    body = f.read()
+            except OSError:
+                self._send_error_json(404, f"Unknown preview asset {name}")
+                return
+            self._send(200, body, content_type)
+
+        def do_POST(self):
+            # Read before any reply: on a kept-alive connection an unread body is taken for the next request
+            body = self._read_body()
+            if (self.path not in ("/render", "/render/stream", "/preview") or (self.path == "/preview" and preview is None)
+                    or (self.path == "/render/stream" and stream is None)):
+                self._send_error_json(404, f"Unknown path {self.path}")
+                return
+            if body is None:
+                self._send_error_json(400, "A request body needs a Content-Length")
+                return
+            try:
+                details_data = json.loads(body)
+            except ValueError as e:
+                self._send_error_json(400, f"Invalid JSON body: {e}")
+                return
+            if validate is not None:
+                report = validate(config_data, details_data)
+                if not report.ok:
+                    body = {"error": "Invalid itinerary", "problems": report.errors, "warnings": report.warnings}
+                    self._send(400, json.dumps(body).encode("utf-8"))
+                    return
+
+            if self.path == "/preview":
+                start = time.perf_counter()
+                page = preview(config_data, details_data, PREVIEW_ASSETS_DIR, PREVIEW_ASSETS_URL)
+                if page is None:
+                    self._send_error_json(500, "Preview failed")
+                    return
+                print(f"Service preview laid out in {(time.perf_counter() - start) * 1000:.0f} ms")
+                self._send(200, page.encode("utf-8"), "text/html; charset=utf-8")
+                return
+
+            if self.path == "/render/stream":
+                self._stream_render(details_data)
+                return
+
+            job_name = uuid.uuid4().hex
+            output_dir = os.path.join(SERVICE_OUTPUT_DIR, job_name)
+            metrics.QUEUE_DEPTH.inc(queue="service_jobs")
+            try:
+                _, pdf_path, elapsed, job_cache_stats, job_metrics = pool.apply(
+                    render, ((job_name, config_data, details_data, output_dir),))
+                job_done(elapsed, job_metrics)
+                total_cache_stats = add_cache_stats(job_cache_stats)
+                if not pdf_path:
+                    self._send_error_json(500, "Rendering failed")
+                    return
+                with open(pdf_path, "rb") as f:
+                    pdf_bytes = f.read()
+                print(f"Service job {job_name} rendered in {elapsed:.2f}s ({len(pdf_bytes)} bytes); "
+                      f"{job_cache_stats['hits']} cached page(s), page cache overall: {page_cache.format_stats(total_cache_stats)}")
+                self._send(200, pdf_bytes, "application/pdf")
+            finally:
+                metrics.QUEUE_DEPTH.dec(queue="service_jobs")
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+    server = ThreadingHTTPServer((host, port), RenderHandler)
+    endpoints = (["/render"] + (["/render/stream"] if stream is not None else []) + (["/preview"] if preview is not None else [])
+                 + ["/metrics"])
+    print(f"Render service listening on http://{host}:{port} ({', '.join(endpoints)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down render service.")
+    finally:
+        server.server_close()
+        pool.terminate()
+        pool.join()
+        if manager is not None:
+            manager.shutdown()
@@ -0,0 +1,186 @@
+import gc
+import os
+import time
+import tracemalloc
+from collections import namedtuple
+
+# Soak (leak) harness. Renders the same job many times in one process and,
+# between iterations, samples the Python heap (tracemalloc), the resident set
+# size and the open file descriptors. The first iterations only warm up: the
+# font, icon, sprite and asset caches fill on them by design. Growth is
+# measured from the heap snapshot taken after warm-up, reported by allocation
+# site (the innermost frame in this project, so allocations inside Pillow or
+# the standard library point back at the page code that made them), and the
+# run fails when the heap, RSS or descriptor count grew past its threshold.
+# RSS is judged over the second half of the run only: the allocator settles
+# in steps (a new 64 MiB malloc arena for a thread) that stop, while a leak
+# keeps growing. Samples are spread over the run (SOAK_SAMPLES of them), so
+# there is a midway sample to judge from however many iterations run.
+
+SOAK_WARMUP = 3                          # Iterations run before the baseline is taken
+SOAK_SAMPLES = 10                        # Samples taken after the baseline (at most one per iteration)
+SOAK_TRACE_FRAMES = 16                   # Frames kept per traced allocation
+SOAK_TOP_SITES = 10                      # Allocation sites listed in the report
+MAX_TRACED_GROWTH = 8 * 1024 * 1024      # Bytes of Python heap growth allowed after warm-up
+MAX_RSS_GROWTH = 128 * 1024 * 1024       # Bytes of RSS growth allowed over the second half (allocator steps are 64 MiB)
+MAX_FD_GROWTH = 2                        # Open file descriptors allowed to be added after warm-up
+
+Sample = namedtuple("Sample", "iteration seconds traced_bytes rss_bytes open_fds")
+Sample.__doc__ = "Process state after an iteration (rss_bytes/open_fds are None where the platform can't tell)."
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def rss_bytes():
+    """Current resident set size of this process, or None if unknown (Linux only)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def open_fds():
+    """Number of open file descriptors of this process, or None if unknown."""
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(fd_dir)) - 1 # Less the descriptor listdir itself opened
+        except OSError:
+            continue
+    return None
+
+def take_sample(iteration: int, start: float) -> Sample:
+    gc.collect() # Only leaks should remain, not garbage waiting for a collection
+    traced, _ = tracemalloc.get_traced_memory()
+    return Sample(iteration, round(time.perf_counter() - start, 3), traced, rss_bytes(), open_fds())
+
+def _site(traceback) -> str:
+    # Innermost frame in this project, else the innermost frame (tracebacks run oldest frame first)
+    frames = list(traceback)[::-1]
+    for frame in frames:
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_PROJECT_DIR + os.sep) and path != os.path.abspath(__file__):
+            return f"{os.path.relpath(path, _PROJECT_DIR)}:{frame.lineno}"
+    return f"{frames[0].filename}:{frames[0].lineno}"
+
+def growth_by_site(baseline, snapshot, top: int = SOAK_TOP_SITES) -> list:
+    """The allocation sites whose live memory grew most between two tracemalloc snapshots.
+
+    Returns [{"site", "bytes", "blocks"}], largest growth first.
+    """
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    sites = {}
+    for stat in snapshot.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), "traceback"):
+        site = sites.setdefault(_site(stat.traceback), {"bytes": 0, "blocks": 0})
+        site["bytes"] += stat.size_diff
+        site["blocks"] += stat.count_diff
+    ranked = sorted(sites.items(), key=lambda item: item[1]["bytes"], reverse=True)
+    return [{"site": site, **counts} for site, counts in ranked[:top] if counts["bytes"] > 0]
+
+def run_soak(render_once, iterations: int, warmup: int = SOAK_WARMUP, sample_every: int = None,
+             max_traced_growth: int = MAX_TRACED_GROWTH, max_rss_growth: int = MAX_RSS_GROWTH,
+             max_fd_growth: int = MAX_FD_GROWTH) -> dict:
+    """Calls render_once(iteration) `iterations` times and checks the process doesn't grow.
+
+    `render_once` returns True if the iteration succeeded. A sample is taken
+    every `sample_every` iterations (default: SOAK_SAMPLES over the run). Returns the report:
+    samples, growth since the post-warm-up baseline, the top allocation sites
+    of that growth, failed iterations, threshold failures and "ok".
+    """
+    start = time.perf_counter()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(SOAK_TRACE_FRAMES)
+    samples = []
+    failed_iterations = []
+    try:
+        warmup = max(0, min(warmup, iterations - 1))
+        if sample_every is None:
+            sample_every = (iterations - warmup) // SOAK_SAMPLES
+        for iteration in range(warmup):
+            if not render_once(iteration):
+                failed_iterations.append(iteration)
+        baseline_sample = take_sample(warmup, start)
+        baseline = tracemalloc.take_snapshot()
+        samples.append(baseline_sample)
+        print(f"Soak baseline after {warmup} warm-up iteration(s): {_format_sample(baseline_sample)}")
+        for iteration in range(warmup, iterations):
+            if not render_once(iteration):
+                failed_iterations.append(iteration)
+            done = iteration + 1
+            if done == iterations or (done - warmup) % max(1, sample_every) == 0:
+                sample = take_sample(done, start)
+                samples.append(sample)
+                print(f"Soak iteration {done}/{iterations}: {_format_sample(sample, baseline_sample)}")
+        final = samples[-1]
+        sites = growth_by_site(baseline, tracemalloc.take_snapshot())
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    growth = _growth(baseline_sample, final)
+    midway = samples[(len(samples) - 1) // 2]
+    late_growth = _growth(midway, final)
+    measured = max(1, iterations - warmup)
+    failures = []
+    if growth["traced_bytes"] > max_traced_growth:
+        failures.append(f"Python heap grew {growth['traced_bytes'] / 1048576:.1f} MiB "
+                        f"(limit {max_traced_growth / 1048576:.1f} MiB)")
+    if late_growth["rss_bytes"] is not None and late_growth["rss_bytes"] > max_rss_growth:
+        failures.append(f"RSS grew {late_growth['rss_bytes'] / 1048576:.1f} MiB from iteration {midway.iteration} "
+                        f"(limit {max_rss_growth / 1048576:.1f} MiB)")
+    if growth["open_fds"] is not None and growth["open_fds"] > max_fd_growth:
+        failures.append(f"{growth['open_fds']} more open file descriptors (limit {max_fd_growth})")
+    if failed_iterations:
+        failures.append(f"{len(failed_iterations)} of {iterations} iteration(s) failed to render")
+    return {
+        "iterations": iterations,
+        "warmup": warmup,
+        "seconds": round(time.perf_counter() - start, 3),
+        "samples": [sample._asdict() for sample in samples],
+        "growth": growth,
+        "late_growth": {"since_iteration": midway.iteration, **late_growth},
+        "growth_per_iteration": {name: (round(value / measured, 1) if value is not None else None)
+                                 for name, value in growth.items()},
+        "top_sites": sites,
+        "failed_iterations": failed_iterations,
+        "failures": failures,
+        "ok": not failures,
+    }
+
+def _growth(before: Sample, after: Sample) -> dict:
+    def diff(name):
+        a, b = getattr(after, name), getattr(before, name)
+        return a - b if a is not None and b is not None else None
+    return {name: diff(name) for name in ("traced_bytes", "rss_bytes", "open_fds")}
+
+def _format_sample(sample: Sample, baseline: Sample = None) -> str:
+    def delta(value, base, scale=1, unit=""):
+        if value is None:
+            return "n/a"
+        text = f"{value / scale:.1f}{unit}" if scale != 1 else f"{value}{unit}"
+        if baseline is not None and base is not None:
+            text += f" ({(value - base) / scale:+.1f}{unit})" if scale != 1 else f" ({value - base:+d})"
+        return text
+    return (f"heap {delta(sample.traced_bytes, baseline and baseline.traced_bytes, 1048576, ' MiB')}, "
+            f"RSS {delta(sample.rss_bytes, baseline and baseline.rss_bytes, 1048576, ' MiB')}, "
+            f"fds {delta(sample.open_fds, baseline and baseline.open_fds)}, {sample.seconds:.1f}s")
+
+def print_report(report: dict):
+    """Prints the growth summary, the top allocation sites and the verdict."""
+    growth = report["growth"]
+    print(f"--- Soak: {report['iterations']} iteration(s) in {report['seconds']:.1f}s "
+          f"(growth measured over the {report['iterations'] - report['warmup']} after warm-up) ---")
+    rss = f"{growth['rss_bytes'] / 1048576:+.2f} MiB" if growth["rss_bytes"] is not None else "n/a"
+    fds = f"{growth['open_fds']:+d}" if growth["open_fds"] is not None else "n/a"
+    late = report["late_growth"]
+    if late["rss_bytes"] is not None:
+        rss += f" ({late['rss_bytes'] / 1048576:+.2f} MiB since iteration {late['since_iteration']})"
+    print(f"  Python heap {growth['traced_bytes'] / 1048576:+.2f} MiB, RSS {rss}, open file descriptors {fds}")
+    if report["top_sites"]:
+        print("  Heap growth by allocation site:")
+        for site in report["top_sites"]:
+            print(f"    {site['bytes'] / 1024:+10.1f} KiB {site['blocks']:+7d} blocks  {site['site']}")
+    if report["ok"]:
+        print("Soak passed: no growth past the thresholds.")
+    else:
+        for failure in report["failures"]:
+            print(f"Error: Soak failed: {failure}")
@@ -0,0 +1,113 @@
+import functools
+
+from core import display_list
+from core import fonts as font_cache
+
+# Fit-to-box text sizing. fit_font / fit_text find the largest size of a font
+# (up to the size it was loaded at) at which text fits a box. Text width scales
+# linearly with the font size, so the binary search runs on word widths
+# measured once at the font's own size: each probe is arithmetic, not a font
+# load and a textbbox. Only the chosen size is then loaded and measured for
+# real, stepping down a size in the rare case hinting makes it a pixel too
+# wide. Word widths are memoized per (face, size), so refitting is cheap too.
+
+MIN_FIT_SIZE = 12
+DEFAULT_LINE_HEIGHT = 1.2 # Line advance as a multiple of the font size
+
+@functools.lru_cache(maxsize=16384)
+def _word_width(font, word: str) -> float:
+    return font.getlength(word)
+
+def _wrap(words: list, widths: list, space: float, max_width: float) -> list:
+    # Greedy wrap into [(line words, line width)]
+    lines, line, line_w = [], [], 0.0
+    for word, width in zip(words, widths):
+        if line and line_w + space + width > max_width:
+            lines.append((line, line_w))
+            line, line_w = [], 0.0
+        line_w = line_w + space + width if line else width
+        line.append(word)
+    if line:
+        lines.append((line, line_w))
+    return lines
+
+def _box_fits(wrapped: list, size: int, max_width, max_lines, max_height, line_height) -> bool:
+    if any(line_w > max_width for lines in wrapped for _, line_w in lines):
+        return False
+    if max_lines is not None and any(len(lines) > max_lines for lines in wrapped):
+        return False
+    if max_height is not None:
+        total_lines = sum(max(1, len(lines)) for lines in wrapped) # An empty item still takes a line
+        if total_lines * line_height * size > max_height:
+            return False
+    return True
+
+def _largest_size(fits, min_size: int, max_size: int) -> int:
+    # Largest size in [min_size, max_size] for which fits(size) holds (min_size if none)
+    if fits(max_size):
+        return max_size
+    lo, hi = min_size, max_size - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if fits(mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def fit_font(font, text, max_width: float, min_size: int = MIN_FIT_SIZE):
+    """`font` at the largest size (up to its own) at which `text` is at most max_width wide.
+
+    `text` is a line or a list of lines (the widest one counts). Below
+    min_size the font is returned at min_size even if the text still overflows.
+    """
+    lines = [text] if isinstance(text, str) else list(text)
+    measure = display_list.measurer()
+    def widest(sized):
+        return max((measure.textbbox((0, 0), line, font=sized)[2] for line in lines), default=0)
+
+    ref_width = widest(font)
+    if ref_width <= max_width:
+        return font
+    size = max(min_size, min(font.size - 1, int(font.size * max_width / ref_width)))
+    sized = font_cache.font_at_size(font, size)
+    while size > min_size and widest(sized) > max_width:
+        size -= 1
+        sized = font_cache.font_at_size(font, size)
+    return sized
+
+def fit_text(font, text, max_width: float, max_lines: int = None, max_height: float = None,
+             line_height: float = DEFAULT_LINE_HEIGHT, min_size: int = MIN_FIT_SIZE):
+    """Wraps `text` at the largest size of `font` (up to its own) that fits the box.
+
+    `text` is a string or a list of paragraphs (e.g. list items). Lines are at
+    most max_width wide, each paragraph takes at most max_lines lines, and all
+    lines together, line_height * size apart, at most max_height. Returns
+    (font at that size, lines), lines being a list per paragraph when a list
+    was given. Below min_size the text is returned at min_size even if it overflows.
+    """
+    paragraphs = [text] if isinstance(text, str) else list(text)
+    words = [paragraph.split() for paragraph in paragraphs]
+    ref_size = font.size
+    ref_widths = [[_word_width(font, word) for word in paragraph] for paragraph in words]
+    ref_space = _word_width(font, " ")
+
+    def estimate_fits(size):
+        scale = size / ref_size
+        wrapped = [_wrap(paragraph, [w * scale for w in widths], ref_space * scale, max_width)
+                   for paragraph, widths in zip(words, ref_widths)]
+        return _box_fits(wrapped, size, max_width, max_lines, max_height, line_height)
+
+    measure = display_list.measurer()
+    size = _largest_size(estimate_fits, min(min_size, ref_size), ref_size)
+    while True:
+        sized = font_cache.font_at_size(font, size)
+        wrapped = [_wrap(paragraph, [_word_width(sized, word) for word in paragraph], _word_width(sized, " "), max_width)
+                   for paragraph in words]
+        # Final check with real line measurements, the way the pages measure them
+        lines = [[" ".join(line_words) for line_words, _ in paragraph] for paragraph in wrapped]
+        measured = [[(None, measure.textbbox((0, 0), line, font=sized)[2]) for line in paragraph] for paragraph in lines]
+        if size <= min_size or _box_fits(measured, size, max_width, max_lines, max_height, line_height):
+            break
+        size -= 1
+    return sized, (lines[0] if isinstance(text, str) else lines)
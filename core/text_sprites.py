@@ -0,0 +1,136 @@
+import math
+import threading
+from collections import OrderedDict, namedtuple
+
+from core import metrics
+
+# Text sprite cache. Rasterizing a string with FreeType is the expensive part
+# of ImageDraw.text; the same labels ("Day 3", "INCLUDED", "10:00 AM", ...)
+# are rasterized again on every page and job. draw_text() is a drop-in for
+# ImageDraw.text that keeps the rendered coverage (alpha) mask of each run in
+# a bounded LRU cache, so repeat draws are just a masked fill of the stored
+# mask, the same draw_bitmap step ImageDraw.text ends with.
+#
+# Masks hold coverage only, so the fill and stroke colours are applied at
+# paint time and are not part of the key: one sprite serves every colour
+# (e.g. a text shadow and the text drawn over it). The key is the font
+# object, text, mask mode, stroke width, anchor and sub-pixel start offset.
+
+TEXT_SPRITE_CACHE_ENTRIES = 1024
+TEXT_SPRITE_CACHE_BYTES = 64 * 1024 * 1024
+
+Sprite = namedtuple("Sprite", "mask offset bbox")
+Sprite.__doc__ = "A rasterized text run: core mask image, offset from the draw origin, and bbox relative to that origin."
+
+class SpriteCache:
+    """Bounded LRU cache of text sprites with hit/miss/eviction counters."""
+
+    def __init__(self, max_entries: int = TEXT_SPRITE_CACHE_ENTRIES, max_bytes: int = TEXT_SPRITE_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is None:
+                self.misses += 1
+                return None
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+
+    def put(self, key, sprite: Sprite):
+        size = sprite.mask.size[0] * sprite.mask.size[1]
+        if size > self.max_bytes:
+            return # Larger than the whole budget; never cached
+        with self._lock:
+            if key in self._sprites:
+                return
+            self._sprites[key] = sprite
+            self.bytes += size
+            while len(self._sprites) > self.max_entries or self.bytes > self.max_bytes:
+                _, old = self._sprites.popitem(last=False)
+                self.bytes -= old.mask.size[0] * old.mask.size[1]
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._sprites),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._sprites.clear()
+            self.bytes = 0
+
+_cache = SpriteCache()
+
+def get_cache() -> SpriteCache:
+    """The process-wide sprite cache."""
+    return _cache
+
+def _collect_metrics():
+    counts = _cache.stats()
+    metrics.CACHE_LOOKUPS.sync(counts["hits"], cache="text_sprites", result="hit")
+    metrics.CACHE_LOOKUPS.sync(counts["misses"], cache="text_sprites", result="miss")
+
+metrics.add_collector(_collect_metrics)
+
+def get_sprite(font, text: str, mode: str = "L", stroke_width: float = 0, anchor: str = None, start=(0.0, 0.0)) -> Sprite:
+    """Returns the (cached) sprite of `text` rasterized with `font`."""
+    key = (font, text, mode, stroke_width, anchor, start)
+    sprite = _cache.get(key)
+    if sprite is None:
+        mask, offset = font.getmask2(text, mode, stroke_width=stroke_width, stroke_filled=True, anchor=anchor, start=start)
+        width, height = mask.size
+        sprite = Sprite(mask, offset, (offset[0], offset[1], offset[0] + width, offset[1] + height))
+        _cache.put(key, sprite)
+    return sprite
+
+def draw_text(draw, xy, text: str, fill=None, font=None, anchor: str = None, stroke_width: float = 0, stroke_fill=None):
+    """Draws single-line text like ImageDraw.text, reusing cached sprites.
+
+    Produces the same pixels as draw.text(). Multiline text, fonts without
+    getmask2 (bitmap fonts) and the default font fall back to draw.text.
+    """
+    if font is None or not hasattr(font, "getmask2") or "\n" in text:
+        draw.text(xy, text, fill=fill, font=font, anchor=anchor, stroke_width=stroke_width, stroke_fill=stroke_fill)
+        return
+
+    def getink(color):
+        # Same colour resolution as ImageDraw.text
+        ink, fill_ink = draw._getink(color)
+        return fill_ink if ink is None else ink
+
+    coord = (int(xy[0]), int(xy[1]))
+    start = (math.modf(xy[0])[0], math.modf(xy[1])[0])
+
+    def paint(ink, width):
+        sprite = get_sprite(font, text, draw.fontmode, width, anchor, start)
+        draw.draw.draw_bitmap((coord[0] + sprite.offset[0], coord[1] + sprite.offset[1]), sprite.mask, ink)
+
+    ink = getink(fill)
+    if ink is None:
+        return
+    stroke_ink = None
+    if stroke_width:
+        stroke_ink = getink(stroke_fill) if stroke_fill is not None else ink
+    if stroke_ink is not None:
+        paint(stroke_ink, stroke_width)
+        if ink != stroke_ink:
+            paint(ink, 0)
+    else:
+        paint(ink, 0)
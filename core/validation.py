@@ -0,0 +1,67 @@
+from core import asset_index
+
+# Fail-fast job validation. The config compilers and the itinerary parser
+# collect every problem they find (with its JSON path) into one
+# ValidationError; a ValidationReport gathers those together with checks that
+# referenced asset files exist, so a bad job is rejected in milliseconds,
+# before any page is drawn, with all of its problems listed at once.
+
+class ValidationError(ValueError):
+    """Invalid input; `problems` lists each one as "<json path>: <problem>"."""
+
+    def __init__(self, title: str, problems: list):
+        self.title = title
+        self.problems = list(problems)
+        super().__init__(title + ":\n  " + "\n  ".join(self.problems))
+
+class ValidationReport:
+    """Errors (the job can't be rendered as given) and warnings (it renders with fallbacks)."""
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def error(self, path: str, problem: str):
+        self.errors.append(f"{path}: {problem}")
+
+    def warn(self, path: str, problem: str):
+        self.warnings.append(f"{path}: {problem}")
+
+    def add(self, exc: ValidationError):
+        """Records the problems of a ValidationError as errors."""
+        self.errors.extend(exc.problems)
+
+    def check(self, fn, *args):
+        """Returns fn(*args), recording its problems instead if it raises ValidationError."""
+        try:
+            return fn(*args)
+        except ValidationError as e:
+            self.add(e)
+            return None
+
+    def check_asset(self, path: str, file_path, required: bool = True, any_extension: bool = False):
+        """Checks that a referenced file exists (local paths only; URLs are not fetched).
+
+        `any_extension` also accepts the file under another image extension,
+        as the page generators do. Missing required files are errors, others warnings.
+        """
+        if not isinstance(file_path, str) or file_path.startswith(("http://", "https://")):
+            return
+        if any_extension:
+            found = asset_index.resolve(file_path) is not None
+        else:
+            found = asset_index.exists(file_path)
+        if not found:
+            (self.error if required else self.warn)(path, f"file not found: {file_path}")
+
+    def print(self, name: str = "job"):
+        for warning in self.warnings:
+            print(f"Warning: {warning}")
+        if self.errors:
+            print(f"Error: {name} failed validation with {len(self.errors)} problem(s):")
+            for error in self.errors:
+                print(f"  - {error}")
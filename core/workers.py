@@ -0,0 +1,37 @@
+import gc
+import multiprocessing
+import os
+import signal
+
+# Pre-fork ("zygote") worker pool. The parent imports the page generators and
+# loads fonts/icons first, then forks its workers, so every child starts with
+# that state already in memory and shares the pages copy-on-write.
+
+def _init_worker(preload=None, preload_args=()):
+    # Ctrl-C is handled by the parent, which tears the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if preload is not None:
+        preload(*preload_args)
+
+def pool_size(num_workers: int = None) -> int:
+    """Number of workers create_worker_pool(num_workers) starts."""
+    return num_workers or os.cpu_count() or 1
+
+def create_worker_pool(num_workers: int = None, preload=None, preload_args=()):
+    """Creates a multiprocessing pool whose workers inherit preloaded render state.
+
+    `preload(*preload_args)` runs once in the parent before any worker is
+    forked. Where fork is unavailable (Windows) it runs in each worker instead,
+    via the pool initializer.
+    """
+    num_workers = pool_size(num_workers)
+    if "fork" in multiprocessing.get_all_start_methods():
+        if preload is not None:
+            preload(*preload_args)
+        # Move everything loaded so far out of the GC's tracked generations so
+        # collections in the children don't write to (and un-share) those pages
+        gc.collect()
+        gc.freeze()
+        ctx = multiprocessing.get_context("fork")
+        return ctx.Pool(processes=num_workers, initializer=_init_worker)
+    return multiprocessing.Pool(processes=num_workers, initializer=_init_worker, initargs=(preload, preload_args))
@@ -0,0 +1,91 @@
+from core.frozen import Frozen, as_color, as_int, as_int_pair, as_number, as_text, compile_fields
+from core.validation import ValidationError
+
+# Compiled daywise_config. The JSON section is read and checked once per job
+# and turned into an immutable DaywiseConfig, with the layout values the draw
+# functions need precomputed, so drawing does no dict lookups or list->tuple
+# conversions and one config can be shared by concurrent jobs.
+
+PANEL_COUNT = 2 # Day panels per page
+
+# (attribute, daywise_config key, default, check)
+_FIELDS = (
+    ("page_w", "PAGE_W", 2480, as_int),
+    ("page_h", "PAGE_H", 3508, as_int),
+    ("panel_w", "PANEL_W", 1240, as_int),
+    ("page_bg_color", "PAGE_BG_COLOR", [246, 235, 215], as_color),
+    ("content_top_margin", "CONTENT_TOP_MARGIN", 2087, as_int),
+    ("out_dir", "OUT_DIR_NAME", "outputs", as_text),
+    ("inputs_dir", "INPUTS_DIR_NAME", "inputs", as_text),
+    ("gap_width", "GAP_WIDTH", 40, as_int),
+    ("jag_amplitude", "JAG_AMPLITUDE", 10, as_number),
+    ("segment_length", "SEGMENT_LENGTH", 20, as_number),
+    ("hero_text_color", "HERO_OVERLAY_TEXT_COLOR", [246, 235, 215, 220], as_color),
+    ("headline_num_lines", "HEADLINE_NUM_LINES", 3, as_int),
+    ("headline_spacing_ratio", "HEADLINE_LINE_SPACING_RATIO", 1.2, as_number),
+    ("timeline_page_margin", "TIMELINE_PAGE_MARGIN", 50, as_int),
+    ("bottom_margin", "BOTTOM_MARGIN", 20, as_int),
+    ("timeline_text_color", "TIMELINE_TEXT_COLOR", [255, 255, 255], as_color),
+    ("activity_time_color", "ACTIVITY_TIME_COLOR", [220, 220, 220], as_color),
+    ("activity_subtitle_color", "ACTIVITY_SUBTITLE_COLOR", [235, 230, 220], as_color),
+    ("output_quality", "OUTPUT_QUALITY", 95, as_int),
+    ("output_dpi", "OUTPUT_DPI", [300, 300], as_int_pair),
+)
+
+class DaywiseConfig(Frozen):
+    """Immutable, validated daywise_config with derived layout values."""
+    __slots__ = tuple(attr for attr, _, _, _ in _FIELDS) + (
+        "font_paths",         # ((key, path), ...) from daywise_config.font_paths
+        # Derived values
+        "panel_x",            # Left edge of each panel on the page
+        "num_y",              # Top of the "Day N" number
+        "headline_y_start",   # Vertical centre of the headline block
+        "activities_start_y", # Top of the first schedule item
+        "page_bottom_limit",  # Activities must end above this
+        "effective_margin",   # Horizontal text margin within a panel
+        "content_width",      # Wrap width of activity text
+        "divider_width",      # Length of the divider between schedule items
+    )
+
+    def font_path(self, key: str):
+        """Path configured for a font key, or None."""
+        for font_key, path in self.font_paths:
+            if font_key == key:
+                return path
+        return None
+
+def compile_daywise_config(config_data) -> DaywiseConfig:
+    """Validates daywise_config and compiles it into a DaywiseConfig.
+
+    Raises ValidationError (a ValueError) listing every invalid key. A DaywiseConfig is returned as is.
+    """
+    if isinstance(config_data, DaywiseConfig):
+        return config_data
+    errors = []
+    values = compile_fields("daywise_config", config_data, _FIELDS, errors)
+
+    font_paths = config_data.get("font_paths", {})
+    if not isinstance(font_paths, dict):
+        errors.append(f"daywise_config.font_paths: expected an object, got {font_paths!r}")
+        font_paths = {}
+    for key, path in font_paths.items():
+        if not isinstance(path, str):
+            errors.append(f"daywise_config.font_paths.{key}: expected a string, got {path!r}")
+    if errors:
+        raise ValidationError("Invalid daywise_config", errors)
+
+    values["font_paths"] = tuple(sorted(font_paths.items()))
+    panel_w, page_h = values["panel_w"], values["page_h"]
+    effective_margin = values["timeline_page_margin"] - 20
+    content_width = panel_w - 2 * effective_margin
+    values.update(
+        panel_x=tuple(i * panel_w for i in range(PANEL_COUNT)),
+        num_y=int(values["content_top_margin"] * 0.05),
+        headline_y_start=int(values["content_top_margin"] * 0.75),
+        activities_start_y=page_h * 0.53, # Start activities drawing lower down
+        page_bottom_limit=page_h - values["bottom_margin"],
+        effective_margin=effective_margin,
+        content_width=content_width,
+        divider_width=content_width * 0.30,
+    )
+    return DaywiseConfig(**values)
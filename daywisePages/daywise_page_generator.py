@@ -2,72 +2,113 @@
 # Generates a portrait itinerary page with 1 or 2 days
 
 import os
-from PIL import Image, ImageDraw
+from concurrent.futures import ThreadPoolExecutor
 
 # Import drawing functions from the 'page2' subdirectory
 # We assume this import works correctly
 # from page2 import drawing # Old import
 from . import drawing # Updated relative import
+from .config import PANEL_COUNT, DaywiseConfig, compile_daywise_config
+from core import determinism, display_list, prefetch
+from core.display_list import DisplayList, Layer
+from core.itinerary import Day, to_days
+
+def resolve_hero_path(hero_image_path, input_dir_name: str):
+    """Joins a relative hero_image path from the details JSON onto the inputs directory."""
+    if hero_image_path and not os.path.isabs(hero_image_path) and not hero_image_path.startswith(('http://', 'https://')):
+        return os.path.join(input_dir_name, hero_image_path)
+    return hero_image_path
+
+def prefetch_daywise_page(days_data, config_data):
+    """Starts decoding and fitting the page's heroes on the prefetch threads."""
+    config = compile_daywise_config(config_data)
+    for day in to_days(days_data):
+        drawing.prefetch_hero(resolve_hero_path(day.hero_image, config.inputs_dir), config)
+
+def layout_panel(day: Day, panel_idx: int, config: DaywiseConfig) -> DisplayList:
+    """Lays out one day (hero, then activities) as a panel-sized display list."""
+    panel = DisplayList((config.panel_w, config.page_h), "RGB", config.page_bg_color)
+    try:
+        drawing.layout_hero_section(panel, day, panel_idx, config, origin_x=0)
+    except TypeError as e:
+        print(f"Error calling layout_hero_section (check signature?): {e}")
+    except Exception as e:
+        print(f"Error drawing hero section for Day {day.day}: {e}")
+
+    try:
+        drawing.layout_activities(panel, day, panel_idx, config, origin_x=0)
+    except TypeError as e:
+        print(f"Error calling layout_activities (check signature?): {e}")
+    except Exception as e:
+        print(f"Error drawing activities for Day {day.day}: {e}")
+    return panel
+
+def layout_daywise_page(days_data, config_data) -> DisplayList:
+    """Lays out a page with up to two days as a display list (see generate_daywise_page)."""
+    config = compile_daywise_config(config_data)
+    days = to_days(days_data)
+    page = DisplayList((config.page_w, config.page_h), "RGB", config.page_bg_color)
+
+    input_dir_name = config.inputs_dir
+    
+    # Panels draw from copies with the hero path resolved onto the inputs dir
+    panel_days = []
+    for day in days[:PANEL_COUNT]:
+        if day.hero_image:
+            day = day.replace(hero_image=resolve_hero_path(day.hero_image, input_dir_name))
+        else:
+            print(f"Warning: 'hero_image' missing for day {day.day}")
+        panel_days.append(day)
+
+    if len(days) < 1:
+        print("Warning: No day data provided to generate_daywise_page.")
+
+    # The two panels cover disjoint halves of the page, so each is laid out
+    # as its own layer concurrently (mostly waiting on the hero prefetch)
+    if panel_days:
+        with ThreadPoolExecutor(max_workers=len(panel_days), thread_name_prefix="daywise-panel") as executor:
+            futures = [executor.submit(layout_panel, day, idx, config) for idx, day in enumerate(panel_days)]
+            for idx, future in enumerate(futures):
+                page.add(Layer(future.result(), (config.panel_x[idx], 0), None))
+    return page
+
+def check_daywise_page(days_data, config_data, report):
+    """Measures a page's headlines and schedules into `report` (a LayoutReport), without loading heroes."""
+    config = compile_daywise_config(config_data)
+    for idx, day in enumerate(to_days(days_data)[:PANEL_COUNT]):
+        panel = DisplayList((config.panel_w, config.page_h), "RGB", config.page_bg_color)
+        drawing.layout_hero_text(panel, day, idx, config, origin_x=0, report=report)
+        drawing.layout_activities(panel, day, idx, config, origin_x=0, report=report)
 
 # ================= Main Execution =================
 
 # Modified to accept a list of day data dictionaries (max 2) and config data
 # def generate_page2(days_data: list[dict], config_data: dict, output_filename: str): # Old name
-def generate_daywise_page(days_data: list[dict], config_data: dict, output_filename: str):
-    """Generates an itinerary page with up to two days from provided data and config."""
-    output_dir_name = config_data.get("OUT_DIR_NAME", "outputs")
+def generate_daywise_page(days_data, config_data, output_filename: str):
+    """Generates an itinerary page with up to two days from provided data and config.
+
+    `days_data` are Day records (raw day dicts are parsed); `config_data` is
+    a DaywiseConfig, or a daywise_config dict compiled here. The inputs are
+    not modified. Returns the rendered RGB page image.
+    """
+    config = compile_daywise_config(config_data)
+    output_dir_name = config.out_dir
     os.makedirs(output_dir_name, exist_ok=True)
-    
-    page_w = config_data.get("PAGE_W", 2480)
-    page_h = config_data.get("PAGE_H", 3508)
-    bg_color = tuple(config_data.get("PAGE_BG_COLOR", [246, 235, 215]))
-    
-    page = Image.new("RGB", (page_w, page_h), bg_color)
-    draw = ImageDraw.Draw(page)
 
-    input_dir_name = config_data.get("INPUTS_DIR_NAME", "inputs")
-    
-    for idx, day_data in enumerate(days_data):
-        hero_image_path = day_data.get('hero_image')
-        if hero_image_path and not os.path.isabs(hero_image_path) and not hero_image_path.startswith(('http://', 'https://')):
-             day_data['hero_image'] = os.path.join(input_dir_name, hero_image_path)
-        elif not hero_image_path:
-            print(f"Warning: 'hero_image' missing for day {day_data.get('day', f'#{idx+1}')}")
-            day_data['hero_image'] = None
-
-        try:
-            drawing.draw_hero_section(page, draw, day_data, idx, config_data)
-        except TypeError as e:
-            print(f"Error calling draw_hero_section (check signature?): {e}")
-        except Exception as e:
-            print(f"Error drawing hero section for Day {day_data.get('day', f'#{idx+1}')}: {e}")
-
-    if len(days_data) >= 1:
-        try:
-            drawing.draw_activities(draw, days_data[0], 0, config_data)
-        except TypeError as e:
-            print(f"Error calling draw_activities (check signature?): {e}")
-        except Exception as e:
-            print(f"Error drawing activities for Day {days_data[0].get('day', '#1')}: {e}")
-            
-    if len(days_data) == 2:
-        try:
-            drawing.draw_activities(draw, days_data[1], 1, config_data)
-        except TypeError as e:
-             print(f"Error calling draw_activities (check signature?): {e}")
-        except Exception as e:
-            print(f"Error drawing activities for Day {days_data[1].get('day', '#2')}: {e}")
-    elif len(days_data) < 1:
-        print("Warning: No day data provided to generate_daywise_page.")
+    # The panel layers are painted concurrently (Pillow drops the GIL in the
+    # heavy resize, mask and paste work) and pasted into place afterwards
+    page = display_list.paint(layout_daywise_page(days_data, config), threads=PANEL_COUNT)
 
     output_path = os.path.join(output_dir_name, output_filename)
     try:
-        quality = config_data.get("OUTPUT_QUALITY", 95)
-        dpi_tuple = tuple(config_data.get("OUTPUT_DPI", [300, 300]))
-        page.save(output_path, "JPEG", quality=quality, dpi=dpi_tuple)
-        print(f"Page saved: {output_path}")
+        quality = config.output_quality
+        dpi_tuple = config.output_dpi
+        # Encoded on a background thread; generate_itinerary waits for it before the PDF
+        prefetch.when_saved(output_path, lambda path: print(f"Page saved: {path}"))
+        prefetch.save_image(page, output_path, "JPEG", **determinism.jpeg_save_kwargs(quality, dpi_tuple))
     except Exception as e:
         print(f"Error saving page {output_path}: {e}")
+    return page
 
 # Example direct execution block (commented out)
 # if __name__ == "__main__":
@@ -1,24 +1,26 @@
 import os
-import random
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
+from PIL import Image, ImageDraw
 
+from core import asset_index, color_stats, determinism, display_list, prefetch, preview, raw_assets, text_fit
+from core.display_list import DisplayList, Layer, Line, Paste, Text
+from core.itinerary import Day
+from core import fonts as font_cache
 from . import utils
+from .config import DaywiseConfig
 
-def load_daywise_fonts(config_data: dict):
+def load_daywise_fonts(config: DaywiseConfig):
     """Loads fonts specified in the daywise_config."""
     fonts = {}
-    font_paths = config_data.get("font_paths", {})
-    default_font = ImageFont.load_default()
+    default_font = font_cache.default_font()
     
     def get_font(key, size, default_path_key=None):
-        path = font_paths.get(key)
+        path = config.font_path(key)
         if not path and default_path_key:
-             path = font_paths.get(default_path_key) # fallback key
+             path = config.font_path(default_path_key) # fallback key
         
         if path:
             try:
-                return ImageFont.truetype(path, size)
+                return font_cache.get_font(path, size)
             except IOError as e:
                 print(f"Warning: Font not found at '{path}' for key '{key}': {e}. Using default.")
                 return default_font
@@ -38,103 +40,97 @@ def load_daywise_fonts(config_data: dict):
     
     return fonts
 
-def draw_hero_section(page: Image.Image, draw: ImageDraw.ImageDraw, day_data: dict, panel_idx: int, config_data: dict):
-    """Draws the hero image, number, and title for one day panel."""
+def load_fitted_hero(hero_path: str, panel_w: int, page_h: int):
+    """Decodes a hero and scales it to the panel width (or page height, if that is the tighter fit).
+
+    Returns (resized image, True if it was fitted to the page height).
+    """
+    with raw_assets.open_image(hero_path) as hero_img:
+        orig_w, orig_h = hero_img.size
+        scale = panel_w / orig_w
+        new_h = int(orig_h * scale)
+        if new_h > page_h:
+            # Image is taller than page height after scaling to width
+            scale = page_h / orig_h
+            new_w_corrected = int(orig_w * scale)
+            size, fitted_to_height = (new_w_corrected, page_h), True
+        else:
+            # Image is shorter than page height after scaling to width
+            size, fitted_to_height = (panel_w, new_h), False
+        resized = preview.fit_image(hero_img, size, lambda img, size: img.resize(size, Image.Resampling.LANCZOS))
+        fitted = resized, fitted_to_height
+    preview.tag_source(fitted[0], "hero", preview.source_key(hero_path), panel_w, page_h)
+    return fitted
+
+def prefetch_hero(hero_path: str, config: DaywiseConfig):
+    """Starts decoding and fitting a day's hero in the background (see load_fitted_hero)."""
+    hero_entry = asset_index.resolve(hero_path) if isinstance(hero_path, str) else None
+    if hero_entry:
+        prefetch.prefetch(load_fitted_hero, hero_entry.path, config.panel_w, config.page_h)
+
+def layout_hero_section(dl: DisplayList, day: Day, panel_idx: int, config: DaywiseConfig, origin_x: int = None):
+    """Lays out the hero image, number, and title for one day panel into `dl`.
+
+    `origin_x` is the panel's left edge in `dl` (default: its position on
+    the full page, panel_idx * PANEL_W); pass 0 for a panel-sized list.
+    """
     
-    fonts = load_daywise_fonts(config_data)
-    NUM_FONT = fonts['NUM']
-    HEADLINE_FONT = fonts['HEADLINE']
+    fonts = load_daywise_fonts(config)
     PLACEHOLDER_FONT = fonts['PLACEHOLDER']
+    measure = display_list.measurer()
 
-    panel_w = config_data.get("PANEL_W", 1240)
-    page_h = config_data.get("PAGE_H", 3508)
-    page_bg_color = tuple(config_data.get("PAGE_BG_COLOR", [246, 235, 215]))
-    content_top_margin = config_data.get("CONTENT_TOP_MARGIN", 2087)
-    gap_width = config_data.get("GAP_WIDTH", 40)
-    jag_amplitude = config_data.get("JAG_AMPLITUDE", 10)
-    segment_length = config_data.get("SEGMENT_LENGTH", 20)
-    hero_text_color = tuple(config_data.get("HERO_OVERLAY_TEXT_COLOR", [246, 235, 215, 220]))
-    headline_num_lines = config_data.get("HEADLINE_NUM_LINES", 3)
-    headline_spacing_ratio = config_data.get("HEADLINE_LINE_SPACING_RATIO", 1.2)
+    panel_w = config.panel_w
+    page_h = config.page_h
+    page_bg_color = config.page_bg_color
+    gap_width = config.gap_width
 
-    x0 = panel_idx * panel_w
+    x0 = config.panel_x[panel_idx] if origin_x is None else origin_x
 
-    full_hero_path = day_data.get("hero_image")
-    hero_img = None
+    full_hero_path = day.hero_image
+    hero_fit = None
 
     if full_hero_path and isinstance(full_hero_path, str):
-        try:
-            hero_img = Image.open(full_hero_path)
-        except FileNotFoundError:
-             base_path_no_ext, _ = os.path.splitext(full_hero_path)
-             for ext in (".png", ".jpeg", ".jpg"):
-                 try:
-                     alt_path = base_path_no_ext + ext
-                     hero_img = Image.open(alt_path)
-                     full_hero_path = alt_path
-                     break 
-                 except FileNotFoundError:
-                     continue
-             if not hero_img:
-                  print(f"Warning: Hero image not found: {full_hero_path}")
-        except Exception as e:
-             print(f"Error opening hero image {full_hero_path}: {e}")
-             hero_img = None
+        # The index also finds the hero under another extension (e.g. .jpeg -> .png)
+        hero_entry = asset_index.resolve(full_hero_path)
+        if hero_entry is None:
+            print(f"Warning: Hero image not found: {full_hero_path}")
+        else:
+            full_hero_path = hero_entry.path
+            try:
+                # Usually already decoded and fitted by the prefetch threads
+                hero_fit = prefetch.fetch(load_fitted_hero, full_hero_path, panel_w, page_h)
+            except Exception as e:
+                print(f"Error opening hero image {full_hero_path}: {e}")
+                hero_fit = None
     else:
-        print(f"Warning: No valid hero_image path for Day {day_data.get('day')}")
+        print(f"Warning: No valid hero_image path for Day {day.day}")
 
-    final_image = None
-
-    if hero_img is None:
-        placeholder_img = Image.new("RGB", (panel_w, page_h), (128, 128, 128))
-        dph = ImageDraw.Draw(placeholder_img)
-        placeholder_text = f"Missing Image\\nDay {day_data.get('day', '?')}"
+    # The hero is composed on its own layer, then pasted through the jagged-edge mask
+    if hero_fit is None:
+        hero_layer = DisplayList((panel_w, page_h), "RGB", (128, 128, 128))
+        placeholder_text = f"Missing Image\\nDay {day.day}"
         if full_hero_path:
              placeholder_text += f"\\n({os.path.basename(full_hero_path)})"
-        try:
-            _, _, pw, ph = dph.textbbox((0, 0), placeholder_text, font=PLACEHOLDER_FONT, spacing=4)
-        except AttributeError:
-             pw, ph = dph.textsize(placeholder_text, font=PLACEHOLDER_FONT, spacing=4) # fallback
-        dph.text(((panel_w - pw)//2, (page_h - ph)//2), placeholder_text, font=PLACEHOLDER_FONT, fill="white", align="center")
-        print(f"Warning: Using placeholder for hero image Day {day_data.get('day', idx+1)}")
-        final_image = placeholder_img 
+        _, _, pw, ph = measure.textbbox((0, 0), placeholder_text, font=PLACEHOLDER_FONT, spacing=4)
+        hero_layer.add(Text(((panel_w - pw)//2, (page_h - ph)//2), placeholder_text, PLACEHOLDER_FONT, "white", None))
+        print(f"Warning: Using placeholder for hero image Day {day.day}")
 
     else:
-        orig_w, orig_h = hero_img.size
-        scale = panel_w / orig_w
-        new_h = int(orig_h * scale)
-        final_image_calc = None
+        hero_img_resized, fitted_to_height = hero_fit
+        alpha_mask = hero_img_resized.split()[-1] if hero_img_resized.mode == 'RGBA' else None
 
-        if new_h > page_h:
-             # Image is taller than page height after scaling to width
-             scale = page_h / orig_h
-             new_w_corrected = int(orig_w * scale)
-             hero_img_resized = hero_img.resize((new_w_corrected, page_h), Image.Resampling.LANCZOS)
-             final_image_calc = Image.new("RGBA", (panel_w, page_h), (0, 0, 0, 0))
+        if fitted_to_height:
+             new_w_corrected = preview.display_size(hero_img_resized)[0]
+             hero_layer = DisplayList((panel_w, page_h), "RGBA", (0, 0, 0, 0))
              paste_x = (panel_w - new_w_corrected) // 2
-             final_image_calc.paste(hero_img_resized, (paste_x, 0), hero_img_resized.split()[-1] if hero_img_resized.mode == 'RGBA' else None)
+             hero_layer.add(Paste(hero_img_resized, (paste_x, 0), alpha_mask))
         else:
-             # Image is shorter than page height after scaling to width
-             hero_img_resized = hero_img.resize((panel_w, new_h), Image.Resampling.LANCZOS)
-             sample_height = max(1, int(new_h * 0.05))
-             bottom_strip = hero_img_resized.crop((0, max(0, new_h - sample_height), panel_w, new_h))
+             new_h = preview.display_size(hero_img_resized)[1]
+             # Bottom-edge colour comes from the cached per-asset colour stats
              avg_color = page_bg_color
-             try:
-                stat = np.array(bottom_strip.convert("RGB"))
-                if stat.size > 0:
-                    avg_color = tuple(np.mean(stat.reshape(-1, 3), axis=0).astype(int))
-             except (ImportError, NameError, ValueError):
-                 # Fallback if numpy fails
-                 try:
-                     pixels = list(bottom_strip.convert("RGB").getdata())
-                     if pixels:
-                         avg_r = sum(p[0] for p in pixels) / len(pixels)
-                         avg_g = sum(p[1] for p in pixels) / len(pixels)
-                         avg_b = sum(p[2] for p in pixels) / len(pixels)
-                         avg_color = (int(avg_r), int(avg_g), int(avg_b))
-                 except Exception as avg_e:
-                      print(f"Warning: Could not calculate average color: {avg_e}")
-                      avg_color = page_bg_color
+             stats = color_stats.get_color_stats(full_hero_path)
+             if stats:
+                 avg_color = tuple(stats["edges"]["bottom"])
 
              gradient_h = page_h - new_h
              if gradient_h > 0:
@@ -150,113 +146,117 @@ def draw_hero_section(page: Image.Image, draw: ImageDraw.ImageDraw, day_data: di
                      b = int(start_color[2] * (1 - ratio) + end_color[2] * ratio)
                      gradient_draw.point((0, y), fill=(r, g, b))
                  full_gradient = gradient_strip.resize((panel_w, gradient_h), Image.Resampling.BILINEAR)
-                 base_img = Image.new("RGB", (panel_w, page_h), end_color)
-                 base_img.paste(full_gradient, (0, new_h))
-                 final_image_calc = base_img
+                 hero_layer = DisplayList((panel_w, page_h), "RGB", end_color)
+                 hero_layer.add(Paste(full_gradient, (0, new_h), None))
              else:
-                 final_image_calc = Image.new("RGB", (panel_w, page_h), avg_color)
-
-             alpha_mask = hero_img_resized.split()[-1] if hero_img_resized.mode == 'RGBA' else None
-             if alpha_mask:
-                 final_image_calc = final_image_calc.convert('RGBA')
-             final_image_calc.paste(hero_img_resized, (0, 0), alpha_mask)
-
-        final_image = final_image_calc
-
-    if final_image is None:
-         print(f"Error: final_image processing failed for Day {day_data.get('day')}. Creating fallback BG.")
-         final_image = Image.new("RGB", (panel_w, page_h), page_bg_color)
-
-    hero_img_final_rgba = final_image.convert("RGBA")
+                 hero_layer = DisplayList((panel_w, page_h), "RGB", avg_color)
+             hero_layer.add(Paste(hero_img_resized, (0, 0), alpha_mask))
 
     mask = Image.new("L", (panel_w, page_h), 0)
     mask_d = ImageDraw.Draw(mask)
     
     jag_config = {
-        "JAG_AMPLITUDE": jag_amplitude,
-        "SEGMENT_LENGTH": segment_length
+        "JAG_AMPLITUDE": config.jag_amplitude,
+        "SEGMENT_LENGTH": config.segment_length
     }
 
+    # Seeded from the panel inputs in deterministic mode, global random otherwise
+    rng = determinism.rng_for("daywise_hero", panel_idx, day, jag_config, panel_w, page_h, gap_width)
+
     if panel_idx == 0: # Left panel
         x_edge = panel_w - gap_width // 2
-        path = utils.generate_jagged_path(x_edge, 0, page_h, jag_config)
+        path = utils.generate_jagged_path(x_edge, 0, page_h, jag_config, rng=rng)
         poly = [(0, 0)] + path + [(0, page_h)]
     else: # Right panel
         x_edge = gap_width // 2
-        path = utils.generate_jagged_path(x_edge, 0, page_h, jag_config)
+        path = utils.generate_jagged_path(x_edge, 0, page_h, jag_config, rng=rng)
         poly = [(panel_w, 0), (panel_w, page_h)] + path[::-1]
     mask_d.polygon(poly, fill=255)
 
-    page.paste(hero_img_final_rgba, (x0, 0), mask)
-
-    num_txt = f"Day {day_data.get('day', '?')}"
-    try:
-        _, _, tw, th = draw.textbbox((0, 0), num_txt, font=NUM_FONT)
-    except AttributeError:
-        tw, th = draw.textsize(num_txt, font=NUM_FONT) # fallback
-    num_y = int(content_top_margin * 0.05) 
-    draw.text((utils.center_x(x0, panel_w, tw), num_y), num_txt, font=NUM_FONT, fill=hero_text_color)
-
-    title = day_data.get("title", "Default Title").upper()
-    lines = utils.split_title_into_lines(title, headline_num_lines)
-    max_w = 0
-    total_h = 0
-    line_hs = []
-    for i, line in enumerate(lines):
-        try:
-            _, _, lw, lh = draw.textbbox((0, 0), line, font=HEADLINE_FONT)
-        except AttributeError:
-            lw, lh = draw.textsize(line, font=HEADLINE_FONT) # fallback
-        max_w = max(max_w, lw)
-        line_hs.append(lh)
-        total_h += lh * (headline_spacing_ratio if i > 0 else 1)
-
-    headline_y_start = int(content_top_margin * 0.75)
+    dl.add(Layer(hero_layer, (x0, 0), mask))
+    layout_hero_text(dl, day, panel_idx, config, origin_x)
+
+def layout_hero_text(dl: DisplayList, day: Day, panel_idx: int, config: DaywiseConfig, origin_x: int = None, report=None):
+    """Lays out the day number and headline over the hero (`origin_x` as in layout_hero_section).
+
+    With a LayoutReport, records the widest headline line against the text width.
+    """
+    fonts = load_daywise_fonts(config)
+    NUM_FONT = fonts['NUM']
+    HEADLINE_FONT = fonts['HEADLINE']
+    measure = display_list.measurer()
+
+    panel_w = config.panel_w
+    hero_text_color = config.hero_text_color
+    headline_spacing_ratio = config.headline_spacing_ratio
+    x0 = config.panel_x[panel_idx] if origin_x is None else origin_x
+
+    num_txt = f"Day {day.day}"
+    _, _, tw, th = measure.textbbox((0, 0), num_txt, font=NUM_FONT)
+    dl.add(Text((utils.center_x(x0, panel_w, tw), config.num_y), num_txt, NUM_FONT, hero_text_color, None))
+
+    title = day.title.upper()
+    lines = utils.split_title_into_lines(title, config.headline_num_lines)
+    # Long titles keep their line breaks and are sized down to the text width
+    HEADLINE_FONT = text_fit.fit_font(HEADLINE_FONT, lines, config.content_width)
+    # Each headline line is measured once
+    line_sizes = [measure.textbbox((0, 0), line, font=HEADLINE_FONT)[2:] for line in lines]
 
     actual_total_h = 0
-    for i, lh_actual in enumerate(line_hs):
+    for i, (_, lh_actual) in enumerate(line_sizes):
         actual_total_h += lh_actual * (headline_spacing_ratio if i > 0 else 1)
 
-    start_y = headline_y_start - actual_total_h / 2
+    start_y = config.headline_y_start - actual_total_h / 2
     cur_y = start_y
 
-    for i, line in enumerate(lines):
-        try:
-             _, _, lw, lh_actual = draw.textbbox((0, 0), line, font=HEADLINE_FONT)
-        except AttributeError:
-             lw, lh_actual = draw.textsize(line, font=HEADLINE_FONT) # fallback
-        draw.text((utils.center_x(x0, panel_w, lw), cur_y), line, font=HEADLINE_FONT, fill=hero_text_color)
+    for line, (lw, lh_actual) in zip(lines, line_sizes):
+        dl.add(Text((utils.center_x(x0, panel_w, lw), cur_y), line, HEADLINE_FONT, hero_text_color, None))
         cur_y += lh_actual * headline_spacing_ratio 
 
-def draw_activities(draw: ImageDraw.ImageDraw, day_data: dict, panel_idx: int, config_data: dict):
-    """Draws the activities list for a single day panel."""
+    if report is not None:
+        widest = max([lw for lw, _ in line_sizes], default=0)
+        overflows = [f"line '{line}' is {lw - config.content_width}px wider than the text width"
+                     for line, (lw, _) in zip(lines, line_sizes) if lw > config.content_width]
+        report.add(f"Day {day.day} headline", "width", config.content_width, widest, overflows)
+
+def _measure_lines(measure, lines: list, font, line_spacing: int):
+    """Sizes of wrapped lines and their total height with `line_spacing` between them."""
+    sizes = [measure.textbbox((0, 0), line, font=font)[2:] for line in lines]
+    total = sum(line_h for _, line_h in sizes) + line_spacing * max(0, len(lines) - 1)
+    return sizes, total
+
+def layout_activities(dl: DisplayList, day: Day, panel_idx: int, config: DaywiseConfig, origin_x: int = None, report=None):
+    """Lays out the activities list for a single day panel into `dl` (`origin_x` as in layout_hero_section).
+
+    Every line is measured once; items that don't fit above the page bottom
+    are left out with a warning. With a LayoutReport, the rest of the
+    schedule is still measured (not laid out) so the report shows the full
+    height it needs.
+    """
     
-    fonts = load_daywise_fonts(config_data)
+    fonts = load_daywise_fonts(config)
     TIME_FONT = fonts['TIME']
     ACT_FONT = fonts['ACT']
     SUBTITLE_FONT = fonts['SUBTITLE']
+    measure = display_list.measurer()
     
-    panel_w = config_data.get("PANEL_W", 1240)
-    page_h = config_data.get("PAGE_H", 3508)
-    timeline_page_margin = config_data.get("TIMELINE_PAGE_MARGIN", 50)
-    bottom_margin = config_data.get("BOTTOM_MARGIN", 20)
-    time_color = tuple(config_data.get("ACTIVITY_TIME_COLOR", [220, 220, 220]))
-    activity_color = tuple(config_data.get("TIMELINE_TEXT_COLOR", [255, 255, 255]))
-    subtitle_color = tuple(config_data.get("ACTIVITY_SUBTITLE_COLOR", [235, 230, 220]))
+    time_color = config.activity_time_color
+    activity_color = config.timeline_text_color
+    subtitle_color = config.activity_subtitle_color
     divider_color = subtitle_color
 
-    schedule = day_data.get("schedule", [])
+    schedule = day.schedule
     if not schedule:
         return
 
-    panel_x_start = panel_idx * panel_w
-    effective_margin = timeline_page_margin - 20 
-    content_width = panel_w - 2 * effective_margin 
-    text_x = panel_x_start + effective_margin
+    panel_x_start = config.panel_x[panel_idx] if origin_x is None else origin_x
+    content_width = config.content_width
+    text_x = panel_x_start + config.effective_margin
     if panel_idx == 1:
         text_x += 65 # Indent right panel slightly more
 
-    current_y = page_h * 0.53 # Start activities drawing lower down
+    current_y = config.activities_start_y
+    content_bottom = current_y
 
     # Spacing constants
     time_activity_gap = 12
@@ -265,91 +265,84 @@ def draw_activities(draw: ImageDraw.ImageDraw, day_data: dict, panel_idx: int, c
     subtitle_line_spacing = 5 
     item_gap = 90 # Gap between schedule items
 
-    page_bottom_limit = page_h - bottom_margin
+    page_bottom_limit = config.page_bottom_limit
+    overflow = None # First part that didn't fit; nothing is laid out after it
+
+    def out_of_space(part: str, needed_y) -> bool:
+        nonlocal overflow
+        if overflow is not None or needed_y <= page_bottom_limit:
+            return False
+        overflow = f"no room for {part} ({needed_y - page_bottom_limit:.0f}px past the bottom)"
+        print(f"Warning: Out of space for Day {day.day} {part}")
+        return True
 
     for item_idx, item in enumerate(schedule):
-        time_str = utils.to_ampm(item["time"])
-        activity_str = item["activity"]
-        subtitle_str = item.get("subtitle", "")
-
-        try:
-            _, _, time_w, time_h = draw.textbbox((0,0), time_str, font=TIME_FONT)
-        except AttributeError:
-             time_w, time_h = draw.textsize(time_str, font=TIME_FONT) # fallback
+        time_str = item.time_label # Converted to AM/PM when the itinerary was parsed
+        activity_str = item.activity
+        subtitle_str = item.subtitle
+        last_item = item_idx == len(schedule) - 1
+
+        _, _, time_w, time_h = measure.textbbox((0,0), time_str, font=TIME_FONT)
         
         # Check space for Time
-        if current_y + time_h > page_bottom_limit:
-             print(f"Warning: Out of space for Day {day_data.get('day')} item {item_idx+1} (time)")
+        if out_of_space(f"item {item_idx+1} (time)", current_y + time_h) and report is None:
              break
              
-        draw.text((text_x, current_y), time_str, font=TIME_FONT, fill=time_color)
+        if overflow is None:
+            dl.add(Text((text_x, current_y), time_str, TIME_FONT, time_color, None))
         current_y += time_h + time_activity_gap
 
-        wrapped_activity = utils.wrap_text(draw, activity_str, ACT_FONT, content_width)
-        act_lines_height = 0
-        for i, line in enumerate(wrapped_activity):
-            try:
-                _, _, line_w, line_h = draw.textbbox((0,0), line, font=ACT_FONT)
-            except AttributeError:
-                 line_w, line_h = draw.textsize(line, font=ACT_FONT) # fallback
-            act_lines_height += line_h + (activity_line_spacing if i < len(wrapped_activity) - 1 else 0)
+        wrapped_activity = utils.wrap_text(measure, activity_str, ACT_FONT, content_width)
+        act_sizes, act_lines_height = _measure_lines(measure, wrapped_activity, ACT_FONT, activity_line_spacing)
 
         # Check space for Activity
-        if current_y + act_lines_height > page_bottom_limit:
-             print(f"Warning: Out of space for Day {day_data.get('day')} item {item_idx+1} (activity)")
+        if out_of_space(f"item {item_idx+1} (activity)", current_y + act_lines_height) and report is None:
              break
 
-        for i, line in enumerate(wrapped_activity):
-            try:
-                _, _, line_w, line_h = draw.textbbox((0,0), line, font=ACT_FONT)
-            except AttributeError:
-                 line_w, line_h = draw.textsize(line, font=ACT_FONT) # fallback
-            draw.text((text_x, current_y), line, font=ACT_FONT, fill=activity_color)
+        for line, (_, line_h) in zip(wrapped_activity, act_sizes):
+            if overflow is None:
+                dl.add(Text((text_x, current_y), line, ACT_FONT, activity_color, None))
             current_y += line_h + activity_line_spacing
         if wrapped_activity:
              current_y -= activity_line_spacing # Remove last spacing
 
         if subtitle_str:
             current_y += activity_subtitle_gap
-            wrapped_subtitle = utils.wrap_text(draw, subtitle_str, SUBTITLE_FONT, content_width)
-            sub_lines_height = 0
-            for i, line in enumerate(wrapped_subtitle):
-                try:
-                    _, _, line_w, line_h = draw.textbbox((0,0), line, font=SUBTITLE_FONT)
-                except AttributeError:
-                     line_w, line_h = draw.textsize(line, font=SUBTITLE_FONT) # fallback
-                sub_lines_height += line_h + (subtitle_line_spacing if i < len(wrapped_subtitle) - 1 else 0)
+            wrapped_subtitle = utils.wrap_text(measure, subtitle_str, SUBTITLE_FONT, content_width)
+            sub_sizes, sub_lines_height = _measure_lines(measure, wrapped_subtitle, SUBTITLE_FONT, subtitle_line_spacing)
 
             # Check space for Subtitle
-            if current_y + sub_lines_height > page_bottom_limit:
-                 print(f"Warning: Out of space for Day {day_data.get('day')} item {item_idx+1} (subtitle)")
+            if out_of_space(f"item {item_idx+1} (subtitle)", current_y + sub_lines_height) and report is None:
                  break
 
-            for i, line in enumerate(wrapped_subtitle):
-                try:
-                    _, _, line_w, line_h = draw.textbbox((0,0), line, font=SUBTITLE_FONT)
-                except AttributeError:
-                     line_w, line_h = draw.textsize(line, font=SUBTITLE_FONT) # fallback
-                draw.text((text_x, current_y), line, font=SUBTITLE_FONT, fill=subtitle_color)
+            for line, (_, line_h) in zip(wrapped_subtitle, sub_sizes):
+                if overflow is None:
+                    dl.add(Text((text_x, current_y), line, SUBTITLE_FONT, subtitle_color, None))
                 current_y += line_h + subtitle_line_spacing
             if wrapped_subtitle:
                  current_y -= subtitle_line_spacing # Remove last spacing
+        content_bottom = current_y
 
-        # --- Draw Divider (optional) ---
+        # --- Divider (optional) ---
         divider_top_gap = 15
         divider_y = current_y + divider_top_gap
         
-        if divider_y + 5 < page_bottom_limit and item_idx < len(schedule) - 1:
-            divider_width = content_width * 0.30
-            draw.line([(text_x, divider_y), (text_x + divider_width, divider_y)], fill=divider_color, width=2)
+        if overflow is not None:
+            current_y = divider_y + 25 # Only measuring now: as if the divider had room
+        elif divider_y + 5 < page_bottom_limit and not last_item:
+            divider_width = config.divider_width
+            dl.add(Line([(text_x, divider_y), (text_x + divider_width, divider_y)], divider_color, 2))
             current_y = divider_y + 25
         else:
             # No divider or not enough space for it + gap
-             if current_y + item_gap > page_bottom_limit and item_idx < len(schedule) - 1:
-                  print(f"Warning: Out of space for Day {day_data.get('day')} gap after item {item_idx+1}")
+             if not last_item and out_of_space(f"gap after item {item_idx+1}", current_y + item_gap) and report is None:
                   break 
              current_y += item_gap
 
+    if report is not None:
+        start_y = config.activities_start_y
+        report.add(f"Day {day.day} schedule", "height", page_bottom_limit - start_y, content_bottom - start_y, [overflow])
+
 # --- Main generation function (if needed for direct execution/testing) --- 
 # This assumes a specific structure (2 days) and uses a local config concept
 # In the main project, generate_daywise_page in the generator script handles this better.
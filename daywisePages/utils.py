@@ -47,8 +47,13 @@ def split_title_into_lines(title: str, num_lines: int) -> list[str]:
     # Filter out any potentially empty strings just in case
     return [line for line in lines if line]
 
-def generate_jagged_path(start_x: int, y_start: int, y_end: int, jag_config: dict) -> list[tuple[int, int]]:
-    """Generates a list of points representing a jagged vertical line."""
+def generate_jagged_path(start_x: int, y_start: int, y_end: int, jag_config: dict, rng=None) -> list[tuple[int, int]]:
+    """Generates a list of points representing a jagged vertical line.
+
+    `rng` is an optional random source (e.g. a seeded random.Random); the
+    global `random` module is used when omitted.
+    """
+    rng = rng or random
     
     # Extract values from the config dictionary with defaults
     amplitude = jag_config.get("JAG_AMPLITUDE", 10)
@@ -62,7 +67,7 @@ def generate_jagged_path(start_x: int, y_start: int, y_end: int, jag_config: dic
         # Determine the height of the current segment
         segment_h = min(segment_len, y_end - current_y)
         # Calculate a random horizontal step
-        step = random.randint(-amplitude, amplitude) # Widen range slightly for more jaggedness
+        step = rng.randint(-amplitude, amplitude) # Widen range slightly for more jaggedness
         # Calculate the new x-coordinate, clamping it within bounds
         current_offset_x = max(start_x - amplitude, min(start_x + amplitude, last_offset_x + step))
 
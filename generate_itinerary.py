@@ -1,8 +1,25 @@
+import argparse
+import contextlib
+import copy
+import io
 import json
+import multiprocessing
 import os
 import sys
+from collections import namedtuple
 from PIL import Image, ImageDraw, ImageFont
 import glob
+import time
+
+from core import (asset_index, assets, determinism, metrics, native_memory, page_cache, pdf_book, pdf_linearize, pdf_update,
+                  prefetch, preview, raw_assets, soak, text_sprites)
+from core.itinerary import parse_itinerary
+from core.layout_report import LayoutReport
+from core.validation import ValidationError, ValidationReport
+from core import fonts as font_cache
+from core.pipeline import DEFAULT_QUEUE_DEPTH, Stage, StagePipeline
+from core.service import serve
+from core.workers import create_worker_pool, pool_size
 
 INPUT_JSON_PATH = "inputs/itinerary_data.json"
 INPUT_DETAILS_PATH = "inputs/itinerary_details.json"
@@ -11,7 +28,8 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 
 # --- Page Generator Imports ---
 try:
-    from page1.page1 import generate_page1
+    from page1.page1 import generate_page1, layout_page1, check_page1, prefetch_page1, load_fonts as page1_load_fonts
+    from page1.config import compile_page1_config
 except ImportError as e:
     print(f"Error importing generate_page1 from page1/page1.py: {e}")
     print("Ensure page1/page1.py exists and page1/__init__.py exists.")
@@ -19,6 +37,8 @@ except ImportError as e:
 
 try:
     import daywisePages.daywise_page_generator as page2_module
+    import daywisePages.drawing as daywise_drawing
+    from daywisePages.config import compile_daywise_config
     generate_daywise_page_func = page2_module.generate_daywise_page
 except ImportError as e:
     print(f"Error importing daywise_page_generator.py from daywisePages: {e}")
@@ -29,19 +49,21 @@ except AttributeError as e:
      sys.exit(1)
 
 try:
-    from hotels.hotels_page_generator import generate_hotels_page
+    from hotels.hotels_page_generator import (generate_hotels_page, layout_hotels_page, check_hotels_page, prefetch_hotels_page,
+                                              hotels_page_cache_key, load_hotel_fonts)
 except ImportError as e:
     print(f"Error importing generate_hotels_page from hotels/hotels_page_generator.py: {e}")
     sys.exit(1)
 
 try:
-    from inclusions_exclusions.inc_exc_page_generator import generate_inc_exc_page
+    from inclusions_exclusions.inc_exc_page_generator import (generate_inc_exc_page, layout_inc_exc_page, check_inc_exc_page,
+                                                              prefetch_inc_exc_page, inc_exc_page_cache_key, load_inc_exc_fonts)
 except ImportError as e:
     print(f"Error importing generate_inc_exc_page from inclusions_exclusions/inc_exc_page_generator.py: {e}")
     sys.exit(1)
 
 try:
-    from quotes.quote_page_generator import generate_quote_page
+    from quotes.quote_page_generator import generate_quote_page, layout_quote_page
 except ImportError as e:
     print(f"Error importing generate_quote_page from quotes/quote_page_generator.py: {e}")
     sys.exit(1)
@@ -86,84 +108,279 @@ FONT_PATH_ITEM = os.path.join(script_dir, 'fonts', 'Chalkboard-Regular.ttf')
 INCEXC_BG_PATH = os.path.join(script_dir, 'inputs', 'incexc_bg.jpg') # Background for Inc/Exc page
 
 OUTPUTS_BASE_DIR = "outputs"
+PREVIEW_DIR = os.path.join(OUTPUTS_BASE_DIR, "preview")
+LAYOUT_CHECK_PATH = os.path.join(OUTPUTS_BASE_DIR, "layout_check.json")
+BOOK_PDF_PATH = os.path.join(OUTPUTS_BASE_DIR, "book.pdf")
+METRICS_PATH = os.path.join(OUTPUTS_BASE_DIR, "metrics.json")
+SOAK_OUTPUT_DIR = os.path.join(OUTPUTS_BASE_DIR, "soak")
+SOAK_REPORT_PATH = os.path.join(OUTPUTS_BASE_DIR, "soak_report.json")
 
-def main():
-    # Load Config Data
-    try:
-        with open(INPUT_JSON_PATH, 'r') as f:
-            config_data = json.load(f)
-        print(f"Successfully loaded config data from: {INPUT_JSON_PATH}")
-    except FileNotFoundError:
-        print(f"Error: Config JSON file not found at '{INPUT_JSON_PATH}'")
-        sys.exit(1)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing config JSON file '{INPUT_JSON_PATH}': {e}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"An unexpected error occurred loading config JSON: {e}")
-        sys.exit(1)
+ITINERARIES = metrics.counter("itineraries_rendered_total", "Itinerary renders, by outcome.", ("status",))
+ITINERARY_SECONDS = metrics.histogram("itinerary_render_seconds", "Time to render one itinerary to its PDF.", ("status",))
+PAGES = metrics.counter("pages_total", "Pages produced, by page type and source (rendered, cache, failed).",
+                        ("kind", "source"))
+PAGE_SECONDS = metrics.histogram("page_render_seconds", "Time to lay out and paint one page, by page type.", ("kind",))
 
-    # Load Itinerary Details Data
+def parse_args(argv=None):
+    """Parses command line options."""
+    parser = argparse.ArgumentParser(description="Generate itinerary pages and PDF from the JSON inputs.")
+    parser.add_argument(
+        "--deterministic",
+        action="store_true",
+        help="Seed all randomness from the page inputs and pin encoder/PDF metadata "
+             "so identical inputs produce byte-identical outputs."
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="Decode images and save pages on the main thread instead of on "
+             "background threads."
+    )
+    parser.add_argument(
+        "--compile-assets",
+        action="store_true",
+        help="Compile the images in inputs/ and icons/ into memory-mappable raw pixel "
+             "files (under .cache/raw_assets) and exit."
+    )
+    parser.add_argument(
+        "--validate-only",
+        action="store_true",
+        help="Check the config and itinerary details (schema and referenced files), "
+             "report every problem and exit without rendering. With --batch/--book every "
+             "job is checked; with --serve only the config."
+    )
+    parser.add_argument(
+        "--preview",
+        choices=("html", "svg"),
+        help="Write a browser preview of every page (one HTML file, or one SVG per page) "
+             f"to {PREVIEW_DIR}/ instead of rendering; images are referenced as small copies."
+    )
+    parser.add_argument(
+        "--check-layout",
+        action="store_true",
+        help="Measure every page's text and cards without decoding images or painting, "
+             f"print the space used and any overflows, and write them to {LAYOUT_CHECK_PATH}. "
+             "With --batch, checks every itinerary in DIR."
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="DIR",
+        help="Render every itinerary details JSON in DIR (shared config) into outputs/<name>/."
+    )
+    parser.add_argument(
+        "--book",
+        metavar="DIR",
+        help="Render every itinerary details JSON in DIR (as --batch) and merge them into "
+             f"one bookmarked PDF, {BOOK_PDF_PATH}, storing identical pages once."
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve the run's metrics in the Prometheus text format on http://127.0.0.1:PORT/metrics "
+             f"while it runs (they are written to {METRICS_PATH} at the end either way)."
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="PORT",
+        type=int,
+        help="Run the HTTP render service on localhost:PORT."
+    )
+    parser.add_argument(
+        "--no-page-cache",
+        action="store_true",
+        help="Render every page of --batch/--book/--serve jobs even if an identical page "
+             f"(same hotel, same inclusions/exclusions) is in the shared page cache ({page_cache.PAGE_CACHE_DIR})."
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Re-render only the pages whose inputs changed since the last --update run and "
+             "append them to the existing PDF as an incremental update (renders everything "
+             "the first time)."
+    )
+    parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="Write linearized (\"fast web view\") PDFs: the cover page's objects and the "
+             "hint tables come first, so viewers show it before the rest has downloaded."
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=("sequential", "pipeline"),
+        default="sequential",
+        help="How a single itinerary's pages are executed: one after another, or as "
+             "a prepare/render/encode stage pipeline on separate threads."
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=DEFAULT_QUEUE_DEPTH,
+        help=f"Capacity of each queue between pipeline stages (default: {DEFAULT_QUEUE_DEPTH})."
+    )
+    parser.add_argument(
+        "--soak",
+        type=int,
+        metavar="N",
+        help="Render the itinerary N times in this process, sampling the Python heap, RSS and open files "
+             f"between iterations; fails if they keep growing (report in {SOAK_REPORT_PATH})."
+    )
+    parser.add_argument(
+        "--page-workers",
+        type=int,
+        default=None,
+        help="Render the pages of a single itinerary in N worker processes."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of pre-forked worker processes for --batch/--serve (default: CPU count)."
+    )
+    return parser.parse_args(argv)
+
+def load_json_file(path: str, description: str):
+    """Loads a JSON file, printing a message and returning None on failure."""
     try:
-        with open(INPUT_DETAILS_PATH, 'r') as f:
-            details_data = json.load(f)
-        print(f"Successfully loaded itinerary details from: {INPUT_DETAILS_PATH}")
+        with open(path, 'r') as f:
+            data = json.load(f)
+        print(f"Successfully loaded {description} from: {path}")
+        return data
     except FileNotFoundError:
-        print(f"Error: Itinerary details JSON file not found at '{INPUT_DETAILS_PATH}'")
-        sys.exit(1)
+        print(f"Error: {description} JSON file not found at '{path}'")
     except json.JSONDecodeError as e:
-        print(f"Error parsing details JSON file '{INPUT_DETAILS_PATH}': {e}")
-        sys.exit(1)
+        print(f"Error parsing {description} JSON file '{path}': {e}")
     except Exception as e:
-        print(f"An unexpected error occurred loading details JSON: {e}")
-        sys.exit(1)
-        
+        print(f"An unexpected error occurred loading {description} JSON: {e}")
+    return None
+
+# One page of an itinerary: `render(**kwargs)` draws it, saves it to `filename`
+# and returns the page image. Required pages abort the itinerary if they fail.
+# `prefetch` is an optional (function, args) that starts decoding the page's
+# images on the prefetch threads; `layout` is the (function, args) that lays
+# the page out as a display list without painting it; `check` is an optional
+# (function, args) that measures the page into a LayoutReport passed last;
+# `cache` is (page cache key, output path) for pages other jobs may share.
+PageTask = namedtuple("PageTask", "number kind filename description render kwargs required prefetch layout check cache")
+
+PAGE_RENDER_TIMEOUT = 300 # Seconds to wait for one page from a worker process
+
+def details_with_defaults(details_data: dict) -> dict:
+    """The itinerary_details object with missing sections for the later pages defaulted."""
+    if not isinstance(details_data, dict) or not isinstance(details_data.get("itinerary_details"), dict):
+        raise ValidationError("Invalid itinerary details", ["itinerary_details: missing or not an object"])
+    return {
+        "inclusions": DEFAULT_INCLUSIONS,
+        "exclusions": DEFAULT_EXCLUSIONS,
+        "hotel_details": DEFAULT_HOTEL_DETAILS,
+        "quote": DEFAULT_QUOTE,
+        "terms_and_conditions": DEFAULT_TERMS_CONDITIONS,
+        **details_data["itinerary_details"],
+    }
+
+def parse_details(details_data: dict):
+    """Parses a details document into an Itinerary. Raises ValidationError listing every problem."""
+    return parse_itinerary(details_with_defaults(details_data))
+
+def validate_job(config_data: dict, details_data: dict, config_only: bool = False) -> ValidationReport:
+    """Checks a job before rendering: config and details schema, and referenced files.
+
+    Takes milliseconds; every problem is collected with its JSON path. With
+    `config_only` (a service, whose jobs arrive later) the details are skipped.
+    """
+    report = ValidationReport()
+    sections = {}
+    for key in ("page1_config", "daywise_config"):
+        section = config_data.get(key) if isinstance(config_data, dict) else None
+        if not isinstance(section, dict):
+            report.error(key, "missing or not an object")
+        sections[key] = section
+    page1 = report.check(compile_page1_config, sections["page1_config"]) if sections["page1_config"] is not None else None
+    daywise = report.check(compile_daywise_config, sections["daywise_config"]) if sections["daywise_config"] is not None else None
+    details = report.check(details_with_defaults, details_data) if not config_only else None
+    if details is not None:
+        report.check(parse_itinerary, details)
+
+    # Referenced files. Missing fonts and logo are warnings: pages fall back to the default font or skip the logo
+    if page1:
+        report.check_asset("page1_config.paths.input_dir", os.path.join(page1.input_dir, "page1_bg"), any_extension=True)
+        report.check_asset("page1_config.paths.logo", page1.logo_path, required=False, any_extension=True)
+        report.check_asset("page1_config.paths.title_font", page1.title_font, required=False)
+        report.check_asset("page1_config.paths.text_font", page1.text_font, required=False)
+    if daywise:
+        for key, path in daywise.font_paths:
+            report.check_asset(f"daywise_config.font_paths.{key}", path, required=False)
+    # Heroes are checked on the raw days (type errors are already reported) so
+    # this works even when the schema check failed elsewhere
+    days = details.get("days") if details is not None else None
+    if daywise and isinstance(days, list):
+        for i, day in enumerate(days):
+            if not isinstance(day, dict):
+                continue
+            path = f"itinerary_details.days[{i}].hero_image"
+            hero_image = day.get("hero_image")
+            if not hero_image:
+                report.error(path, "missing")
+            elif isinstance(hero_image, str):
+                report.check_asset(path, page2_module.resolve_hero_path(hero_image, daywise.inputs_dir), any_extension=True)
+    return report
+
+def check_job(config_data: dict, details_data: dict, name: str = "job", config_only: bool = False) -> bool:
+    """Validates a job and prints the outcome. Returns True if it can be rendered."""
+    start = time.perf_counter()
+    report = validate_job(config_data, details_data, config_only)
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="validate")
+    report.print(name)
+    if report.ok:
+        print(f"Validated {name} in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return report.ok
+
+def build_page_tasks(config_data: dict, details_data: dict, output_dir: str):
+    """Works out every page of one itinerary, in order, as PageTasks.
+
+    Returns None if the config or details are missing required sections.
+    """
+    # Work on a private copy: page configs are adjusted per job below
+    config_data = copy.deepcopy(config_data)
+
     # Extract Configs from config_data
     try:
         page1_config = config_data["page1_config"]
         daywise_config = config_data["daywise_config"]
     except KeyError as e:
-        print(f"Error: Missing required config key in JSON ({INPUT_JSON_PATH}): {e}")
+        print(f"Error: Missing required config key in config JSON: {e}")
         print("Ensure 'page1_config' and 'daywise_config' exist.")
-        sys.exit(1)
+        return None
         
-    # Extract Itinerary Details from details_data
+    # Parse the itinerary details once into the immutable data model
     try:
-        itinerary_details = details_data["itinerary_details"]
-        # Extract data for new pages, using defaults if missing
-        inclusions = itinerary_details.get("inclusions", DEFAULT_INCLUSIONS)
-        exclusions = itinerary_details.get("exclusions", DEFAULT_EXCLUSIONS)
-        hotel_details = itinerary_details.get("hotel_details", DEFAULT_HOTEL_DETAILS)
-        quote = itinerary_details.get("quote", DEFAULT_QUOTE)
-        terms_conditions = itinerary_details.get("terms_and_conditions", DEFAULT_TERMS_CONDITIONS) # Added terms extraction
-    except KeyError as e:
-        print(f"Error: Missing required 'itinerary_details' key in JSON ({INPUT_DETAILS_PATH}): {e}")
-        sys.exit(1)
+        itinerary = parse_details(details_data)
+    except ValidationError as e:
+        print(f"Error: {e}")
+        return None
 
-    page1_text_overrides = itinerary_details.get("page1_text")
-    page1_output_filename = "page_1_cover.jpg"
-    page1_output_path = os.path.join(OUTPUTS_BASE_DIR, page1_output_filename) # Define full path
-    
-    inputs_dir_name = daywise_config.get("INPUTS_DIR_NAME", "inputs")
-    # Use the base outputs directory for consistency
-    outputs_dir_name = OUTPUTS_BASE_DIR # Keep this assignment for clarity
+    # Every page generator writes into this job's output directory
+    page1_config.setdefault("paths", {})["output_dir"] = output_dir
+    daywise_config["OUT_DIR_NAME"] = output_dir
 
+    page1_text_overrides = itinerary.page1_text_overrides()
     if page1_text_overrides:
         page1_config.get("text_content", {}).update(page1_text_overrides)
 
-    print("\n--- Generating Page 1 ---")
+    # Validate once per job; pages share the compiled, immutable configs
     try:
-        generate_page1(
-            output_filename=page1_output_filename, # Pass filename only
-            config_data=page1_config
-        )
-    except Exception as e:
-        print(f"Error generating Page 1: {e}")
-        sys.exit(1)
+        page1_config = compile_page1_config(page1_config)
+        daywise_config = compile_daywise_config(daywise_config)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return None
+
+    tasks = [PageTask(1, "cover", "page_1_cover.jpg", "Cover", generate_page1,
+                      {"output_filename": "page_1_cover.jpg", "config_data": page1_config}, True,
+                      (prefetch_page1, (page1_config,)), (layout_page1, (page1_config,)), (check_page1, (page1_config,)),
+                      None)]
 
-    print("\n--- Generating Itinerary Pages ---")
-    
-    days = itinerary_details.get("days", [])
+    days = itinerary.days
     num_itinerary_pages = 0
     if not days:
         print("Warning: No 'days' data found. Skipping itinerary page generation.")
@@ -177,100 +394,270 @@ def main():
             page_number = i + 2
             start_index = i * 2
             end_index = start_index + 2
-            
-            current_page_days = days[start_index:end_index]
             output_filename = f"page_{page_number}_daywise.jpg"
-            output_path = os.path.join(OUTPUTS_BASE_DIR, output_filename) # Define full path
-            print(f"-- Generating {output_filename} (Days {start_index + 1}{f'-{end_index}' if end_index <= num_days else ''}) --")
-            
-            try:
-                generate_daywise_page_func(
-                    days_data=current_page_days,
-                    config_data=daywise_config,
-                    output_filename=output_filename # Pass filename only
-                )
-            except Exception as e:
-                print(f"Error generating {output_filename}: {e}")
+            description = f"Days {start_index + 1}{f'-{end_index}' if end_index <= num_days else ''}"
+            tasks.append(PageTask(page_number, "daywise", output_filename, description, generate_daywise_page_func, {
+                "days_data": days[start_index:end_index],
+                "config_data": daywise_config,
+                "output_filename": output_filename, # Pass filename only
+            }, False, (page2_module.prefetch_daywise_page, (days[start_index:end_index], daywise_config)),
+               (page2_module.layout_daywise_page, (days[start_index:end_index], daywise_config)),
+               (page2_module.check_daywise_page, (days[start_index:end_index], daywise_config)), None))
 
-    # --- Generate Specific Content Pages ---
-    print("\n--- Generating Content Pages ---")
-    
     # Calculate the starting page number for content pages
     content_start_page = num_itinerary_pages + 2 
 
-    # --- Generate Hotel Details page ---
-    hotel_page_number = content_start_page
-    hotel_filename_base = f"page_{hotel_page_number}_hotels.jpg"
-    print(f"-- Generating {hotel_filename_base} --")
+    # Hotel and inclusions/exclusions pages recur across clients, so they can come from the page cache
+    cache_enabled = page_cache.is_enabled()
+
+    hotel_filename = f"page_{content_start_page}_hotels.jpg"
+    hotel_cache = (hotels_page_cache_key(itinerary.hotels), os.path.join(output_dir, hotel_filename)) if cache_enabled else None
+    tasks.append(PageTask(content_start_page, "hotels", hotel_filename, "Hotel Details", generate_hotels_page, {
+        "output_filename": hotel_filename,
+        "base_output_dir": output_dir,
+        "hotel_details": itinerary.hotels, # Pass relevant data
+    }, False, (prefetch_hotels_page, ()), (layout_hotels_page, (itinerary.hotels,)), (check_hotels_page, (itinerary.hotels,)),
+       hotel_cache))
+
+    inc_exc_filename = f"page_{content_start_page + 1}_inc_exc.jpg"
+    inc_exc_cache = None
+    if cache_enabled:
+        inc_exc_cache = (inc_exc_page_cache_key(FONT_PATH_PLAYFAIR, FONT_PATH_ITEM, INCEXC_BG_PATH,
+                                                itinerary.inclusions, itinerary.exclusions),
+                         os.path.join(output_dir, inc_exc_filename))
+    tasks.append(PageTask(content_start_page + 1, "inc_exc", inc_exc_filename, "Inclusions/Exclusions", generate_inc_exc_page, {
+        "output_filename": inc_exc_filename,
+        "font_path_title": FONT_PATH_PLAYFAIR,   # Pass title font
+        "font_path_item": FONT_PATH_ITEM,       # Pass item font
+        "bg_image_path": INCEXC_BG_PATH,        # Pass background image
+        "base_output_dir": output_dir,
+        "inclusions_list": itinerary.inclusions,
+        "exclusions_list": itinerary.exclusions,
+    }, False, (prefetch_inc_exc_page, (INCEXC_BG_PATH,)),
+       (layout_inc_exc_page, (FONT_PATH_PLAYFAIR, FONT_PATH_ITEM, INCEXC_BG_PATH, itinerary.inclusions, itinerary.exclusions)),
+       (check_inc_exc_page, (FONT_PATH_PLAYFAIR, FONT_PATH_ITEM, itinerary.inclusions, itinerary.exclusions)), inc_exc_cache))
+
+    quote_filename = f"page_{content_start_page + 2}_quote.jpg"
+    tasks.append(PageTask(content_start_page + 2, "quote", quote_filename, "Quote", generate_quote_page, {
+        "output_filename": quote_filename,
+        "font_path": FONT_PATH,
+        "base_output_dir": output_dir,
+        "quote": itinerary.quote,                 # Pass relevant data
+        "terms_conditions": itinerary.terms_and_conditions, # Pass relevant data
+    }, False, None, (layout_quote_page, (FONT_PATH, itinerary.quote, itinerary.terms_and_conditions)), None, None))
+    return tasks
+
+def run_page_task(task: PageTask):
+    """Renders one page. Returns the page image, or None if it failed.
+
+    Errors are printed; they are only re-raised for required pages, and a
+    required page whose generator returns no image is an error too. With the
+    page cache on, cacheable pages are copied from it when another job
+    already rendered them, and stored in it once saved otherwise.
+    """
+    print(f"-- Generating {task.filename} ({task.description}) --")
+    hooked_path = None
+    if task.cache and page_cache.is_enabled():
+        key, output_path = task.cache
+        try:
+            image = page_cache.fetch_page(key, output_path)
+            if image is not None:
+                print(f"Page cache hit: {task.filename}")
+                PAGES.inc(kind=task.kind, source="cache")
+                return image
+            prefetch.when_saved(output_path, lambda path: page_cache.store_file(key, path))
+            hooked_path = output_path
+        except OSError as e:
+            print(f"Warning: Page cache unavailable for {task.filename}: {e}")
+    start = time.perf_counter()
+    image = None
     try:
-        generate_hotels_page(
-            output_filename=hotel_filename_base,
-            base_output_dir=OUTPUTS_BASE_DIR,
-            hotel_details=hotel_details # Pass relevant data
-        )
+        image = task.render(**task.kwargs)
+        if image is None and task.required:
+            raise RuntimeError("the page generator returned no image")
+        if image is not None:
+            PAGE_SECONDS.observe(time.perf_counter() - start, kind=task.kind)
+        PAGES.inc(kind=task.kind, source="rendered" if image is not None else "failed")
+        return image
     except Exception as e:
-        print(f"Error generating Hotel Details page: {e}")
+        print(f"Error generating {task.filename}: {e}")
+        PAGES.inc(kind=task.kind, source="failed")
+        if task.required:
+            raise
+        return None
+    finally:
+        if image is None and hooked_path:
+            prefetch.drop_save_hooks([hooked_path]) # Nothing will save it; a long-lived worker would keep the hook
 
-    # --- Generate Inclusions/Exclusions page ---
-    inc_exc_page_number = content_start_page + 1
-    inc_exc_filename_base = f"page_{inc_exc_page_number}_inc_exc.jpg"
-    print(f"-- Generating {inc_exc_filename_base} --")
+def run_page_tasks(tasks: list, output_dir: str):
+    """Renders the tasks in page order and waits for their saves.
+
+    Returns the tasks whose page was rendered and written, or None if a
+    required page failed to render or to save (its save is waited for
+    before the next page starts).
+    """
+    failed = set()
+    done = []
     try:
-        generate_inc_exc_page(
-            output_filename=inc_exc_filename_base,
-            font_path_title=FONT_PATH_PLAYFAIR,   # Pass title font
-            font_path_item=FONT_PATH_ITEM,       # Pass item font
-            bg_image_path=INCEXC_BG_PATH,        # Pass background image
-            base_output_dir=OUTPUTS_BASE_DIR,
-            inclusions_list=inclusions,
-            exclusions_list=exclusions
-        )
-    except Exception as e:
-        print(f"Error generating Inclusions/Exclusions page: {e}")
+        for task in tasks:
+            try:
+                image = run_page_task(task) # Page images are freed once their background save is done
+            except Exception:
+                return None # Required page failed; already reported
+            if image is None:
+                continue
+            if task.required:
+                failed.update(prefetch.wait_for_saves())
+                if os.path.abspath(os.path.join(output_dir, task.filename)) in failed:
+                    print(f"Error: Could not save required page {task.filename}.")
+                    return None
+            done.append(task)
+    finally:
+        prefetch.discard()
+        failed.update(prefetch.wait_for_saves()) # Failures are reported as they happen
+        native_memory.trim() # The page images are freed; see core/native_memory.py
+    return [task for task in done if os.path.abspath(os.path.join(output_dir, task.filename)) not in failed]
 
-    # --- Generate Quote page ---
-    quote_page_number = content_start_page + 2
-    quote_filename_base = f"page_{quote_page_number}_quote.jpg"
-    print(f"-- Generating {quote_filename_base} --")
+def layout_pages(tasks: list) -> list:
+    """Lays out every page without painting. Returns (task, display list or None) pairs in page order."""
+    for task in tasks:
+        if task.prefetch:
+            task.prefetch[0](*task.prefetch[1])
+    pages = []
     try:
-        generate_quote_page(
-            output_filename=quote_filename_base,
-            font_path=FONT_PATH,
-            base_output_dir=OUTPUTS_BASE_DIR,
-            quote=quote,                 # Pass relevant data
-            terms_conditions=terms_conditions # Pass relevant data
-        )
-    except Exception as e:
-        print(f"Error generating Quote page: {e}")
+        for task in tasks:
+            try:
+                pages.append((task, task.layout[0](*task.layout[1])))
+            except Exception as e:
+                print(f"Error laying out {task.filename}: {e}")
+                pages.append((task, None))
+    finally:
+        prefetch.discard()
+    return pages
 
-    print("\n--- Itinerary Generation Complete ---")
-    # Construct full paths here just for the final print statements
-    page1_output_path = os.path.join(OUTPUTS_BASE_DIR, page1_output_filename)
-    hotel_output_path = os.path.join(OUTPUTS_BASE_DIR, hotel_filename_base)
-    inc_exc_output_path = os.path.join(OUTPUTS_BASE_DIR, inc_exc_filename_base)
-    quote_output_path = os.path.join(OUTPUTS_BASE_DIR, quote_filename_base)
-
-    print(f"Page 1 (Cover) saved to: {page1_output_path}")
-    if num_itinerary_pages > 0:
-        last_daywise_page = num_itinerary_pages + 1
-        print(f"Daywise Pages (page_2 to page_{last_daywise_page}) saved in: {outputs_dir_name}/")
-    else:
-         last_daywise_page = 1
-         
-    print(f"Hotel Details page (page_{hotel_page_number}) saved to: {hotel_output_path}")
-    print(f"Inclusions/Exclusions page (page_{inc_exc_page_number}) saved to: {inc_exc_output_path}")
-    print(f"Quote page (page_{quote_page_number}) saved to: {quote_output_path}")
+def check_layout(config_data: dict, details_data: dict):
+    """Measures every page of one itinerary without decoding images or painting.
 
-    # --- Combine JPGs into PDF ---
-    print("\n--- Generating PDF ---")
-    pdf_output_path = os.path.join(OUTPUTS_BASE_DIR, "itinerary_output.pdf")
-    
-    # Find all generated JPGs in the base output directory
-    image_files = glob.glob(os.path.join(OUTPUTS_BASE_DIR, "page_*.jpg"))
+    Returns a LayoutReport of the space used and overflows, or None if the
+    job can't be laid out.
+    """
+    tasks = build_page_tasks(config_data, details_data, OUTPUTS_BASE_DIR)
+    if tasks is None:
+        return None
+    report = LayoutReport()
+    for task in tasks:
+        if task.check is None:
+            continue
+        report.page = task.filename
+        try:
+            task.check[0](*task.check[1], report)
+        except Exception as e:
+            print(f"Error checking layout of {task.filename}: {e}")
+            report.skip(f"error: {e}")
+    return report
 
-    if not image_files:
-        print("Error: No JPG page files found in output directory to create PDF.")
-        return # Exit if no images found
+def check_layouts(config_data: dict, jobs: list, output_path: str = LAYOUT_CHECK_PATH) -> int:
+    """Checks the layout of (name, details_data) jobs, printing each report.
+
+    All reports (with timings) are written to output_path as JSON. Returns
+    the number of jobs that are invalid or overflow.
+    """
+    results = {}
+    failed = 0
+    for name, details_data in jobs:
+        if not check_job(config_data, details_data, f"job '{name}'"):
+            results[name] = {"ok": False, "error": "invalid job"}
+            failed += 1
+            continue
+        start = time.perf_counter()
+        report = check_layout(config_data, details_data)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if report is None:
+            results[name] = {"ok": False, "error": "could not be laid out"}
+            failed += 1
+            continue
+        print(f"--- Layout of '{name}' (checked in {elapsed_ms:.1f} ms) ---")
+        report.print(f"job '{name}'")
+        results[name] = {**report.as_dict(), "ms": round(elapsed_ms, 1)}
+        failed += not report.ok
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Layout check: {len(jobs) - failed} of {len(jobs)} job(s) fit; report written to {output_path}")
+    return failed
+
+def build_preview(config_data: dict, details_data: dict, assets: preview.PreviewAssets, fmt: str = "html",
+                  output_dir: str = PREVIEW_DIR):
+    """Lays out one itinerary and exports it for the browser.
+
+    "html" returns one HTML document with every page; "svg" writes one SVG per
+    page into output_dir and returns their paths. Returns None if the job
+    can't be laid out. Decoded images are kept for the next preview in this
+    process, so repeat previews of an edited itinerary skip the decoding.
+    """
+    # Nothing is painted here, so fetched images can be shared and stand-ins at preview size
+    prefetch.share_results()
+    preview.draft_images()
+    tasks = build_page_tasks(config_data, details_data, output_dir)
+    if tasks is None:
+        return None
+    pages = [(f"Page {task.number}: {task.description}", task, page) for task, page in layout_pages(tasks) if page is not None]
+    if fmt == "html":
+        return preview.html_document([(caption, page) for caption, _, page in pages], assets)
+    os.makedirs(output_dir, exist_ok=True)
+    return [preview.write_svg(page, os.path.join(output_dir, os.path.splitext(task.filename)[0] + ".svg"), assets)
+            for _, task, page in pages]
+
+_preview_assets = {} # (asset dir, url) -> PreviewAssets, reused across service previews
+
+def preview_job(config_data: dict, details_data: dict, asset_dir: str, asset_url: str):
+    """Service entry point: the HTML preview of one itinerary, or None."""
+    assets = _preview_assets.get((asset_dir, asset_url))
+    if assets is None:
+        assets = _preview_assets[(asset_dir, asset_url)] = preview.PreviewAssets(asset_dir, asset_url)
+    return build_preview(config_data, details_data, assets, "html", os.path.dirname(asset_dir))
+
+def render_page_in_worker(task: PageTask, output_dir: str):
+    """Worker side of the page-parallel mode: renders a page and writes its JPEG.
+
+    Returns (True if the page was saved, the page's metrics delta).
+    """
+    metrics_before = metrics.snapshot()
+    if task.prefetch:
+        task.prefetch[0](*task.prefetch[1])
+    image = run_page_task(task)
+    if image is None:
+        return False, metrics.since(metrics_before)
+    try:
+        failed = prefetch.wait_for_saves()
+    finally:
+        image.close()
+        native_memory.trim()
+    if os.path.abspath(os.path.join(output_dir, task.filename)) in failed:
+        if task.required:
+            raise OSError(f"Could not save required page {task.filename}")
+        return False, metrics.since(metrics_before)
+    return True, metrics.since(metrics_before)
+
+def save_pdf(images: list, pdf_output_path: str):
+    """Writes the page images, in order, to a single PDF."""
+    first_image = images[0]
+    other_images = images[1:]
+    with metrics.STAGE_SECONDS.time(stage="pdf_assemble"):
+        first_image.save(
+            pdf_output_path, 
+            "PDF" ,
+            resolution=100.0, 
+            save_all=True, 
+            append_images=other_images,
+            **determinism.pdf_save_kwargs()
+        )
+
+def page_files(output_dir: str) -> list:
+    """The page_*.jpg files in output_dir, in page number order."""
+    # Find all generated JPGs in the base output directory
+    image_files = glob.glob(os.path.join(output_dir, "page_*.jpg"))
 
     # Helper function to extract page number from filename like 'page_XX_...'
     def get_page_number(filename):
@@ -286,34 +673,648 @@ def main():
 
     # Sort files based on extracted page number
     image_files.sort(key=get_page_number)
-    
+    return image_files
+
+def assemble_pdf_from_files(output_dir: str):
+    """Combines the page_*.jpg files in output_dir into itinerary_output.pdf. Returns its path or None.
+
+    Every strategy assembles its PDF here, from the saved JPEGs in one write,
+    so --deterministic output doesn't depend on how the pages were rendered.
+    """
+    pdf_output_path = os.path.join(output_dir, "itinerary_output.pdf")
+    image_files = page_files(output_dir)
+
+    if not image_files:
+        print("Error: No JPG page files found in output directory to create PDF.")
+        return None # Exit if no images found
+
     print(f"Found {len(image_files)} pages to combine:")
     for img_file in image_files:
         print(f" - {os.path.basename(img_file)}")
 
+    images = []
     try:
-        images = [Image.open(f).convert("RGB") for f in image_files] # Convert to RGB for consistency
+        for f in image_files:
+            with Image.open(f) as img:
+                images.append(img.convert("RGB")) # Convert to RGB for consistency
         
         if not images:
              print("Error: Failed to open any images for PDF creation.")
-             return
-
-        first_image = images[0]
-        other_images = images[1:]
+             return None
 
-        first_image.save(
-            pdf_output_path, 
-            "PDF" ,
-            resolution=100.0, 
-            save_all=True, 
-            append_images=other_images
-        )
+        save_pdf(images, pdf_output_path)
         print(f"Successfully generated PDF: {pdf_output_path}")
+        return pdf_output_path
 
     except FileNotFoundError as e:
          print(f"Error: Could not find image file during PDF creation: {e}")
     except Exception as e:
         print(f"An error occurred during PDF creation: {e}")
+    finally:
+        for img in images: # Page-sized; don't leave them to the garbage collector
+            img.close()
+    return None
+
+def render_pages_in_processes(tasks: list, config_data: dict, output_dir: str, num_workers: int):
+    """Renders pages on a pre-forked pool; each worker writes its page's JPEG.
+
+    Returns the PDF path, or None on failure.
+    """
+    pool = create_worker_pool(num_workers, preload=preload_render_state, preload_args=(config_data,))
+    try:
+        pending = [(task, pool.apply_async(render_page_in_worker, (task, output_dir))) for task in tasks]
+        for task, result in pending:
+            try:
+                _, page_metrics = result.get(timeout=PAGE_RENDER_TIMEOUT)
+                metrics.merge(page_metrics)
+            except multiprocessing.TimeoutError:
+                print(f"Error: {task.filename} did not finish within {PAGE_RENDER_TIMEOUT}s (worker lost?)")
+                if task.required:
+                    return None
+            except Exception as e:
+                print(f"Error generating {task.filename}: {e}")
+                return None # Only required pages raise
+    finally:
+        pool.close()
+        pool.join()
+
+    print("\n--- Generating PDF ---")
+    return assemble_pdf_from_files(output_dir)
+
+def render_pages_in_pipeline(tasks: list, output_dir: str, queue_depth: int = DEFAULT_QUEUE_DEPTH):
+    """Renders pages through a staged pipeline: prepare -> render -> encode, then assembles the PDF.
+
+    Each stage runs on its own thread with bounded queues in between, so
+    page N+1's images are being decoded while page N is drawn and page N-1
+    is encoded. Returns the PDF path, or None on failure.
+    """
+
+    def prepare(task):
+        # Asset load and background prep: decode and fit the page's images
+        if task.prefetch:
+            task.prefetch[0](*task.prefetch[1])
+        prefetch.wait_pending()
+        return task
+
+    def render(task):
+        # Layout and paint; the page's JPEG save is handed to the encode stage
+        with prefetch.captured_saves() as saves:
+            image = run_page_task(task) # Raises (aborting the run) only for required pages
+        if image is None:
+            return None
+        return task, image, saves
+
+    def encode(item):
+        task, image, saves = item
+        try:
+            for img, path, args, kwargs in saves:
+                try:
+                    prefetch.run_save(img, path, args, kwargs)
+                except Exception as e:
+                    print(f"Error saving page {path}: {e}")
+                    if task.required:
+                        raise # Aborts the run like a failed required render
+        finally:
+            image.close()
+        return task
+
+    pipeline = StagePipeline([
+        Stage("prepare", prepare),
+        Stage("render", render),
+        Stage("encode", encode),
+    ], queue_depth=queue_depth)
+    try:
+        pipeline.run(tasks)
+    except Exception:
+        return None # Required page failed; already reported
+    finally:
+        prefetch.discard()
+        # Pages drained after a failure never reach the encode stage to run their save hooks
+        prefetch.drop_save_hooks(os.path.join(output_dir, task.filename) for task in tasks)
+        native_memory.trim()
+        pipeline.print_metrics()
+
+    print("\n--- Generating PDF ---")
+    return assemble_pdf_from_files(output_dir)
+
+def finish_pdf(pdf_path: str):
+    """Linearizes a finished PDF in place when --linearize is on and counts its bytes. Returns pdf_path.
+
+    Also returns the itinerary's freed image memory to the OS (see core/native_memory.py).
+    """
+    native_memory.trim()
+    if pdf_path and pdf_linearize.is_enabled():
+        start = time.perf_counter()
+        try:
+            stats = pdf_linearize.linearize_pdf(pdf_path)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="linearize")
+            print(f"Linearized {pdf_path} in {(time.perf_counter() - start) * 1000:.0f} ms "
+                  f"(first page in the first {stats['first_page_bytes'] // 1024} of {stats['bytes'] // 1024} KiB)")
+        except Exception as e:
+            print(f"Warning: Could not linearize {pdf_path}: {e}")
+    if pdf_path:
+        metrics.BYTES_WRITTEN.inc(os.path.getsize(pdf_path), kind="pdf")
+    return pdf_path
+
+def render_itinerary(config_data: dict, details_data: dict, output_dir: str = OUTPUTS_BASE_DIR, page_workers: int = None,
+                     strategy: str = "sequential", queue_depth: int = DEFAULT_QUEUE_DEPTH):
+    """Renders every page of one itinerary into output_dir and combines them into a PDF.
+
+    `strategy` is "sequential" (page by page) or "pipeline" (staged, see
+    render_pages_in_pipeline). With `page_workers`, pages instead render in
+    parallel worker processes.
+    Returns the PDF path, or None if the itinerary could not be rendered.
+    """
+    tasks = build_page_tasks(config_data, details_data, output_dir)
+    if tasks is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+
+    if page_workers:
+        print(f"\n--- Generating {len(tasks)} page(s) on {page_workers} worker process(es) ---")
+        return finish_pdf(render_pages_in_processes(tasks, config_data, output_dir, page_workers))
+
+    if strategy == "pipeline":
+        print(f"\n--- Generating {len(tasks)} page(s) through the stage pipeline ---")
+        return finish_pdf(render_pages_in_pipeline(tasks, output_dir, queue_depth))
+
+    # Start decoding/fitting every page's heroes and backgrounds right away,
+    # so the threads work ahead of the page being drawn
+    for task in tasks:
+        if task.prefetch:
+            task.prefetch[0](*task.prefetch[1])
+
+    print("\n--- Generating Pages ---")
+    saved = run_page_tasks(tasks, output_dir)
+    if saved is None:
+        return None
+
+    print("\n--- Itinerary Generation Complete ---")
+    for task in saved:
+        print(f"Page {task.number} ({task.description}) saved to: {os.path.join(output_dir, task.filename)}")
+
+    # --- Combine JPGs into PDF ---
+    print("\n--- Generating PDF ---")
+    return finish_pdf(assemble_pdf_from_files(output_dir))
+
+def rendered_page_files(tasks: list, output_dir: str):
+    """Renders the tasks in page order, yielding each page's JPEG path as soon as it is saved.
+
+    Pages that fail are skipped; a failing required page raises.
+    """
+    for task in tasks:
+        if task.prefetch:
+            task.prefetch[0](*task.prefetch[1])
+    try:
+        for task in tasks:
+            image = run_page_task(task)
+            failed = prefetch.wait_for_saves() # The page must be on disk before it is handed out
+            path = os.path.join(output_dir, task.filename)
+            if os.path.abspath(path) in failed:
+                if task.required:
+                    raise OSError(f"Could not save required page {task.filename}")
+                continue
+            if image is not None and os.path.exists(path):
+                yield path
+    finally:
+        prefetch.discard()
+        prefetch.wait_for_saves()
+        native_memory.trim()
+
+def stream_itinerary_pdf(config_data: dict, details_data: dict, output_dir: str = OUTPUTS_BASE_DIR):
+    """Renders one itinerary into output_dir, returning its PDF as an iterator of byte chunks.
+
+    Each page is written out as soon as it is rendered and the
+    cross-reference table at the end, so the first page's bytes are ready
+    after one page render. Pages are encoded as in the assembled PDF. Write the chunks to any stream or
+    chunked HTTP response. Returns None if the itinerary can't be rendered.
+    """
+    tasks = build_page_tasks(config_data, details_data, output_dir)
+    if tasks is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    pages = (pdf_book.pdf_jpeg(path) for path in rendered_page_files(tasks, output_dir))
+    return pdf_book.stream_pages(pages, title=determinism.FIXED_PDF_TITLE)
+
+def project_modules() -> tuple:
+    """Names of the loaded modules that belong to this project (page code, core)."""
+    return tuple(sorted(name for name, module in list(sys.modules.items())
+                        if os.path.abspath(getattr(module, "__file__", None) or "").startswith(script_dir + os.sep)))
+
+def page_revision_keys(tasks: list) -> list:
+    """Per page, a key of everything it is drawn from: its data, the indexed assets and the code."""
+    # The JSON inputs sit in inputs/ too, but pages see their data through task.kwargs
+    assets_hash = determinism.canonical_hash([entry for entry in asset_index.get_index().signature
+                                              if not entry.path.endswith(".json")])
+    code = page_cache.code_input(*project_modules())
+    return [page_cache.page_key(f"revision-{task.kind}", number=task.number, filename=task.filename,
+                                inputs=task.kwargs, assets=assets_hash, code=code) for task in tasks]
+
+def record_full_render(pdf_path: str, tasks: list, keys: list):
+    """Records which page of a freshly assembled PDF came from which task, for later --update runs."""
+    key_of = {task.filename: key for task, key in zip(tasks, keys)}
+    output_dir = os.path.dirname(pdf_path)
+    pdf_update.record_pages(pdf_path, [(os.path.basename(path), key_of.get(os.path.basename(path)))
+                                       for path in page_files(output_dir)])
+
+def update_itinerary(config_data: dict, details_data: dict, output_dir: str = OUTPUTS_BASE_DIR, **render_options):
+    """Renders only the pages whose inputs changed since the last update and patches them into the PDF.
+
+    Changed pages are appended to itinerary_output.pdf as an incremental
+    update; the bytes of the pages that didn't change are left untouched.
+    Without a record of an earlier update (or if the PDF was rewritten
+    since), every page is rendered as by render_itinerary(render_options).
+    Returns the PDF path, or None on failure.
+    """
+    tasks = build_page_tasks(config_data, details_data, output_dir)
+    if tasks is None:
+        return None
+    keys = page_revision_keys(tasks)
+    pdf_output_path = os.path.join(output_dir, "itinerary_output.pdf")
+    recorded = pdf_update.recorded_pages(pdf_output_path)
+
+    if recorded is None:
+        print(f"No page record for {pdf_output_path}; rendering every page.")
+        # Page files left by other runs would otherwise be assembled into the PDF
+        for path in page_files(output_dir):
+            os.remove(path)
+        pdf_path = render_itinerary(config_data, details_data, output_dir, **render_options)
+        if pdf_path:
+            record_full_render(pdf_path, tasks, keys)
+        return pdf_path
+
+    recorded_keys = {entry["key"] for entry in recorded}
+    changed = [task for task, key in zip(tasks, keys) if key not in recorded_keys]
+    filenames = {task.filename for task in tasks}
+    stale = [entry["file"] for entry in recorded if entry["file"] not in filenames]
+    if not changed and len(recorded) == len(tasks):
+        print(f"All {len(tasks)} page(s) unchanged: {pdf_output_path} is up to date.")
+        return pdf_output_path
+
+    start = time.perf_counter()
+    print(f"\n--- Updating {len(changed)} of {len(tasks)} page(s) ---")
+    for filename in stale + [task.filename for task in changed]:
+        try:
+            os.remove(os.path.join(output_dir, filename)) # A page that fails to render must not reuse its old file
+        except FileNotFoundError:
+            pass
+    for task in changed:
+        if task.prefetch:
+            task.prefetch[0](*task.prefetch[1])
+    if run_page_tasks(changed, output_dir) is None:
+        return None
+
+    changed_files = {task.filename for task in changed}
+    pages = []
+    for task, key in zip(tasks, keys):
+        if task.filename not in changed_files:
+            pages.append((task.filename, key, None))
+        elif os.path.exists(os.path.join(output_dir, task.filename)): # Failed pages are left out, as in a full render
+            pages.append((task.filename, key, os.path.join(output_dir, task.filename)))
+    if [(filename, key) for filename, key, _ in pages] == [(entry["file"], entry["key"]) for entry in recorded]:
+        print(f"No page changed: {pdf_output_path} is up to date.") # The changed pages failed again
+        return pdf_output_path
+    try:
+        with metrics.STAGE_SECONDS.time(stage="pdf_update"):
+            stats = pdf_update.update_pdf(pdf_output_path, pages)
+        metrics.BYTES_WRITTEN.inc(stats["bytes_appended"], kind="pdf_update")
+    except Exception as e:
+        print(f"Warning: Could not update {pdf_output_path} in place ({e}); reassembling it.")
+        pdf_path = finish_pdf(assemble_pdf_from_files(output_dir))
+        if pdf_path:
+            record_full_render(pdf_path, tasks, keys)
+        return pdf_path
+    print(f"Updated PDF in {(time.perf_counter() - start) * 1000:.0f} ms: {pdf_output_path} "
+          f"({stats['embedded']} new page(s), {stats['kept']} unchanged, {stats['dropped']} superseded; "
+          f"{stats['bytes_appended'] // 1024} KiB appended)")
+    return pdf_output_path
+
+def record_itinerary(start: float, ok: bool):
+    """Counts one itinerary render that began at perf_counter() `start`."""
+    status = "ok" if ok else "failed"
+    ITINERARIES.inc(status=status)
+    ITINERARY_SECONDS.observe(time.perf_counter() - start, status=status)
+
+def render_job(job: tuple):
+    """Worker entry point: renders one (name, config, details, output_dir) job.
+
+    Returns (name, pdf path or None, seconds, the job's page cache stats, its metrics delta).
+    """
+    name, config_data, details_data, output_dir = job
+    start = time.perf_counter()
+    cache_before = page_cache.stats()
+    metrics_before = metrics.snapshot()
+    # Long-lived (service) workers pick up assets added or changed since the fork
+    if asset_index.refresh_if_changed():
+        print("Asset index rebuilt: assets changed on disk.")
+    try:
+        pdf_path = render_itinerary(config_data, details_data, output_dir)
+    except Exception as e:
+        print(f"Error rendering job '{name}': {e}")
+        pdf_path = None
+    record_itinerary(start, bool(pdf_path))
+    return (name, pdf_path, time.perf_counter() - start, page_cache.stats_since(cache_before),
+            metrics.since(metrics_before))
+
+def stream_job(job: tuple, pages):
+    """Worker entry point of streamed renders: renders one (name, config, details, output_dir) job page by page.
+
+    Each page's JPEG path is put on the `pages` queue as soon as it is saved,
+    then None. Returns (name, number of pages, seconds, the job's page cache stats, its metrics delta).
+    """
+    name, config_data, details_data, output_dir = job
+    start = time.perf_counter()
+    cache_before = page_cache.stats()
+    metrics_before = metrics.snapshot()
+    if asset_index.refresh_if_changed():
+        print("Asset index rebuilt: assets changed on disk.")
+    count = 0
+    try:
+        tasks = build_page_tasks(config_data, details_data, output_dir)
+        if tasks is not None:
+            os.makedirs(output_dir, exist_ok=True)
+            for path in rendered_page_files(tasks, output_dir):
+                pages.put(path)
+                count += 1
+    except Exception as e:
+        print(f"Error rendering job '{name}': {e}")
+    finally:
+        pages.put(None)
+    record_itinerary(start, count > 0)
+    return name, count, time.perf_counter() - start, page_cache.stats_since(cache_before), metrics.since(metrics_before)
+
+def preload_render_state(config_data: dict):
+    """Loads fonts and icons used by the page generators (run once in a pre-fork parent)."""
+    asset_index.get_index()
+    raw_assets.load_manifest()
+    num_fonts = font_cache.preload_font_files()
+    num_icons = assets.preload_icons()
+    # Instantiate the (font, size) faces each page type asks for
+    try:
+        daywise_drawing.load_daywise_fonts(compile_daywise_config(config_data.get("daywise_config", {})))
+        page1_load_fonts(compile_page1_config(config_data.get("page1_config", {})))
+    except ValueError as e:
+        print(f"Warning: Not preloading page fonts: {e}")
+    load_hotel_fonts()
+    load_inc_exc_fonts(FONT_PATH_PLAYFAIR, FONT_PATH_ITEM)
+    print(f"Preloaded {num_fonts} font file(s) and {num_icons} icon(s) for workers.")
+
+def load_batch_jobs(config_data: dict, batch_dir: str) -> list:
+    """Loads and validates every itinerary details JSON in batch_dir, in file name order.
+
+    Returns [(job name, details data)]; the details are None for jobs that
+    could not be loaded or are invalid (already reported).
+    """
+    job_files = sorted(glob.glob(os.path.join(batch_dir, "*.json")))
+    if not job_files:
+        print(f"Warning: No itinerary details JSON files found in '{batch_dir}'.")
+    entries = []
+    for path in job_files:
+        details_data = load_json_file(path, "itinerary details")
+        name = os.path.splitext(os.path.basename(path))[0]
+        # Rejected here, before a worker is spent on the job
+        if details_data is not None and not check_job(config_data, details_data, f"job '{name}'"):
+            details_data = None
+        entries.append((name, details_data))
+    return entries
+
+def run_batch(config_data: dict, batch_dir: str, num_workers: int = None, results: dict = None):
+    """Renders every itinerary details JSON in batch_dir on a pre-forked worker pool.
+
+    Each job's pages and PDF go to outputs/<job name>/. Returns the number of
+    failed jobs; `results`, if given, is filled with job name -> PDF path (None if failed).
+    """
+    entries = load_batch_jobs(config_data, batch_dir)
+    if not entries:
+        return 0
+
+    jobs = []
+    failed = 0
+    for name, details_data in entries:
+        if results is not None:
+            results[name] = None
+        if details_data is None:
+            failed += 1
+            continue
+        jobs.append((name, config_data, details_data, os.path.join(OUTPUTS_BASE_DIR, name)))
+
+    if not jobs:
+        print(f"--- Batch complete: 0 succeeded, {failed} failed ---")
+        return failed
+
+    print(f"\n--- Rendering {len(jobs)} itinerary job(s) from {batch_dir} ---")
+    pool = create_worker_pool(num_workers, preload=preload_render_state, preload_args=(config_data,))
+    usage = metrics.PoolUsage("batch", pool_size(num_workers))
+    metrics.QUEUE_DEPTH.set(len(jobs), queue="batch_jobs")
+    cache_stats = {}
+    try:
+        for name, pdf_path, elapsed, job_cache_stats, job_metrics in pool.imap_unordered(render_job, jobs):
+            metrics.merge(job_metrics)
+            usage.job_done(elapsed)
+            metrics.QUEUE_DEPTH.dec(queue="batch_jobs")
+            page_cache.add_stats(cache_stats, job_cache_stats)
+            if results is not None:
+                results[name] = pdf_path
+            if pdf_path:
+                print(f"Job '{name}' done in {elapsed:.2f}s: {pdf_path}")
+            else:
+                failed += 1
+                print(f"Job '{name}' failed after {elapsed:.2f}s")
+    finally:
+        pool.close()
+        pool.join()
+    print(f"--- Batch complete: {len(entries) - failed} succeeded, {failed} failed ---")
+    if page_cache.is_enabled():
+        print(f"Page cache: {page_cache.format_stats(cache_stats)}")
+    return failed
+
+def build_book(config_data: dict, batch_dir: str, output_path: str = BOOK_PDF_PATH, num_workers: int = None):
+    """Renders every itinerary in batch_dir and merges them into one bookmarked PDF.
+
+    Pages appear itinerary by itinerary (in file name order); identical pages
+    are stored once. Returns (PDF path or None, number of failed jobs).
+    """
+    results = {}
+    failed = run_batch(config_data, batch_dir, num_workers, results)
+    rendered = [(name, pdf_path) for name, pdf_path in results.items() if pdf_path]
+    if not rendered:
+        print("Error: No itineraries were rendered to create the book.")
+        return None, failed
+
+    start = time.perf_counter()
+    print(f"\n--- Assembling book from {len(rendered)} itinerary PDF(s) ---")
+    try:
+        with metrics.STAGE_SECONDS.time(stage="book"), pdf_book.PdfBook(output_path, title="Itinerary Options") as book:
+            for name, pdf_path in rendered:
+                book.add_section(name)
+                for page_file in page_files(os.path.dirname(pdf_path)):
+                    book.add_page(page_file)
+    except Exception as e:
+        print(f"An error occurred during book creation: {e}")
+        return None, failed
+    stats = book.stats
+    print(f"Book written in {(time.perf_counter() - start) * 1000:.0f} ms: {output_path} "
+          f"({stats['pages']} pages, {stats['images']} unique page images, "
+          f"{stats['deduplicated_bytes'] // 1024} KiB of identical pages stored once)")
+    return finish_pdf(output_path), failed
+
+def soak_itinerary(config_data: dict, details_data: dict, iterations: int, report_path: str = SOAK_REPORT_PATH,
+                   **render_options) -> bool:
+    """Renders one itinerary `iterations` times in this process and checks for leaks (see core/soak.py).
+
+    Each iteration's output is only shown if it fails. Returns True if the
+    process stopped growing after warm-up.
+    """
+    def render_once(iteration: int) -> bool:
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            pdf_path = render_itinerary(config_data, details_data, SOAK_OUTPUT_DIR, **render_options)
+        if pdf_path is None:
+            print(f"Soak iteration {iteration + 1} failed:\n{log.getvalue()}")
+        return pdf_path is not None
+
+    print(f"\n--- Soak: rendering the itinerary {iterations} time(s) ---")
+    report = soak.run_soak(render_once, iterations)
+    soak.print_report(report)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Soak report written to {report_path}")
+    return report["ok"]
+
+def print_sprite_stats(page_workers: int = None):
+    """Prints the text sprite cache's hit rate.
+
+    With page workers the pages were drawn in the workers, so the lookups
+    merged into the metrics are reported instead of this process's own cache.
+    """
+    if page_workers:
+        hits = int(metrics.CACHE_LOOKUPS.value(cache="text_sprites", result="hit"))
+        misses = int(metrics.CACHE_LOOKUPS.value(cache="text_sprites", result="miss"))
+        hit_rate = hits / (hits + misses) if hits + misses else 0.0
+        print(f"Text sprite cache (all page workers): {hits} hits, {misses} misses (hit rate {hit_rate:.0%})")
+        return
+    sprite_stats = text_sprites.get_cache().stats()
+    print(f"Text sprite cache: {sprite_stats['hits']} hits, {sprite_stats['misses']} misses "
+          f"(hit rate {sprite_stats['hit_rate']:.0%}), {sprite_stats['entries']} sprites, {sprite_stats['bytes'] // 1024} KiB")
+
+def write_metrics(path: str = METRICS_PATH):
+    """Writes the run's metrics as JSON (at the end of CLI and batch runs)."""
+    try:
+        metrics.dump_json(path)
+        print(f"Metrics written to {path}")
+    except OSError as e:
+        print(f"Warning: Could not write metrics to {path}: {e}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.deterministic:
+        determinism.enable_deterministic_mode()
+        print("Deterministic rendering mode enabled.")
+
+    if args.no_prefetch:
+        prefetch.set_enabled(False)
+
+    if args.compile_assets:
+        compiled = raw_assets.compile_assets()
+        print(f"Compiled {compiled} image asset(s) into {raw_assets.RAW_ASSETS_DIR}")
+        return
+
+    # Load Config Data
+    config_data = load_json_file(INPUT_JSON_PATH, "config data")
+    if config_data is None:
+        sys.exit(1)
+
+    if args.check_layout:
+        if args.batch:
+            paths = sorted(glob.glob(os.path.join(args.batch, "*.json")))
+            jobs = [(os.path.splitext(os.path.basename(path))[0], load_json_file(path, "itinerary details")) for path in paths]
+        else:
+            jobs = [("itinerary", load_json_file(INPUT_DETAILS_PATH, "itinerary details"))]
+        failed = sum(details_data is None for _, details_data in jobs)
+        failed += check_layouts(config_data, [job for job in jobs if job[1] is not None])
+        sys.exit(1 if failed else 0)
+
+    if args.linearize:
+        if args.update:
+            print("Error: --linearize can't be combined with --update (an updated PDF is no longer linearized).")
+            sys.exit(2)
+        pdf_linearize.set_enabled(True) # Inherited by the batch/service workers
+
+    if args.validate_only and (args.book or args.batch):
+        entries = load_batch_jobs(config_data, args.book or args.batch)
+        failed = sum(details_data is None for _, details_data in entries)
+        print(f"--- Validated {len(entries)} job(s): {len(entries) - failed} valid, {failed} invalid ---")
+        sys.exit(1 if failed else 0)
+    if args.validate_only and args.serve is not None:
+        sys.exit(0 if check_job(config_data, None, "service config", config_only=True) else 1)
+
+    # Batch and service jobs share identical pages through the page cache (inherited by the workers)
+    if (args.batch or args.book or args.serve is not None) and not args.no_page_cache:
+        page_cache.set_enabled(True)
+
+    if args.metrics_port is not None:
+        try:
+            metrics.serve_http(args.metrics_port)
+            print(f"Metrics at http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e:
+            print(f"Warning: Could not serve metrics on port {args.metrics_port}: {e}")
+
+    if args.book:
+        book_path, failed = build_book(config_data, args.book, BOOK_PDF_PATH, args.workers)
+        write_metrics()
+        sys.exit(1 if book_path is None or failed else 0)
+
+    if args.batch:
+        failed = run_batch(config_data, args.batch, args.workers)
+        write_metrics()
+        sys.exit(1 if failed else 0)
+
+    if args.serve is not None:
+        serve(config_data, port=args.serve, num_workers=args.workers,
+              preload=preload_render_state, render=render_job, validate=validate_job, preview=preview_job,
+              stream=stream_job)
+        return
+
+    # Load Itinerary Details Data
+    details_data = load_json_file(INPUT_DETAILS_PATH, "itinerary details")
+    if details_data is None:
+        sys.exit(1)
+
+    if not check_job(config_data, details_data, "itinerary"):
+        sys.exit(1)
+    if args.validate_only:
+        return
+
+    if args.preview:
+        start = time.perf_counter()
+        # Asset hrefs are relative to the preview files
+        assets = preview.PreviewAssets(os.path.join(PREVIEW_DIR, "assets"), "assets/")
+        result = build_preview(config_data, details_data, assets, args.preview, PREVIEW_DIR)
+        if result is None:
+            sys.exit(1)
+        if args.preview == "html":
+            html_path = os.path.join(PREVIEW_DIR, "index.html")
+            with open(html_path, "w", encoding="utf-8") as f:
+                f.write(result)
+            result = [html_path]
+        print(f"Preview written in {(time.perf_counter() - start) * 1000:.0f} ms: {', '.join(result)}")
+        return
+
+    if args.soak:
+        ok = soak_itinerary(config_data, details_data, args.soak, page_workers=args.page_workers,
+                            strategy=args.strategy, queue_depth=args.queue_depth)
+        sys.exit(0 if ok else 1)
+
+    render = update_itinerary if args.update else render_itinerary
+    start = time.perf_counter()
+    pdf_path = render(config_data, details_data, OUTPUTS_BASE_DIR, page_workers=args.page_workers,
+                      strategy=args.strategy, queue_depth=args.queue_depth)
+    record_itinerary(start, pdf_path is not None)
+    print_sprite_stats(args.page_workers)
+    write_metrics()
+    if pdf_path is None:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
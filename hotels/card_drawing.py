@@ -1,6 +1,7 @@
-import os
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
-from datetime import datetime # Added for robust date parsing
+from PIL import Image, ImageDraw
+from core import asset_index, assets, display_list, text_fit
+from core.display_list import Blur, DisplayList, Line, Paste, RoundedRect, Text
+from core.itinerary import Hotel, parse_stay_time
 
 # Import shared constants (if needed, e.g., text colors)
 # Assuming hotels_page_generator defines TEXT_DARK
@@ -93,20 +94,23 @@ def create_rounded_rectangle_mask(size, radius, *, inner_fill=255, outer_fill=0)
 
     return mask
 
-def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_dims: tuple) -> tuple:
-    """Draws Card 1: Name, Stars, Address, Phone (Centered). Returns bounding box.""" # Renamed & updated docstring
+def layout_main_info_card(dl: DisplayList, hotel_info: Hotel, fonts: dict, page_dims: tuple, report=None) -> tuple:
+    """Lays out Card 1: Name, Stars, Address, Phone (Centered) into `dl`. Returns bounding box.
+
+    With `dl` None only the card geometry is measured (recorded in `report`, a LayoutReport, if given).
+    """
     page_width, page_height = page_dims
-    draw = ImageDraw.Draw(img)
+    draw = display_list.measurer() # Layout only measures; the painter draws
 
     # --- 1. Extract Data & Prepare Text/Icons ---
-    name = hotel_info.get("name", "Hotel Name N/A")
-    stars_count = hotel_info.get("stars", 0)
-    try: stars_count = int(stars_count)
-    except (ValueError, TypeError): stars_count = 0
-    address = hotel_info.get("short_address", "Address N/A")
-    phone = hotel_info.get("phone_number", "Phone N/A")
-
-    font_huge_name = fonts['playfair_huge']
+    name = hotel_info.name
+    stars_count = hotel_info.stars
+    address = hotel_info.short_address
+    phone = hotel_info.phone_number
+
+    # Long names are sized down to fit the widest card
+    font_huge_name = text_fit.fit_font(fonts['playfair_huge'], name,
+                                       int(page_width * CARD1_MAX_WIDTH_RATIO) - 2 * CARD1_HPADDING)
     font_detail_label = fonts['inter_xl_detail'] # Use XL detail font
     font_small_detail = fonts['inter_small'] # For NA text
 
@@ -114,9 +118,8 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     star_icon = None
     star_icon_w, star_icon_h = STAR_ICON_SIZE, STAR_ICON_SIZE
     try:
-        if os.path.exists(STAR_ICON_PATH):
-            star_icon = Image.open(STAR_ICON_PATH).convert("RGBA")
-            star_icon = star_icon.resize((STAR_ICON_SIZE, STAR_ICON_SIZE), Image.Resampling.LANCZOS)
+        if asset_index.exists(STAR_ICON_PATH):
+            star_icon = assets.load_icon(STAR_ICON_PATH, (STAR_ICON_SIZE, STAR_ICON_SIZE)) # Cached, read-only
             star_icon_w, star_icon_h = star_icon.size
         else: print(f"Warning: Star icon not found at '{STAR_ICON_PATH}'.")
     except Exception as e: print(f"Error loading star icon '{STAR_ICON_PATH}': {e}")
@@ -124,9 +127,8 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     loc_pin_icon = None
     loc_pin_w, loc_pin_h = LOCATION_PIN_SIZE, LOCATION_PIN_SIZE
     try:
-        if os.path.exists(LOCATION_PIN_ICON_PATH):
-            loc_pin_icon = Image.open(LOCATION_PIN_ICON_PATH).convert("RGBA")
-            loc_pin_icon = loc_pin_icon.resize((LOCATION_PIN_SIZE, LOCATION_PIN_SIZE), Image.Resampling.LANCZOS)
+        if asset_index.exists(LOCATION_PIN_ICON_PATH):
+            loc_pin_icon = assets.load_icon(LOCATION_PIN_ICON_PATH, (LOCATION_PIN_SIZE, LOCATION_PIN_SIZE)) # Cached, read-only
             loc_pin_w, loc_pin_h = loc_pin_icon.size
         else: print(f"Warning: Location pin icon not found at '{LOCATION_PIN_ICON_PATH}'.")
     except Exception as e: print(f"Error loading location pin icon '{LOCATION_PIN_ICON_PATH}': {e}")
@@ -134,9 +136,8 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     phone_icon = None
     phone_icon_w, phone_icon_h = PHONE_ICON_SIZE, PHONE_ICON_SIZE
     try:
-        if os.path.exists(PHONE_ICON_PATH):
-            phone_icon = Image.open(PHONE_ICON_PATH).convert("RGBA")
-            phone_icon = phone_icon.resize((PHONE_ICON_SIZE, PHONE_ICON_SIZE), Image.Resampling.LANCZOS)
+        if asset_index.exists(PHONE_ICON_PATH):
+            phone_icon = assets.load_icon(PHONE_ICON_PATH, (PHONE_ICON_SIZE, PHONE_ICON_SIZE)) # Cached, read-only
             phone_icon_w, phone_icon_h = phone_icon.size
         else: print(f"Warning: Phone icon not found at '{PHONE_ICON_PATH}'.")
     except Exception as e: print(f"Error loading phone icon '{PHONE_ICON_PATH}': {e}")
@@ -194,42 +195,36 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     card_y = int(page_height * CARD1_TOP_POS_RATIO)
     card_box = (card_x, card_y, card_x + card_width, card_y + card_height)
 
+    if report is not None:
+        max_width = int(page_width * CARD1_MAX_WIDTH_RATIO)
+        widest = "name" if max_content_width == name_w else "stars" if max_content_width == stars_row_w else "address/phone"
+        report.add("Main info card", "width", max_width, content_width_padded,
+                   [f"{widest} needs {content_width_padded - max_width:.0f}px more than the card's maximum width"
+                    if content_width_padded > max_width else None])
+    if dl is None:
+        return card_box
+
     # --- 3. Apply Frosted Glass Effect ---
-    background_crop = img.crop(card_box)
-    blurred_crop = background_crop.filter(ImageFilter.GaussianBlur(CARD1_BLUR_RADIUS))
     mask = create_rounded_rectangle_mask((card_width, card_height), CARD1_CORNER_RADIUS)
-    if blurred_crop.mode != 'RGBA': blurred_crop = blurred_crop.convert('RGBA')
-    img.paste(blurred_crop, (card_x, card_y), mask)
+    dl.add(Blur(card_box, CARD1_BLUR_RADIUS, mask))
 
     # --- 3.5 Add Glassy Border (New) ---
-    draw = ImageDraw.Draw(img)
     outer_border_color = (170, 170, 170, 70) # Light gray, more transparent outer edge
     inner_border_color = (170, 170, 170, 150) # Light gray, slightly more opaque inner edge
     outer_border_thickness = 2
     inner_border_thickness = 1
 
     # Draw outer border
-    draw.rounded_rectangle(
-        card_box, 
-        radius=CARD1_CORNER_RADIUS, 
-        outline=outer_border_color, 
-        width=outer_border_thickness
-    )
+    dl.add(RoundedRect(card_box, CARD1_CORNER_RADIUS, None, outer_border_color, outer_border_thickness))
     # Draw inner border (on top of the outer one, at the same position but thinner)
-    draw.rounded_rectangle(
-        card_box, 
-        radius=CARD1_CORNER_RADIUS, 
-        outline=inner_border_color, 
-        width=inner_border_thickness
-    )
+    dl.add(RoundedRect(card_box, CARD1_CORNER_RADIUS, None, inner_border_color, inner_border_thickness))
 
     # --- 4. Draw Text & Icons ---
-    draw = ImageDraw.Draw(img)
     current_y = card_y + CARD1_VPADDING
 
     # Hotel Name (HUGE, Centered)
     text_x = card_x + (card_width - name_w) // 2
-    draw.text((text_x, current_y), name, fill=TEXT_LIGHT, font=font_huge_name)
+    dl.add(Text((text_x, current_y), name, font_huge_name, TEXT_LIGHT, None))
     current_y += name_h + NAME_STAR_SPACING
 
     # Stars (Icons or Text, Centered)
@@ -238,12 +233,12 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
         star_y = current_y
         current_star_x = star_row_start_x
         for _ in range(stars_count):
-            img.paste(star_icon, (current_star_x, star_y), star_icon)
+            dl.add(Paste(star_icon, (current_star_x, star_y), star_icon))
             current_star_x += star_icon_w + STAR_SPACING
     elif stars_count == 0:
         na_text = "Rating N/A"
         text_x = card_x + (card_width - stars_row_w) // 2
-        draw.text((text_x, current_y), na_text, fill=TEXT_DARK, font=font_small_detail)
+        dl.add(Text((text_x, current_y), na_text, font_small_detail, TEXT_DARK, None))
     current_y += stars_row_h + STAR_DETAIL_SPACING # Use increased spacing
 
     # -- Centered Detail Block --
@@ -256,7 +251,7 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     icon_y_addr = current_y + (detail_addr_line_h - loc_pin_h) // 2 # Center icon in line height
 
     if loc_pin_icon:
-        img.paste(loc_pin_icon, (current_x_addr_icon, icon_y_addr), loc_pin_icon)
+        dl.add(Paste(loc_pin_icon, (current_x_addr_icon, icon_y_addr), loc_pin_icon))
         current_x_addr_text += loc_pin_w + LOCATION_TEXT_SPACING # Adjust text start after icon
         icon_center_y = icon_y_addr + loc_pin_h / 2
         text_y_addr = icon_center_y - (addr_h / 2) # Align text center to icon center
@@ -264,7 +259,7 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     else:
         text_y_addr = current_y + (detail_addr_line_h - addr_h) // 2
 
-    draw.text((current_x_addr_text, text_y_addr), address, fill=TEXT_DARK, font=font_detail_label)
+    dl.add(Text((current_x_addr_text, text_y_addr), address, font_detail_label, TEXT_DARK, None))
     current_y += detail_addr_line_h + DETAIL_LINE_SPACING
 
     # Phone (Large Text, Vertically Centered with Icon, Nudged Right)
@@ -276,7 +271,7 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     icon_y_phone = current_y + (detail_phone_line_h - phone_icon_h) // 2 # Center icon in line height
 
     if phone_icon:
-        img.paste(phone_icon, (current_x_phone_icon, icon_y_phone), phone_icon)
+        dl.add(Paste(phone_icon, (current_x_phone_icon, icon_y_phone), phone_icon))
         current_x_phone_text += phone_icon_w + PHONE_TEXT_SPACING # Adjust text start after icon
         icon_center_y = icon_y_phone + phone_icon_h / 2
         text_y_phone = icon_center_y - (phone_h / 2) # Align text center to icon center
@@ -284,71 +279,38 @@ def draw_main_info_card(img: Image.Image, hotel_info: dict, fonts: dict, page_di
     else:
         text_y_phone = current_y + (detail_phone_line_h - phone_h) // 2
 
-    draw.text((current_x_phone_text, text_y_phone), phone, fill=TEXT_DARK, font=font_detail_label)
+    dl.add(Text((current_x_phone_text, text_y_phone), phone, font_detail_label, TEXT_DARK, None))
 
-    print(f"  -> Drawn Main Info Card at ({card_x}, {card_y}) size {card_width}x{card_height}") # Updated print
+    print(f"  -> Laid out Main Info Card at ({card_x}, {card_y}) size {card_width}x{card_height}") # Updated print
     return card_box # Return bounding box
 
 
-# --- Robust Date/Time Formatting Helper ---
+# --- Date/Time Formatting Helper ---
 def format_datetime_new(dt_str):
-    if not isinstance(dt_str, str): return "N/A", "N/A"
-
-    possible_formats = [
-        "%dth %B %I%p",   # 15th June 3PM
-        "%d %b %H:%M",    # 18 Jun 15:00
-        "%d %B %H:%M",    # 18 June 15:00
-        "%d %b %I:%M%p",  # 18 Jun 03:00PM
-        "%d %B %I:%M%p",  # 18 June 03:00PM
-        "%d %b %I%p",     # 18 Jun 3PM
-        # Add more formats if needed
-    ]
-    dt_obj = None
-    # Clean up 'th', 'st', 'nd', 'rd' and handle potential missing space before AM/PM
-    cleaned_str = dt_str.upper().replace('TH','').replace('ST','').replace('ND','').replace('RD','')
-    if "AM" in cleaned_str and not " AM" in cleaned_str:
-       cleaned_str = cleaned_str.replace("AM", " AM")
-    if "PM" in cleaned_str and not " PM" in cleaned_str:
-       cleaned_str = cleaned_str.replace("PM", " PM")
-
-    for fmt in possible_formats:
-        try:
-            dt_obj = datetime.strptime(cleaned_str, fmt)
-            break # Stop if format matches
-        except ValueError:
-            continue
-
-    if dt_obj:
-        date_part = dt_obj.strftime("%d %B").upper() # Changed format to DD MONTHNAME (e.g., 15 JUNE)
-        time_part = dt_obj.strftime("%I %p")      # Changed format to H AM/PM (e.g., 03 PM)
-        # Handle potential leading zero in hour (e.g., 03 PM -> 3 PM)
-        if time_part.startswith('0'):
-            time_part = time_part[1:]
-        return date_part, time_part
-    else:
-        # Basic fallback if parsing fails
-        print(f"Warning: Could not parse datetime string '{dt_str}' with known formats.")
-        parts = dt_str.split()
-        if len(parts) >= 2:
-            return parts[0].upper(), " ".join(parts[1:]).upper()
-        return dt_str.upper(), "" # Or return N/A, N/A
+    """Splits a check-in/out string into printed (date, time) labels.
 
+    Hotel records carry these labels already (parsed once with the itinerary);
+    this is kept for callers formatting raw strings.
+    """
+    return parse_stay_time(dt_str)
 
-def draw_checkin_card(img: Image.Image, hotel_info: dict, fonts: dict, page_dims: tuple, card1_box: tuple):
-    """Draws Card 2: Check-in / Check-out times, positioned below card1_box."""
-    print("\n--- Inside draw_checkin_card --- ") # DEBUG PRINT
+
+def layout_checkin_card(dl: DisplayList, hotel_info: Hotel, fonts: dict, page_dims: tuple, card1_box: tuple, report=None):
+    """Lays out Card 2: Check-in / Check-out times, positioned below card1_box, into `dl`.
+
+    `dl` None and `report` as in layout_main_info_card.
+    """
+    print("\n--- Inside layout_checkin_card --- ") # DEBUG PRINT
     page_width, page_height = page_dims
-    draw = ImageDraw.Draw(img)
+    draw = display_list.measurer() # Layout only measures; the painter draws
 
     # --- 1. Extract Data & Format ---
-    checkin_time_str = hotel_info.get("check_in_time", "N/A")
-    checkout_time_str = hotel_info.get("check_out_time", "N/A")
     checkin_label = "CHECK-IN"
     checkout_label = "CHECK-OUT"
 
-    # Use the new robust formatter
-    checkin_date_formatted, checkin_time_formatted = format_datetime_new(checkin_time_str)
-    checkout_date_formatted, checkout_time_formatted = format_datetime_new(checkout_time_str)
+    # Parsed into date/time labels when the itinerary was loaded
+    checkin_date_formatted, checkin_time_formatted = hotel_info.check_in_date, hotel_info.check_in_time
+    checkout_date_formatted, checkout_time_formatted = hotel_info.check_out_date, hotel_info.check_out_time
 
     print(f"  Formatted Check-in: {checkin_date_formatted} / {checkin_time_formatted}") # DEBUG PRINT
     print(f"  Formatted Check-out: {checkout_date_formatted} / {checkout_time_formatted}") # DEBUG PRINT
@@ -410,45 +372,41 @@ def draw_checkin_card(img: Image.Image, hotel_info: dict, fonts: dict, page_dims
     card1_bottom_y = card1_box[3]
     card_y = card1_bottom_y + CARD_SPACING
     print(f"  Card 1 Bottom: {card1_bottom_y}, Card 2 Top: {card_y}, Card 2 Height: {card_height}") # DEBUG PRINT
+    if report is not None:
+        max_width = int(page_width * CARD2_MAX_WIDTH_RATIO)
+        report.add("Check-in card", "width", max_width, content_width_padded,
+                   [f"dates/times need {content_width_padded - max_width:.0f}px more than the card's maximum width"
+                    if content_width_padded > max_width else None])
+        room = page_height - card_y
+        report.add("Check-in card", "height", room, card_height,
+                   [f"doesn't fit below the main card; moved up over it by {card_height - room:.0f}px"
+                    if card_height > room else None])
     if card_y + card_height > page_height:
         print("Warning: Calculated Checkin Card position extends below page boundary. Adjusting upwards.")
         card_y = page_height - card_height - 10 # Adjust margin
         print(f"  Adjusted Card 2 Top: {card_y}") # DEBUG PRINT
     card_box = (card_x, card_y, card_x + card_width, card_y + card_height)
+    if dl is None:
+        return
 
 
     # --- 3. Apply Frosted Glass Effect ---
-    background_crop = img.crop(card_box)
-    blurred_crop = background_crop.filter(ImageFilter.GaussianBlur(CARD2_BLUR_RADIUS))
     mask = create_rounded_rectangle_mask((card_width, card_height), CARD2_CORNER_RADIUS)
-    if blurred_crop.mode != 'RGBA': blurred_crop = blurred_crop.convert('RGBA')
-    img.paste(blurred_crop, (card_x, card_y), mask)
+    dl.add(Blur(card_box, CARD2_BLUR_RADIUS, mask))
 
 
     # --- 3.5 Add Glassy Border (New) ---
-    draw = ImageDraw.Draw(img)
     outer_border_color = (170, 170, 170, 70) # Light gray, more transparent outer edge
     inner_border_color = (170, 170, 170, 150) # Light gray, slightly more opaque inner edge
     outer_border_thickness = 2
     inner_border_thickness = 1
     # Draw outer border
-    draw.rounded_rectangle(
-        card_box,
-        radius=CARD2_CORNER_RADIUS,
-        outline=outer_border_color,
-        width=outer_border_thickness
-    )
+    dl.add(RoundedRect(card_box, CARD2_CORNER_RADIUS, None, outer_border_color, outer_border_thickness))
     # Draw inner border (on top of the outer one, at the same position but thinner)
-    draw.rounded_rectangle(
-        card_box,
-        radius=CARD2_CORNER_RADIUS,
-        outline=inner_border_color,
-        width=inner_border_thickness
-    )
+    dl.add(RoundedRect(card_box, CARD2_CORNER_RADIUS, None, inner_border_color, inner_border_thickness))
 
 
     # --- 4. Draw Text (Multi-line Layout) ---
-    draw = ImageDraw.Draw(img) # Ensure draw context is active
     content_start_x = card_x + (card_width - total_content_width) // 2 # Center the whole content block
 
     # Vertical positions
@@ -464,9 +422,9 @@ def draw_checkin_card(img: Image.Image, hotel_info: dict, fonts: dict, page_dims
     col1_date_x = content_start_x + (col1_w - cin_date_w) // 2
     col1_time_x = content_start_x + (col1_w - cin_time_w) // 2
 
-    draw.text((col1_label_x, label_y), checkin_label, fill=TEXT_DARK, font=font_label)
-    draw.text((col1_date_x, date_y), checkin_date_formatted, fill=TEXT_DARK, font=font_date)
-    draw.text((col1_time_x, time_y), checkin_time_formatted, fill=TEXT_DARK, font=font_time)
+    dl.add(Text((col1_label_x, label_y), checkin_label, font_label, TEXT_DARK, None))
+    dl.add(Text((col1_date_x, date_y), checkin_date_formatted, font_date, TEXT_DARK, None))
+    dl.add(Text((col1_time_x, time_y), checkin_time_formatted, font_time, TEXT_DARK, None))
 
 
     # -- Separator Line (Thicker, Opaque) --
@@ -476,7 +434,7 @@ def draw_checkin_card(img: Image.Image, hotel_info: dict, fonts: dict, page_dims
     line_y_end = time_y + time_h + 10
     line_color = (0, 0, 0, 255) # Changed to Opaque Black
     line_thickness = 4 # Increased thickness
-    draw.line([(line_x, line_y_start), (line_x, line_y_end)], fill=line_color, width=line_thickness)
+    dl.add(Line([(line_x, line_y_start), (line_x, line_y_end)], line_color, line_thickness))
 
 
     # -- Column 2 (Check-out) --
@@ -486,12 +444,12 @@ def draw_checkin_card(img: Image.Image, hotel_info: dict, fonts: dict, page_dims
     col2_date_x = col2_start_x + (col2_w - cout_date_w) // 2
     col2_time_x = col2_start_x + (col2_w - cout_time_w) // 2
 
-    draw.text((col2_label_x, label_y), checkout_label, fill=TEXT_DARK, font=font_label)
-    draw.text((col2_date_x, date_y), checkout_date_formatted, fill=TEXT_DARK, font=font_date)
-    draw.text((col2_time_x, time_y), checkout_time_formatted, fill=TEXT_DARK, font=font_time)
+    dl.add(Text((col2_label_x, label_y), checkout_label, font_label, TEXT_DARK, None))
+    dl.add(Text((col2_date_x, date_y), checkout_date_formatted, font_date, TEXT_DARK, None))
+    dl.add(Text((col2_time_x, time_y), checkout_time_formatted, font_time, TEXT_DARK, None))
 
 
-    print(f"  -> Drawn Checkin Card at ({card_x}, {card_y}) size {card_width}x{card_height}")
+    print(f"  -> Laid out Checkin Card at ({card_x}, {card_y}) size {card_width}x{card_height}")
 
 
 # --- Removed draw_details_card function ---
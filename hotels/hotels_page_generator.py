@@ -1,10 +1,16 @@
 import os
 import glob
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageEnhance
+from PIL import Image, ImageDraw, ImageFilter
 import textwrap # Import textwrap for potential long lines
 
 # Import card drawing functions (Updated)
-from .card_drawing import draw_main_info_card, draw_checkin_card
+from . import card_drawing
+from .card_drawing import layout_main_info_card, layout_checkin_card
+from core import asset_index, determinism, display_list, page_cache, prefetch
+from core.display_list import DisplayList
+from core import fonts as font_cache
+from core.background import load_background
+from core.itinerary import to_hotels
 
 # --- Constants ---
 A4_WIDTH_MM = 210
@@ -25,143 +31,112 @@ TEXT_LIGHT = (255, 255, 255) # #FFFFFF
 FONT_PATH_PLAYFAIR = "fonts/PlayfairDisplay-Bold.ttf" # Try loading bold variant
 FONT_PATH_PLAYFAIR_ITALIC = "fonts/PlayfairDisplay-BoldItalic.ttf" # Try loading bold italic variant
 FONT_PATH_INTER = "fonts/Inter-SemiBold.ttf"         # Try loading semibold variant
-HERO_IMAGE_SEARCH_PATH = "inputs/hotel_bg.*"
+HERO_IMAGE_NAME = "inputs/hotel_bg" # Any image extension
+HERO_BRIGHTNESS = 0.8 # Darken the hero so the frosted cards stand out
 
-def generate_hotels_page(output_filename: str, base_output_dir: str, hotel_details: dict): # Simplified input for now
-    """Generates a premium hotel details page resembling a brochure."""
-
-    output_path = os.path.join(base_output_dir, output_filename)
-    os.makedirs(os.path.dirname(output_path), exist_ok=True) # Ensure dir exists
-
-    # --- 1. Canvas Setup ---
-    img = Image.new('RGBA', (PAGE_WIDTH_PX, PAGE_HEIGHT_PX), (0, 0, 0, 0)) # Use RGBA for compositing
-
-    # --- 2. Hero Image (Layer 1) ---
+def load_hotel_fonts() -> dict:
+    """Loads the fonts used by the hotel cards (cached per process)."""
+    fonts = {}
+    try:
+        # Increased font sizes (approx 10-15%)
+        fonts['playfair_huge'] = font_cache.get_font(FONT_PATH_PLAYFAIR, 270) # HUGE name font (Increased size)
+        fonts['playfair_regular'] = font_cache.get_font(FONT_PATH_PLAYFAIR, 70) # Increased size
+        fonts['playfair_italic'] = font_cache.get_font(FONT_PATH_PLAYFAIR_ITALIC, 70) # Increased size
+        fonts['inter_star'] = font_cache.get_font(FONT_PATH_INTER, 42) # Increased size
+        fonts['inter_body'] = font_cache.get_font(FONT_PATH_INTER, 42)     # Increased size
+        fonts['inter_large_detail'] = font_cache.get_font(FONT_PATH_INTER, 70) # Increased size
+        fonts['inter_xl_detail'] = font_cache.get_font(FONT_PATH_INTER, 90)    # Increased size
+        fonts['inter_small'] = font_cache.get_font(FONT_PATH_INTER, 32)    # Increased size
+        fonts['inter_label'] = font_cache.get_font(FONT_PATH_INTER, 36)    # Increased size
+        # We might need more variations later (bold, etc.)
+    except IOError as e:
+        print(f"Warning: One or more font files not found ({e}). Using default fonts.")
+        # Fallback to default fonts - Increased sizes here too
+        fonts['playfair_huge'] = font_cache.default_font(270) # Increased fallback size
+        fonts['playfair_regular'] = font_cache.default_font(70)
+        fonts['playfair_italic'] = font_cache.default_font(70)
+        fonts['inter_star'] = font_cache.default_font(42)
+        fonts['inter_body'] = font_cache.default_font(42)
+        fonts['inter_large_detail'] = font_cache.default_font(70) # Large detail font fallback
+        fonts['inter_xl_detail'] = font_cache.default_font(90)    # XL detail font fallback
+        fonts['inter_small'] = font_cache.default_font(32)
+        fonts['inter_label'] = font_cache.default_font(36)
+    return fonts
+
+def prefetch_hotels_page():
+    """Starts preparing the hotel hero background on the prefetch threads."""
+    hero_entry = asset_index.resolve(HERO_IMAGE_NAME)
+    if hero_entry:
+        prefetch.prefetch(load_background, hero_entry.path, (PAGE_WIDTH_PX, PAGE_HEIGHT_PX), HERO_BRIGHTNESS)
+
+def layout_hotels_page(hotel_details):
+    """Lays out the hotel page as a display list over the prepared hero background.
+
+    Returns None if the hero image is missing or can't be loaded.
+    """
+    hotels = to_hotels(hotel_details)
+
+    # --- 1. Hero Image (Layer 1) ---
+    hero_image_path = None
     try:
-        hero_image_path = None
-        possible_files = glob.glob(HERO_IMAGE_SEARCH_PATH)
-        if possible_files:
-            hero_image_path = possible_files[0] # Take the first match
+        hero_entry = asset_index.resolve(HERO_IMAGE_NAME)
+        if hero_entry:
+            hero_image_path = hero_entry.path
             print(f"Found hero image: {hero_image_path}")
         else:
-             raise FileNotFoundError(f"Hero image not found at {HERO_IMAGE_SEARCH_PATH}")
-
-        hero_img = Image.open(hero_image_path).convert("RGBA") # Convert to RGBA
-        hero_w, hero_h = hero_img.size
-        target_w, target_h = PAGE_WIDTH_PX, PAGE_HEIGHT_PX
-        target_aspect = target_h / target_w
-        hero_aspect = hero_h / hero_w
-
-        # --- Corrected Scaling and Cropping Logic ---
-        scale_factor = 1.0
-        if hero_aspect < target_aspect: 
-            # Hero is wider than target aspect ratio (e.g., landscape)
-            # Scale based on height to ensure it fills vertically
-            scale_factor = target_h / hero_h
-            print(f"Hero wider than target. Scaling by height factor: {scale_factor:.4f}")
-        else: 
-            # Hero is taller than or same as target aspect ratio (e.g., portrait)
-            # Scale based on width to ensure it fills horizontally
-            scale_factor = target_w / hero_w
-            print(f"Hero taller than/matches target. Scaling by width factor: {scale_factor:.4f}")
-
-        # Resize maintaining aspect ratio
-        new_w = int(hero_w * scale_factor)
-        new_h = int(hero_h * scale_factor)
-        hero_resized = hero_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        print(f"Resized hero to: {new_w}x{new_h}")
-
-        # Center crop the resized image to target dimensions
-        crop_x = (new_w - target_w) // 2
-        crop_y = (new_h - target_h) // 2
-        
-        # Ensure crop coordinates are non-negative (can happen with float precision)
-        crop_x = max(0, crop_x)
-        crop_y = max(0, crop_y)
-        
-        crop_box = (crop_x, crop_y, crop_x + target_w, crop_y + target_h)
-        print(f"Final crop box: {crop_box}")
-        
-        # Perform the final crop
-        hero_final = hero_resized.crop(crop_box)
-        
-        # Sanity check final size
-        if hero_final.size != (target_w, target_h):
-             print(f"Warning: Final hero size {hero_final.size} doesn't match target {(target_w, target_h)}. Resizing again.")
-             hero_final = hero_final.resize((target_w, target_h), Image.Resampling.LANCZOS)
-
-        # --- Darken Hero Image ---
-        enhancer = ImageEnhance.Brightness(hero_final)
-        hero_final = enhancer.enhance(0.8) # Reduce brightness by 30%
-
-        # Paste onto the main canvas
-        img.paste(hero_final, (0, 0))
+             raise FileNotFoundError(f"Hero image not found at {HERO_IMAGE_NAME}.*")
+
+        # Fill-crop, scale and darken in one fused pass (usually done by the prefetch threads); this is the RGB canvas
+        img = prefetch.fetch(load_background, hero_image_path, (PAGE_WIDTH_PX, PAGE_HEIGHT_PX), HERO_BRIGHTNESS)
+        print(f"Prepared hero background at {PAGE_WIDTH_PX}x{PAGE_HEIGHT_PX}")
+        page = DisplayList((PAGE_WIDTH_PX, PAGE_HEIGHT_PX), "RGB", img)
 
     except FileNotFoundError as e:
         print(f"Error: {e}. Cannot proceed without hero image.")
         # Optionally: draw a placeholder background
+        img = Image.new('RGB', (PAGE_WIDTH_PX, PAGE_HEIGHT_PX))
         draw = ImageDraw.Draw(img)
         draw.rectangle([(0,0), (PAGE_WIDTH_PX, PAGE_HEIGHT_PX)], fill=(100,100,100), outline=None)
-        draw.text((50,50), "Hero Image Not Found", fill=(255,0,0), font=ImageFont.load_default(size=50))
+        draw.text((50,50), "Hero Image Not Found", fill=(255,0,0), font=font_cache.default_font(50))
         # Early exit or continue with placeholder? Let's exit for now.
         return
     except Exception as e:
         print(f"Error processing hero image {hero_image_path}: {e}")
         # Draw placeholder and exit
+        img = Image.new('RGB', (PAGE_WIDTH_PX, PAGE_HEIGHT_PX))
         draw = ImageDraw.Draw(img)
         draw.rectangle([(0,0), (PAGE_WIDTH_PX, PAGE_HEIGHT_PX)], fill=(100,100,100), outline=None)
-        draw.text((50,50), "Error loading Hero Image", fill=(255,0,0), font=ImageFont.load_default(size=50))
+        draw.text((50,50), "Error loading Hero Image", fill=(255,0,0), font=font_cache.default_font(50))
         return
 
-    # --- Font Loading ---
-    fonts = {}
-    # Moved font loading here, after potentially exiting early if hero fails
-    try:
-        # Increased font sizes (approx 10-15%)
-        fonts['playfair_huge'] = ImageFont.truetype(FONT_PATH_PLAYFAIR, 270) # HUGE name font (Increased size)
-        fonts['playfair_regular'] = ImageFont.truetype(FONT_PATH_PLAYFAIR, 70) # Increased size
-        fonts['playfair_italic'] = ImageFont.truetype(FONT_PATH_PLAYFAIR_ITALIC, 70) # Increased size
-        fonts['inter_star'] = ImageFont.truetype(FONT_PATH_INTER, 42) # Increased size
-        fonts['inter_body'] = ImageFont.truetype(FONT_PATH_INTER, 42)     # Increased size
-        fonts['inter_large_detail'] = ImageFont.truetype(FONT_PATH_INTER, 70) # Increased size
-        fonts['inter_xl_detail'] = ImageFont.truetype(FONT_PATH_INTER, 90)    # Increased size
-        fonts['inter_small'] = ImageFont.truetype(FONT_PATH_INTER, 32)    # Increased size
-        fonts['inter_label'] = ImageFont.truetype(FONT_PATH_INTER, 36)    # Increased size
-        # We might need more variations later (bold, etc.)
-    except IOError as e:
-        print(f"Warning: One or more font files not found ({e}). Using default fonts.")
-        # Fallback to default fonts - Increased sizes here too
-        fonts['playfair_huge'] = ImageFont.load_default(size=270) # Increased fallback size
-        fonts['playfair_regular'] = ImageFont.load_default(size=70)
-        fonts['playfair_italic'] = ImageFont.load_default(size=70)
-        fonts['inter_star'] = ImageFont.load_default(size=42)
-        fonts['inter_body'] = ImageFont.load_default(size=42)
-        fonts['inter_large_detail'] = ImageFont.load_default(size=70) # Large detail font fallback
-        fonts['inter_xl_detail'] = ImageFont.load_default(size=90)    # XL detail font fallback
-        fonts['inter_small'] = ImageFont.load_default(size=32)
-        fonts['inter_label'] = ImageFont.load_default(size=36)
+    layout_hotel_cards(page, hotels)
 
+    # --- Layer 4: Amenity Ribbon (Placeholder) --- # Renumbered layer
+    # TODO: Implement gradient (optional), icon loading/placement, label drawing
+    return page
 
-    # --- Initialize Draw context ---
-    # We'll re-initialize it when needed, especially after pasting images
-    # draw = ImageDraw.Draw(img)
+def layout_hotel_cards(page, hotels, report=None):
+    """Lays out the info cards for the first hotel into `page`.
 
+    With `page` None the cards are only measured (into `report`, a LayoutReport, if given).
+    """
+    # --- Font Loading ---
+    # Moved font loading here, after potentially exiting early if hero fails
+    fonts = load_hotel_fonts()
 
     # --- Layer 2: Frosted-Glass Info Card #1 – Main Info --- # Updated comment
     page_dims = (PAGE_WIDTH_PX, PAGE_HEIGHT_PX)
     hotel_info_to_draw = None
-    if isinstance(hotel_details, list) and hotel_details:
-        hotel_info_to_draw = hotel_details[0]
-        if len(hotel_details) > 1:
-            print(f"Warning: Multiple hotels found in input, drawing only the first: {hotel_info_to_draw.get('name')}")
-    elif isinstance(hotel_details, dict):
-        hotel_info_to_draw = hotel_details
+    if hotels:
+        hotel_info_to_draw = hotels[0]
+        if len(hotels) > 1:
+            print(f"Warning: Multiple hotels found in input, drawing only the first: {hotel_info_to_draw.name}")
 
     if hotel_info_to_draw:
         card1_bounding_box = None # Initialize
         try:
             # Call the main info card function and get its box
-            card1_bounding_box = draw_main_info_card(img, hotel_info_to_draw, fonts, page_dims)
+            card1_bounding_box = layout_main_info_card(page, hotel_info_to_draw, fonts, page_dims, report)
         except Exception as e:
             print(f"Error drawing Main Info card: {e}")
 
@@ -170,8 +145,8 @@ def generate_hotels_page(output_filename: str, base_output_dir: str, hotel_detai
             print("Attempting to draw Checkin Card...") # DEBUG PRINT
             try:
                  # Call the check-in card function, passing card 1's box
-                draw_checkin_card(img, hotel_info_to_draw, fonts, page_dims, card1_bounding_box)
-                print("Call to draw_checkin_card completed.") # DEBUG PRINT
+                layout_checkin_card(page, hotel_info_to_draw, fonts, page_dims, card1_bounding_box, report)
+                print("Call to layout_checkin_card completed.") # DEBUG PRINT
             except Exception as e:
                 print(f"Error drawing Checkin card: {e}")
         else:
@@ -179,17 +154,48 @@ def generate_hotels_page(output_filename: str, base_output_dir: str, hotel_detai
     else:
         print("Warning: No valid hotel details found to draw cards.")
 
-    # --- Layer 4: Amenity Ribbon (Placeholder) --- # Renumbered layer
-    # TODO: Implement gradient (optional), icon loading/placement, label drawing
+def hotels_page_cache_key(hotel_details) -> str:
+    """Page cache key of the hotel page: the hotel it shows and every file and module it is drawn with."""
+    hotels = to_hotels(hotel_details)
+    hero_entry = asset_index.resolve(HERO_IMAGE_NAME)
+    return page_cache.page_key(
+        "hotels",
+        hotel=hotels[0] if hotels else None, # Only the first hotel is drawn
+        background=page_cache.file_input(hero_entry.path) if hero_entry else None,
+        fonts=[page_cache.file_input(path) for path in (FONT_PATH_PLAYFAIR, FONT_PATH_PLAYFAIR_ITALIC, FONT_PATH_INTER)],
+        icons=[page_cache.file_input(path) for path in (card_drawing.STAR_ICON_PATH, card_drawing.LOCATION_PIN_ICON_PATH,
+                                                        card_drawing.PHONE_ICON_PATH)],
+        code=page_cache.code_input(__name__, card_drawing.__name__, "core.background", "core.display_list",
+                                   "core.text_fit", "core.text_sprites"),
+    )
+
+def check_hotels_page(hotel_details, report):
+    """Measures the hotel cards into `report` (a LayoutReport), without loading the hero."""
+    layout_hotel_cards(None, to_hotels(hotel_details), report)
+
+def generate_hotels_page(output_filename: str, base_output_dir: str, hotel_details):
+    """Generates a premium hotel details page resembling a brochure.
+
+    `hotel_details` are Hotel records (or one Hotel; raw hotel dicts are parsed).
+    Returns the rendered RGB page image, or None if it could not be generated.
+    """
+    output_path = os.path.join(base_output_dir, output_filename)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True) # Ensure dir exists
+
+    page = layout_hotels_page(hotel_details)
+    if page is None:
+        return None
 
     # --- Save Image ---
     try:
-        # Ensure final image is RGB for JPEG saving if needed, or save RGBA PNG
-        final_img = img.convert('RGB') # Convert before saving as JPEG
-        final_img.save(output_path, quality=95, dpi=(DPI, DPI)) # Add quality and DPI
-        print(f"Successfully generated initial hotels page: {output_path}")
+        # The prepared background is used only for this page, so it is painted on directly
+        final_img = display_list.paint(page, consume_background=True)
+        prefetch.when_saved(output_path, lambda path: print(f"Successfully generated initial hotels page: {path}"))
+        prefetch.save_image(final_img, output_path, "JPEG", **determinism.jpeg_save_kwargs(95, (DPI, DPI))) # Add quality and DPI; encoded in the background
+        return final_img
     except Exception as e:
         print(f"Error saving image {output_path}: {e}")
+        return None
 
 # --- Helper Functions (Example: Rounded Rectangle Mask) ---
 # Moved to card_drawing.py
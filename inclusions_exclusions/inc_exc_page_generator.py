@@ -1,8 +1,13 @@
+import functools
 import os
 import json # Added json import
 import textwrap # Added textwrap import
-from PIL import Image, ImageDraw, ImageFont, ImageOps, ImageFilter
-import numpy as np # For gradient generation
+from PIL import Image, ImageDraw
+
+from core import asset_index, assets, determinism, display_list, page_cache, prefetch, text_fit
+from core.display_list import Blur, DisplayList, Line, Paste, RoundedRect, Text
+from core import fonts as font_cache
+from core.background import load_background
 
 # --- Constants ---
 WIDTH = 2480 # Standard A4 width @ 300 DPI
@@ -76,125 +81,129 @@ def create_gradient(width, height, start_color, end_alpha=0.0):
         draw.line([(0, y), (width, y)], fill=(start_r, start_g, start_b, current_alpha))
     return gradient
 
-def generate_inc_exc_page(
-    output_filename: str,
-    font_path_title: str,
-    font_path_item: str, # Added item font path
-    bg_image_path: str,
-    base_output_dir: str,
-    inclusions_list: list, # Added inclusions data
-    exclusions_list: list  # Added exclusions data
-):
-    """Generates the inclusions/exclusions page with the specified card design."""
-    output_path = os.path.join(base_output_dir, output_filename)
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-    # --- Load Assets Early ---
+def load_inc_exc_fonts(font_path_title: str, font_path_item: str):
+    """Loads the title and item fonts (cached per process), falling back to defaults."""
     try:
-        font_title = ImageFont.truetype(font_path_title, TITLE_FONT_SIZE)
-        font_item = ImageFont.truetype(font_path_item, ITEM_FONT_SIZE) # Load item font
+        font_title = font_cache.get_font(font_path_title, TITLE_FONT_SIZE)
+        font_item = font_cache.get_font(font_path_item, ITEM_FONT_SIZE) # Load item font
     except IOError as e:
         print(f"Error: Font file not found ({e}). Cannot generate page.")
         # Try loading at least one font if possible, or fallback?
-        try: font_title = ImageFont.truetype(font_path_title, TITLE_FONT_SIZE)
-        except: font_title = ImageFont.load_default(size=TITLE_FONT_SIZE)
-        try: font_item = ImageFont.truetype(font_path_item, ITEM_FONT_SIZE)
-        except: font_item = ImageFont.load_default(size=ITEM_FONT_SIZE)
+        try: font_title = font_cache.get_font(font_path_title, TITLE_FONT_SIZE)
+        except: font_title = font_cache.default_font(TITLE_FONT_SIZE)
+        try: font_item = font_cache.get_font(font_path_item, ITEM_FONT_SIZE)
+        except: font_item = font_cache.default_font(ITEM_FONT_SIZE)
         print("Attempting to use default fonts.")
         # return # Decide if we should exit if fonts fail
+    return font_title, font_item
 
-    # Load Icons
+def prefetch_inc_exc_page(bg_image_path: str):
+    """Starts preparing the page background on the prefetch threads."""
+    if asset_index.exists(bg_image_path):
+        prefetch.prefetch(load_background, bg_image_path, (WIDTH, HEIGHT))
+
+def layout_inc_exc_page(font_path_title: str, font_path_item: str, bg_image_path: str,
+                        inclusions_list: list, exclusions_list: list):
+    """Lays out the inclusions/exclusions page as a display list over its background.
+
+    Returns None if the background image is missing.
+    """
+    # --- Create Base Image with Full Background ---
+    # Fill-crop and scale the background to the full page in one fused pass (RGB),
+    # usually already done by the prefetch threads
+    try:
+        img = prefetch.fetch(load_background, bg_image_path, (WIDTH, HEIGHT))
+    except FileNotFoundError:
+        print(f"Error: Background image not found at {bg_image_path}. Cannot generate page.")
+        return None
+    page = DisplayList((WIDTH, HEIGHT), "RGB", img)
+    layout_inc_exc_card(page, font_path_title, font_path_item, inclusions_list, exclusions_list)
+    return page
+
+@functools.lru_cache(maxsize=1)
+def _card_mask() -> Image.Image:
+    # Rounded-corner mask of the card; the same for every page, shared read-only
+    mask = Image.new('L', (CARD_WIDTH, CARD_HEIGHT), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    mask_draw.rounded_rectangle([0, 0, CARD_WIDTH, CARD_HEIGHT], radius=CARD_RADIUS, fill=255)
+    return mask
+
+def _wrap_column(items: list, font_item, wrap_width_chars: int, text_width: int, max_height: int):
+    # Items are wrapped at the estimated character count; if that runs off the
+    # card, the column's item font is sized down until every item fits instead.
+    # Returns (font, line spacing, lines per item)
+    wrapped = [textwrap.wrap(item, width=wrap_width_chars) for item in items]
+    if sum(max(1, len(lines)) for lines in wrapped) * ITEM_LINE_SPACING <= max_height:
+        return font_item, ITEM_LINE_SPACING, wrapped
+    spacing_ratio = ITEM_LINE_SPACING / ITEM_FONT_SIZE
+    font_item, wrapped = text_fit.fit_text(font_item, items, text_width, max_height=max_height, line_height=spacing_ratio)
+    print(f"Column items sized down to {font_item.size}px to fit the card")
+    return font_item, int(font_item.size * spacing_ratio), wrapped
+
+def _report_column(report, name: str, wrapped_items: list, font_item, text_width: int, top_y, bottom_y, end_y):
+    # Records a list column's height (against the divider's end) and its widest line
+    draw = display_list.measurer()
+    report.add(f"{name} column", "height", bottom_y - top_y, end_y - top_y,
+               [f"items run {end_y - bottom_y:.0f}px past the bottom of the card" if end_y > bottom_y else None])
+    widest, too_wide = 0, []
+    for lines in wrapped_items:
+        for line in lines:
+            line_w = draw.textbbox((0, 0), line, font=font_item)[2]
+            widest = max(widest, line_w)
+            if line_w > text_width:
+                too_wide.append(f"line '{line}' is {line_w - text_width}px wider than the column")
+    report.add(f"{name} column", "width", text_width, widest, too_wide)
+
+def layout_inc_exc_card(page: DisplayList, font_path_title: str, font_path_item: str,
+                        inclusions_list: list, exclusions_list: list, report=None):
+    """Lays out the frosted card with both lists into `page`.
+
+    With a LayoutReport, records each column's height and widest line.
+    """
+    # --- Load Assets Early ---
+    font_title, font_item = load_inc_exc_fonts(font_path_title, font_path_item)
+
+    # Load Icons (decoded and resized once per process, shared read-only)
     tick_icon, cross_icon = None, None
     list_tick_icon, list_cross_icon = None, None # Icons for list items
     try:
-        if os.path.exists(ICON_PATH_TICK):
+        if asset_index.exists(ICON_PATH_TICK):
             # Load for title
-            tick_icon = Image.open(ICON_PATH_TICK).convert("RGBA")
-            tick_icon = tick_icon.resize((ICON_SIZE, ICON_SIZE), Image.Resampling.LANCZOS)
+            tick_icon = assets.load_icon(ICON_PATH_TICK, (ICON_SIZE, ICON_SIZE))
             # Load for list items
-            list_tick_icon = Image.open(ICON_PATH_TICK).convert("RGBA")
-            list_tick_icon = list_tick_icon.resize((LIST_ICON_SIZE, LIST_ICON_SIZE), Image.Resampling.LANCZOS)
+            list_tick_icon = assets.load_icon(ICON_PATH_TICK, (LIST_ICON_SIZE, LIST_ICON_SIZE))
         else:
             print(f"Warning: Tick icon not found at {ICON_PATH_TICK}")
     except Exception as e:
         print(f"Error loading tick icon: {e}")
 
     try:
-        if os.path.exists(ICON_PATH_CROSS):
+        if asset_index.exists(ICON_PATH_CROSS):
             # Load for title
-            cross_icon = Image.open(ICON_PATH_CROSS).convert("RGBA")
-            cross_icon = cross_icon.resize((ICON_SIZE, ICON_SIZE), Image.Resampling.LANCZOS)
+            cross_icon = assets.load_icon(ICON_PATH_CROSS, (ICON_SIZE, ICON_SIZE))
             # Load for list items
-            list_cross_icon = Image.open(ICON_PATH_CROSS).convert("RGBA")
-            list_cross_icon = list_cross_icon.resize((LIST_ICON_SIZE, LIST_ICON_SIZE), Image.Resampling.LANCZOS)
+            list_cross_icon = assets.load_icon(ICON_PATH_CROSS, (LIST_ICON_SIZE, LIST_ICON_SIZE))
         else:
             print(f"Warning: Cross icon not found at {ICON_PATH_CROSS}")
     except Exception as e:
         print(f"Error loading cross icon: {e}")
 
-    try:
-        bg_image_full = Image.open(bg_image_path).convert("RGBA") # Use RGBA for potential transparency later
-    except FileNotFoundError:
-        print(f"Error: Background image not found at {bg_image_path}. Cannot generate page.")
-        return
-
-    # --- Create Base Image with Full Background ---
-    # Resize/Crop background image to fit the full page
-    img_aspect = bg_image_full.width / bg_image_full.height
-    page_aspect = WIDTH / HEIGHT
-
-    if img_aspect > page_aspect:
-        new_height = HEIGHT
-        new_width = int(new_height * img_aspect)
-        resized_bg = bg_image_full.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        crop_x = (new_width - WIDTH) // 2
-        final_bg = resized_bg.crop((crop_x, 0, crop_x + WIDTH, new_height))
-    else:
-        new_width = WIDTH
-        new_height = int(new_width / img_aspect)
-        resized_bg = bg_image_full.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        crop_y = (new_height - HEIGHT) // 2
-        final_bg = resized_bg.crop((0, crop_y, new_width, crop_y + HEIGHT))
-
-    if final_bg.size != (WIDTH, HEIGHT):
-         final_bg = final_bg.resize((WIDTH, HEIGHT), Image.Resampling.LANCZOS)
-
-    # Create the base image and paste the full background
-    img = Image.new('RGBA', (WIDTH, HEIGHT)) # Use RGBA
-    img.paste(final_bg, (0, 0))
-    draw = ImageDraw.Draw(img) # Draw object for the main image
+    draw = display_list.measurer() # Layout only measures; the painter draws
 
     # --- Create Card Base & Mask (for rounded corners) ---
     # Define card coordinates directly on the main image
     card_box = (CARD_X0, CARD_Y0, CARD_X1, CARD_Y1)
 
-    # 1. Crop the background area where the card will be
-    background_crop = img.crop(card_box)
-
-    # 2. Apply Gaussian blur
-    blurred_crop = background_crop.filter(ImageFilter.GaussianBlur(CARD_BLUR_RADIUS))
-
-    # 3. Create a rounded corner mask (same dimensions as the card)
-    mask = Image.new('L', (CARD_WIDTH, CARD_HEIGHT), 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.rounded_rectangle([0, 0, CARD_WIDTH, CARD_HEIGHT], radius=CARD_RADIUS, fill=255)
+    # 1. Create a rounded corner mask (same dimensions as the card)
+    mask = _card_mask()
 
-    # 4. Paste the blurred background onto the main image using the mask
-    # Ensure blurred_crop is RGBA if img is RGBA
-    if blurred_crop.mode != 'RGBA' and img.mode == 'RGBA':
-        blurred_crop = blurred_crop.convert('RGBA')
-    img.paste(blurred_crop, (CARD_X0, CARD_Y0), mask)
+    # 2. Blur the background under the card and paste it back through the mask
+    page.add(Blur(card_box, CARD_BLUR_RADIUS, mask))
 
     # --- Optional: Add a subtle border like in the hotel page ---
-    draw = ImageDraw.Draw(img) # Re-initialize draw on the main image
     border_color = (200, 200, 200, 90) # Subtle light grey border
     border_thickness = 2
-    draw.rounded_rectangle(
-        card_box,
-        radius=CARD_RADIUS,
-        outline=border_color,
-        width=border_thickness
-    )
+    page.add(RoundedRect(card_box, CARD_RADIUS, None, border_color, border_thickness))
 
     # --- Draw Content (Titles and Items) directly onto the main image ---
     # Adjust coordinates to be relative to the page (img), not the removed card_img
@@ -225,11 +234,11 @@ def generate_inc_exc_page(
     icon_y_incl = title_y_incl + (text_height_incl - ICON_SIZE) // 2 # Vertically center icon with text
     current_x_incl = title_x_start_incl
     if tick_icon:
-        img.paste(tick_icon, (int(current_x_incl), int(icon_y_incl)), tick_icon) # Use main img.paste
+        page.add(Paste(tick_icon, (int(current_x_incl), int(icon_y_incl)), tick_icon))
         current_x_incl += ICON_SIZE + TITLE_ICON_SPACING
 
     # Draw Text
-    draw.text((current_x_incl, title_y_incl), text_included_only, fill=COLOR_CHARCOAL_TEXT, font=font_title)
+    page.add(Text((current_x_incl, title_y_incl), text_included_only, font_title, COLOR_CHARCOAL_TEXT, None))
 
     # --- Right Column Title (Not Included) --- 
     text_excluded_only = TEXT_NOT_INCLUDED.replace(" ✕", "").strip() # Remove cross text
@@ -249,19 +258,18 @@ def generate_inc_exc_page(
     icon_y_excl = title_y_excl + (text_height_excl - ICON_SIZE) // 2 # Vertically center icon with text
     current_x_excl = title_x_start_excl
     if cross_icon:
-        img.paste(cross_icon, (int(current_x_excl), int(icon_y_excl)), cross_icon) # Use main img.paste
+        page.add(Paste(cross_icon, (int(current_x_excl), int(icon_y_excl)), cross_icon))
         current_x_excl += ICON_SIZE + TITLE_ICON_SPACING
 
     # Draw Text
-    draw.text((current_x_excl, title_y_excl), text_excluded_only, fill=COLOR_CHARCOAL_TEXT, font=font_title)
+    page.add(Text((current_x_excl, title_y_excl), text_excluded_only, font_title, COLOR_CHARCOAL_TEXT, None))
 
     # --- Draw Vertical Divider --- 
     divider_x = content_x_start + content_width // 2
     # Start divider slightly below titles, end before card bottom
     divider_y_start = title_y_incl + max(text_height_incl, text_height_excl) + 40 
     divider_y_end = CARD_Y1 - CARD_MARGIN # End margin from bottom of card
-    draw.line([(divider_x, divider_y_start), (divider_x, divider_y_end)], 
-              fill=DIVIDER_COLOR, width=DIVIDER_THICKNESS)
+    page.add(Line([(divider_x, divider_y_start), (divider_x, divider_y_end)], DIVIDER_COLOR, DIVIDER_THICKNESS))
 
     # --- Draw Inclusion Items (Left Column) --- 
     current_y = divider_y_start + 50 # Adjusted starting Y further down
@@ -275,29 +283,36 @@ def generate_inc_exc_page(
         wrap_width_chars = max(10, int(available_text_width / avg_char_width_est)) # Ensure minimum wrap width
     print(f"Left Column: Item Font Size={ITEM_FONT_SIZE}, Available Width={available_text_width}, Est Wrap Chars={wrap_width_chars}")
 
-    for item in inclusions_list:
-        lines = textwrap.wrap(item, width=wrap_width_chars)
+    column_top = divider_y_start + 50
+    col_font, line_spacing, wrapped_items = _wrap_column(inclusions_list, font_item, wrap_width_chars, available_text_width,
+                                                         divider_y_end - column_top)
+    for lines in wrapped_items:
         if lines:
             # Calculate Y pos for the icon to roughly center it with the first line of text
-            first_line_height_approx = font_item.size # Approximate height
+            first_line_height_approx = col_font.size # Approximate height
             icon_y = current_y + (first_line_height_approx - LIST_ICON_SIZE) // 2
             # Draw list tick icon
             if list_tick_icon:
-                 img.paste(list_tick_icon, (left_col_x_start, int(icon_y)), list_tick_icon)
+                 page.add(Paste(list_tick_icon, (left_col_x_start, int(icon_y)), list_tick_icon))
             
             # Calculate text start position
             text_x = left_col_x_start + LIST_ICON_SIZE + LIST_ICON_TEXT_SPACING
             
             # Draw first line of text
-            draw.text((text_x, current_y), lines[0], fill=COLOR_CHARCOAL_TEXT, font=font_item)
-            current_y += ITEM_LINE_SPACING # Move y for next *potential* line/item
+            page.add(Text((text_x, current_y), lines[0], col_font, COLOR_CHARCOAL_TEXT, None))
+            current_y += line_spacing # Move y for next *potential* line/item
             # Draw subsequent wrapped lines (indented to align with first line text)
             for line in lines[1:]:
-                draw.text((text_x, current_y), line, fill=COLOR_CHARCOAL_TEXT, font=font_item)
-                current_y += ITEM_LINE_SPACING # Move y down for each wrapped line
+                page.add(Text((text_x, current_y), line, col_font, COLOR_CHARCOAL_TEXT, None))
+                current_y += line_spacing # Move y down for each wrapped line
         else: # Handle empty items?
-            current_y += ITEM_LINE_SPACING
+            current_y += line_spacing
         # No extra space between items to maximize vertical fill
+    # Lines may run up to the divider / card edge
+    column_text_width = column_width - LIST_ICON_SIZE - LIST_ICON_TEXT_SPACING
+    if report is not None:
+        _report_column(report, "Inclusions", wrapped_items, col_font, column_text_width,
+                       column_top, divider_y_end, current_y)
 
     # --- Draw Exclusion Items (Right Column) --- 
     current_y = divider_y_start + 50 # Reset Y to start top-aligned with inclusions, adjusted further down
@@ -309,38 +324,83 @@ def generate_inc_exc_page(
         wrap_width_chars = max(10, int(available_text_width / avg_char_width_est))
     print(f"Right Column: Item Font Size={ITEM_FONT_SIZE}, Available Width={available_text_width}, Est Wrap Chars={wrap_width_chars}")
 
-    for item in exclusions_list:
-        lines = textwrap.wrap(item, width=wrap_width_chars)
+    col_font, line_spacing, wrapped_items = _wrap_column(exclusions_list, font_item, wrap_width_chars, available_text_width,
+                                                         divider_y_end - column_top)
+    for lines in wrapped_items:
         if lines:
-            first_line_height_approx = font_item.size
+            first_line_height_approx = col_font.size
             icon_y = current_y + (first_line_height_approx - LIST_ICON_SIZE) // 2
             # Draw list cross icon
             if list_cross_icon:
-                 img.paste(list_cross_icon, (right_col_x_start, int(icon_y)), list_cross_icon)
+                 page.add(Paste(list_cross_icon, (right_col_x_start, int(icon_y)), list_cross_icon))
             
             text_x = right_col_x_start + LIST_ICON_SIZE + LIST_ICON_TEXT_SPACING
             
-            draw.text((text_x, current_y), lines[0], fill=COLOR_CHARCOAL_TEXT, font=font_item)
-            current_y += ITEM_LINE_SPACING
+            page.add(Text((text_x, current_y), lines[0], col_font, COLOR_CHARCOAL_TEXT, None))
+            current_y += line_spacing
             for line in lines[1:]:
-                draw.text((text_x, current_y), line, fill=COLOR_CHARCOAL_TEXT, font=font_item)
-                current_y += ITEM_LINE_SPACING
+                page.add(Text((text_x, current_y), line, col_font, COLOR_CHARCOAL_TEXT, None))
+                current_y += line_spacing
         else:
-            current_y += ITEM_LINE_SPACING
+            current_y += line_spacing
         # No extra space between items
+    if report is not None:
+        _report_column(report, "Exclusions", wrapped_items, col_font, column_text_width,
+                       column_top, divider_y_end, current_y)
+
+def inc_exc_page_cache_key(font_path_title: str, font_path_item: str, bg_image_path: str,
+                           inclusions_list: list, exclusions_list: list) -> str:
+    """Page cache key of the inclusions/exclusions page: both lists and every file and module it is drawn with."""
+    return page_cache.page_key(
+        "inc_exc",
+        inclusions=list(inclusions_list),
+        exclusions=list(exclusions_list),
+        background=page_cache.file_input(bg_image_path),
+        fonts=[page_cache.file_input(font_path_title), page_cache.file_input(font_path_item)],
+        icons=[page_cache.file_input(ICON_PATH_TICK), page_cache.file_input(ICON_PATH_CROSS)],
+        code=page_cache.code_input(__name__, "core.background", "core.display_list", "core.text_fit", "core.text_sprites"),
+    )
+
+def check_inc_exc_page(font_path_title: str, font_path_item: str, inclusions_list: list, exclusions_list: list, report):
+    """Measures both columns into `report` (a LayoutReport), without loading the background."""
+    layout_inc_exc_card(DisplayList((WIDTH, HEIGHT), "RGB", PAGE_BG_COLOR), font_path_title, font_path_item,
+                        inclusions_list, exclusions_list, report)
+
+def generate_inc_exc_page(
+    output_filename: str,
+    font_path_title: str,
+    font_path_item: str, # Added item font path
+    bg_image_path: str,
+    base_output_dir: str,
+    inclusions_list: list, # Added inclusions data
+    exclusions_list: list  # Added exclusions data
+):
+    """Generates the inclusions/exclusions page with the specified card design.
+
+    Returns the rendered RGB page image (owned by the caller), or None on failure.
+    """
+    output_path = os.path.join(base_output_dir, output_filename)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    page = layout_inc_exc_page(font_path_title, font_path_item, bg_image_path, inclusions_list, exclusions_list)
+    if page is None:
+        return None
+    # The prepared background is used only for this page, so it is painted on directly
+    img = display_list.paint(page, consume_background=True)
 
     # --- Save Image ---
     try:
         # Save as RGB (discard alpha)
         print(f"Attempting to save image to: {output_path}")
-        img_rgb = img.convert('RGB')
-        img_rgb.save(output_path)
-        print(f"Successfully completed save command for: {output_path}")
-        # Explicitly close images
-        img_rgb.close() 
-        img.close()
+        img_rgb = img if img.mode == 'RGB' else img.convert('RGB')
+        prefetch.when_saved(output_path, lambda path: print(f"Successfully saved: {path}"))
+        prefetch.save_image(img_rgb, output_path, "JPEG", **determinism.jpeg_save_kwargs(75)) # Pillow's default quality, pinned; encoded in the background
+        # Close the working canvas if a separate RGB copy was saved; the RGB page is returned
+        if img_rgb is not img:
+            img.close()
         # Original success message remains
         print(f"Successfully generated inclusions/exclusions page: {output_path}")
+        return img_rgb
     except Exception as e:
         print(f"Error saving image {output_path}: {e}")
         # Close images in case of error too, if they exist
@@ -348,6 +408,7 @@ def generate_inc_exc_page(
             img_rgb.close()
         if 'img' in locals() and img:
             img.close()
+        return None
 
 # Example Usage (if you want to run this script directly)
 if __name__ == '__main__':
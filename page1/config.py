@@ -0,0 +1,134 @@
+import copy
+
+from core.frozen import Frozen, as_color, as_ink, as_int, as_int_pair, as_number, as_text, compile_fields
+from core.validation import ValidationError
+
+# Compiled page1_config. The nested JSON section is merged over DEFAULT_CONFIG
+# and flattened into an immutable Page1Config once per job, so the cover code
+# reads plain attributes and the defaults are never modified by a job.
+
+# Default config, will be merged with JSON data
+DEFAULT_CONFIG = {
+    "page_size_px": (2480, 3508), # A4 @ 300 DPI
+    "dpi": 300,
+    "paths": {
+        "input_dir": "inputs",
+        "output_dir": "outputs",
+        "logo": "inputs/sena_logo_transparent.png", # Default logo path
+        "title_font": "fonts/papyrus.ttf",
+        "text_font": "/System/Library/Fonts/Optima.ttc", # Consider a cross-platform default
+    },
+    "text_content": {
+        "title1": "YOUR",
+        "title2": "TITLE",
+        "dates": "JAN 1 - JAN 10, 2025",
+        "prep": "Prepared for  ",
+        "name": "Client Name"
+    },
+    "fonts": {
+        "title_size": 220,
+        "dates_size": 85,
+        "prep_size": 85,
+        "name_size": 150
+    },
+    "layout": {
+        "text_start_y": 200,
+        "padding_title_lines": 80,
+        "padding_below_title": 180,
+        "padding_below_dates": 180,
+        "padding_below_prep_name": 100,
+        "prep_name_manual_v_offset": 65,
+        "prep_name_y": 3000 # Y position for "Prepared for Name" line
+    },
+    "styles": {
+        "logo_width": 200,
+        "logo_opacity": 0.70,
+        "overlay_color": (0, 0, 0, 80),
+        "text_fill": "white",
+        "text_shadow_color": "grey",
+        "text_shadow_offset": (3, 3),
+        "jpeg_quality": 95
+    }
+}
+
+# section -> ((attribute, key, check), ...); None is the top level of page1_config
+_SECTIONS = {
+    None: (
+        ("page_size", "page_size_px", as_int_pair),
+        ("dpi", "dpi", as_int),
+    ),
+    "paths": (
+        ("input_dir", "input_dir", as_text),
+        ("output_dir", "output_dir", as_text),
+        ("logo_path", "logo", as_text),
+        ("title_font", "title_font", as_text),
+        ("text_font", "text_font", as_text),
+    ),
+    "text_content": (
+        ("title1", "title1", as_text),
+        ("title2", "title2", as_text),
+        ("dates", "dates", as_text),
+        ("prep", "prep", as_text),
+        ("name", "name", as_text),
+    ),
+    "fonts": (
+        ("title_size", "title_size", as_int),
+        ("dates_size", "dates_size", as_int),
+        ("prep_size", "prep_size", as_int),
+        ("name_size", "name_size", as_int),
+    ),
+    "layout": (
+        ("text_start_y", "text_start_y", as_int),
+        ("padding_title_lines", "padding_title_lines", as_int),
+        ("padding_below_title", "padding_below_title", as_int),
+        ("padding_below_dates", "padding_below_dates", as_int),
+        ("padding_below_prep_name", "padding_below_prep_name", as_int),
+        ("prep_name_manual_v_offset", "prep_name_manual_v_offset", as_int),
+        ("prep_name_y", "prep_name_y", as_int),
+    ),
+    "styles": (
+        ("logo_width", "logo_width", as_int),
+        ("logo_opacity", "logo_opacity", as_number),
+        ("overlay_color", "overlay_color", as_color),
+        ("text_fill", "text_fill", as_ink),
+        ("text_shadow_color", "text_shadow_color", as_ink),
+        ("text_shadow_offset", "text_shadow_offset", as_int_pair),
+        ("jpeg_quality", "jpeg_quality", as_int),
+    ),
+}
+
+class Page1Config(Frozen):
+    """Immutable, validated page1_config, flattened to one attribute per setting."""
+    __slots__ = tuple(attr for fields in _SECTIONS.values() for attr, _, _ in fields)
+
+def merge_config(config_data: dict) -> dict:
+    """Merges the provided config over a copy of DEFAULT_CONFIG (one level deep)."""
+    current_config = copy.deepcopy(DEFAULT_CONFIG)
+    for key, value in config_data.items():
+        if isinstance(value, dict) and key in current_config and isinstance(current_config[key], dict):
+             current_config[key].update(value)
+        else:
+             current_config[key] = value
+    return current_config
+
+def compile_page1_config(config_data) -> Page1Config:
+    """Merges page1_config over the defaults, validates it and compiles a Page1Config.
+
+    Raises ValidationError (a ValueError) listing every invalid key. A Page1Config is returned as is.
+    """
+    if isinstance(config_data, Page1Config):
+        return config_data
+    merged = merge_config(config_data)
+    errors = []
+    values = {}
+    for section, fields in _SECTIONS.items():
+        data = merged if section is None else merged.get(section)
+        prefix = "page1_config" if section is None else f"page1_config.{section}"
+        if not isinstance(data, dict):
+            errors.append(f"{prefix}: expected an object, got {data!r}")
+            continue
+        defaults = DEFAULT_CONFIG if section is None else DEFAULT_CONFIG[section]
+        values.update(compile_fields(prefix, data, [(attr, key, defaults[key], check) for attr, key, check in fields], errors))
+    if errors:
+        raise ValidationError("Invalid page1_config", errors)
+    return Page1Config(**values)
@@ -1,43 +1,49 @@
 import os
-from PIL import Image, ImageDraw, ImageFont
 
-def generate_quote_page(output_filename: str, font_path: str, base_output_dir: str, quote: dict, terms_conditions: list, width=800, height=600):
-    """Generates the quote page (currently a placeholder)."""
+from core import determinism, display_list, prefetch
+from core.display_list import DisplayList, Text
+from core.itinerary import Quote
+from core import fonts as font_cache
+
+def layout_quote_page(font_path: str, quote: Quote, terms_conditions: tuple, width=800, height=600) -> DisplayList:
+    """Lays out the quote page (currently a placeholder) as a display list."""
     title_text = "Quote"
-    output_path = os.path.join(base_output_dir, output_filename)
     
     try:
         font_size = 40
-        font = ImageFont.truetype(font_path, font_size)
+        font = font_cache.get_font(font_path, font_size)
     except IOError:
         print(f"Warning: Font file not found at {font_path}. Using default font.")
         try:
-            font = ImageFont.load_default(font_size)
+            font = font_cache.default_font(font_size)
         except IOError:
              print(f"Warning: Default PIL font not found. Title will be missing.")
              font = None
 
-    img = Image.new('RGB', (width, height), color=(255, 255, 255))
-    d = ImageDraw.Draw(img)
+    page = DisplayList((width, height), "RGB", (255, 255, 255))
     
     if font:
-        try:
-             bbox = d.textbbox((0, 0), title_text, font=font)
-             text_width = bbox[2] - bbox[0]
-             text_height = bbox[3] - bbox[1]
-        except AttributeError:
-             text_width, text_height = d.textsize(title_text, font=font)
+        bbox = display_list.measurer().textbbox((0, 0), title_text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
 
         x = (width - text_width) / 2
         y = 50
-        d.text((x, y), title_text, fill=(0, 0, 0), font=font)
+        page.add(Text((x, y), title_text, font, (0, 0, 0), None))
         # TODO: Add actual quote & terms rendering logic here using the 'quote' and 'terms_conditions' data
     else:
         print("Skipping drawing title due to missing font.")
+    return page
+
+def generate_quote_page(output_filename: str, font_path: str, base_output_dir: str, quote: Quote, terms_conditions: tuple, width=800, height=600):
+    """Generates the quote page (currently a placeholder). Returns the page image."""
+    output_path = os.path.join(base_output_dir, output_filename)
+    img = display_list.paint(layout_quote_page(font_path, quote, terms_conditions, width, height))
 
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        img.save(output_path)
-        print(f"Successfully created placeholder quote page: {output_path}")
+        prefetch.when_saved(output_path, lambda path: print(f"Successfully created placeholder quote page: {path}"))
+        prefetch.save_image(img, output_path, "JPEG", **determinism.jpeg_save_kwargs(75)) # Encoded in the background
     except Exception as e:
-        print(f"Error saving image {output_path}: {e}") 
\ No newline at end of file
+        print(f"Error saving image {output_path}: {e}")
+    return img 
\ No newline at end of file
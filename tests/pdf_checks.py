@@ -0,0 +1,151 @@
+import io
+import re
+import pytest
+from PIL import Image, PdfParser
+
+# Helpers for the PDF round-trip tests. PdfReader reads a PDF the way a
+# viewer does: from the last startxref through every /Prev cross-reference
+# section (so incremental updates and linearized files, which Pillow's
+# PdfParser can't reopen, are read too), checking that each object sits
+# exactly at its cross-reference offset.
+
+_XREF = re.compile(rb"xref\s+")
+_SUBSECTION = re.compile(rb"(\d+) (\d+)\s+")
+_ENTRY = re.compile(rb"(\d{10}) (\d{5}) ([nf])[ \r\n]{2}")
+_TRAILER = re.compile(rb"trailer\s*")
+_OBJECT = re.compile(rb"(\d+)\s+(\d+)\s+obj\b")
+_STARTXREF = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+
+def make_jpeg(path: str, size=(120, 90), color=(200, 40, 40), mode: str = "RGB") -> str:
+    """Writes a small JPEG of one colour with a stripe (so images differ by size and content). Returns path."""
+    img = Image.new(mode, size, color)
+    img.paste((255,) * len(img.getbands()) if mode != "L" else 255, (0, 0, size[0] // 3, size[1]))
+    img.save(path, "JPEG", quality=80)
+    return path
+
+class PdfReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        m = _STARTXREF.search(data)
+        assert m, "no startxref at the end of the file"
+        self.offsets = {}   # Object number -> offset (None if freed), newest section first
+        self.trailers = []  # Trailer dictionaries, in reading order
+        self.sections = []  # Cross-reference section offsets, in reading order
+        offset = int(m.group(1))
+        while offset is not None:
+            assert offset not in self.sections, "cross-reference sections loop"
+            self.sections.append(offset)
+            trailer = self._read_section(offset)
+            self.trailers.append(trailer)
+            offset = trailer.get(b"Prev")
+
+    @classmethod
+    def open(cls, path: str):
+        with open(path, "rb") as f:
+            return cls(f.read())
+
+    def _read_section(self, offset: int):
+        m = _XREF.match(self.data, offset)
+        assert m, f"no cross-reference section at {offset}"
+        position = m.end()
+        while True:
+            m = _SUBSECTION.match(self.data, position)
+            if m is None:
+                break
+            first, count = int(m.group(1)), int(m.group(2))
+            position = m.end()
+            for number in range(first, first + count):
+                entry = _ENTRY.match(self.data, position)
+                assert entry, f"bad cross-reference entry at {position}"
+                position = entry.end()
+                self.offsets.setdefault(number, int(entry.group(1)) if entry.group(3) == b"n" else None)
+        m = _TRAILER.match(self.data, position)
+        assert m, f"no trailer after the cross-reference section at {offset}"
+        trailer, _ = PdfParser.PdfParser.get_value(self.data, m.end())
+        return trailer
+
+    @property
+    def trailer(self):
+        return self.trailers[0]
+
+    def object_span(self, ref) -> tuple:
+        """(start, end) of an object in the file, checking its cross-reference offset."""
+        number = ref.object_id if isinstance(ref, PdfParser.IndirectReference) else ref
+        offset = self.offsets.get(number)
+        assert offset is not None, f"object {number} is not in use"
+        m = _OBJECT.match(self.data, offset)
+        assert m and int(m.group(1)) == number, f"object {number} is not at its offset {offset}"
+        _, end = PdfParser.PdfParser.get_value(self.data, offset)
+        return offset, end + len(re.match(rb"\s*", self.data[end:end + 4]).group())
+
+    def get(self, ref):
+        number = ref.object_id if isinstance(ref, PdfParser.IndirectReference) else ref
+        start, _ = self.object_span(number)
+        value, _ = PdfParser.PdfParser.get_value(self.data, start)
+        return value
+
+    def pages(self) -> list:
+        """Page object references in page order (from the catalog's page tree)."""
+        root = self.get(self.trailer[b"Root"])
+        result = []
+        def walk(ref):
+            node = self.get(ref)
+            if node[b"Type"] == b"Pages":
+                for kid in node[b"Kids"]:
+                    walk(kid)
+            else:
+                result.append(ref)
+        walk(root[b"Pages"])
+        count = self.get(root[b"Pages"])[b"Count"]
+        assert count == len(result), f"/Count {count}, {len(result)} pages in the tree"
+        return result
+
+    def reachable(self, start, skip=()) -> list:
+        """Objects reachable from `start` (not through /Parent or into `skip`), each checked against its offset."""
+        order, stack, seen = [], [start], set(skip)
+        while stack:
+            ref = stack.pop()
+            if ref in seen:
+                continue
+            seen.add(ref)
+            order.append(ref)
+            value = self.get(ref)
+            body = value.dictionary if isinstance(value, PdfParser.PdfStream) else value
+            items = ([item for key, item in body.items() if key != b"Parent"]
+                     if isinstance(body, (dict, PdfParser.PdfDict)) else [body])
+            stack.extend(_refs(items))
+        return order
+
+    def page_images(self, page_ref) -> list:
+        """The (reference, stream) of every image XObject on a page."""
+        page = self.get(page_ref)
+        xobjects = page[b"Resources"][b"XObject"]
+        return [(ref, self.get(ref)) for ref in xobjects.values()]
+
+def _refs(value):
+    if isinstance(value, PdfParser.IndirectReference):
+        yield value
+    elif isinstance(value, PdfParser.PdfStream):
+        yield from _refs(value.dictionary)
+    elif isinstance(value, (dict, PdfParser.PdfDict)):
+        for item in value.values():
+            yield from _refs(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _refs(item)
+
+def check_pdf(reader: PdfReader, page_sizes: list, resolution: float = 100.0):
+    """Checks every object reachable from the trailer and each page's MediaBox (pixel sizes at `resolution`)."""
+    reader.reachable(reader.trailer[b"Root"])
+    if b"Info" in reader.trailer:
+        reader.reachable(reader.trailer[b"Info"])
+    pages = reader.pages()
+    assert len(pages) == len(page_sizes)
+    for ref, (width, height) in zip(pages, page_sizes):
+        media_box = [float(value) for value in reader.get(ref)[b"MediaBox"]]
+        assert media_box == pytest.approx([0, 0, width * 72.0 / resolution, height * 72.0 / resolution], abs=0.01)
+    return pages
+
+def jpeg_size(data: bytes) -> tuple:
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
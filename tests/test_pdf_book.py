@@ -0,0 +1,76 @@
+import os
+import shutil
+import pytest
+from PIL import PdfParser
+
+from core import pdf_book
+from pdf_checks import PdfReader, check_pdf, jpeg_size, make_jpeg
+
+@pytest.fixture
+def jpegs(tmp_path):
+    red = make_jpeg(str(tmp_path / "red.jpg"), (120, 90), (200, 40, 40))
+    blue = make_jpeg(str(tmp_path / "blue.jpg"), (80, 100), (40, 40, 200))
+    grey = make_jpeg(str(tmp_path / "grey.jpg"), (64, 64), 128, mode="L")
+    red_copy = str(tmp_path / "red_copy.jpg")
+    shutil.copyfile(red, red_copy) # Same bytes under another name, as identical pages of two itineraries are
+    return red, blue, grey, red_copy
+
+def test_book_round_trip(tmp_path, jpegs):
+    red, blue, grey, red_copy = jpegs
+    path = str(tmp_path / "book.pdf")
+    with pdf_book.PdfBook(path, title="Options") as book:
+        book.add_section("Option A")
+        assert book.add_page(red) is False
+        assert book.add_page(blue) is False
+        book.add_section("Option B")
+        assert book.add_page(red_copy) is True
+        assert book.add_page(grey) is False
+
+    with open(path, "rb") as f:
+        pages = PdfParser.PdfParser(f=f).pages
+        assert len(pages) == 4
+    reader = PdfReader.open(path)
+    pages = check_pdf(reader, [jpeg_size(open(p, "rb").read()) for p in (red, blue, red_copy, grey)])
+    assert book.stats == {"pages": 4, "images": 3, "image_bytes": sum(os.path.getsize(p) for p in (red, blue, grey)),
+                          "deduplicated_bytes": os.path.getsize(red)}
+
+    # Identical JPEGs share one image XObject; each stream is the JPEG as it is
+    images = [reader.page_images(page) for page in pages]
+    assert all(len(page_images) == 1 for page_images in images)
+    refs = [page_images[0][0] for page_images in images]
+    assert refs[0] == refs[2]
+    assert len(set(refs)) == 3
+    for (_, stream), source in zip([page_images[0] for page_images in images], (red, blue, red_copy, grey)):
+        with open(source, "rb") as f:
+            assert stream.buf == f.read()
+    assert images[3][0][1].dictionary[b"ColorSpace"] == b"DeviceGray"
+
+    # One bookmark per section, pointing at its first page
+    root = reader.get(reader.trailer[b"Root"])
+    outlines = reader.get(root[b"Outlines"])
+    assert outlines[b"Count"] == 2
+    first, last = reader.get(outlines[b"First"]), reader.get(outlines[b"Last"])
+    assert first[b"Dest"][0] == pages[0]
+    assert last[b"Dest"][0] == pages[2]
+
+def test_streamed_book_matches_written_book(tmp_path, jpegs):
+    red, blue, grey, red_copy = jpegs
+    streamed = b"".join(pdf_book.stream_pages(iter([red, blue, red_copy]), title="Stream"))
+    reader = PdfReader(streamed)
+    pages = check_pdf(reader, [jpeg_size(open(p, "rb").read()) for p in (red, blue, red_copy)])
+    assert reader.page_images(pages[0])[0][0] == reader.page_images(pages[2])[0][0]
+
+    path = str(tmp_path / "written.pdf")
+    with pdf_book.PdfBook(path, title="Stream") as book:
+        for jpeg in (red, blue, red_copy):
+            book.add_page(jpeg)
+    with open(path, "rb") as f:
+        written = f.read()
+    # Only the creation dates may differ
+    assert len(streamed) == len(written)
+
+def test_book_rejects_non_jpeg_pages(tmp_path):
+    path = str(tmp_path / "book.pdf")
+    with pdf_book.PdfBook(path) as book:
+        with pytest.raises(OSError): # Not an image Pillow can identify
+            book.add_page(b"not a jpeg")
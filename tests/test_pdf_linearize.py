@@ -0,0 +1,111 @@
+import re
+import pytest
+from PIL import Image
+
+from core import pdf_book, pdf_linearize
+from pdf_checks import PdfReader, check_pdf, make_jpeg
+
+SIZES = [(120, 90), (80, 100), (100, 100), (60, 40)]
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+@pytest.fixture
+def pillow_pdf(tmp_path):
+    """A PDF as save_pdf writes it (page tree and cross-reference table at the end)."""
+    images = [Image.open(make_jpeg(str(tmp_path / f"p{i}.jpg"), size, (i * 50, 80, 200 - i * 40))).convert("RGB")
+              for i, size in enumerate(SIZES)]
+    path = str(tmp_path / "itinerary_output.pdf")
+    images[0].save(path, "PDF", resolution=100.0, save_all=True, append_images=images[1:])
+    return path
+
+@pytest.fixture
+def book_pdf(tmp_path):
+    """A book with bookmarks whose first and third pages share one image."""
+    jpegs = [make_jpeg(str(tmp_path / f"b{i}.jpg"), size, (200, i * 60, 40)) for i, size in enumerate(SIZES[:3])]
+    path = str(tmp_path / "book.pdf")
+    with pdf_book.PdfBook(path, title="Options") as book:
+        book.add_section("A")
+        book.add_page(jpegs[0])
+        book.add_page(jpegs[1])
+        book.add_section("B")
+        book.add_page(jpegs[0])
+        book.add_page(jpegs[2])
+    return path, [SIZES[0], SIZES[1], SIZES[0], SIZES[2]]
+
+def check_linearized(path: str, original: PdfReader, page_sizes: list) -> PdfReader:
+    """Checks the linearization dictionary against the real layout and that the pages are unchanged."""
+    data = _read(path)
+    reader = PdfReader(data)
+    pages = check_pdf(reader, page_sizes)
+
+    # The linearization dictionary is the first object; the last startxref points at the first page's section
+    m = re.match(rb"%PDF-1\.\d\s*%[^\n]*\n(\d+) 0 obj", data)
+    assert m and m.start(1) < 1024
+    lin = reader.get(int(m.group(1)))
+    assert lin[b"Linearized"] == 1
+    first_section, main_section = reader.sections
+    assert first_section < reader.object_span(reader.trailer[b"Root"])[0]
+    assert reader.trailers[1].get(b"Prev") is None
+
+    assert lin[b"L"] == len(data)
+    assert lin[b"N"] == len(pages)
+    assert lin[b"O"] == pages[0].object_id
+    # /H: offset and length of the primary hint stream object
+    hint_offset, hint_length = lin[b"H"]
+    hint_number = int(re.match(rb"(\d+) 0 obj", data[hint_offset:]).group(1))
+    assert reader.object_span(hint_number) == (hint_offset, hint_offset + hint_length)
+    # /E: end of the first page section, which holds the first page's objects (and the bookmarks)
+    first_page_objects = reader.reachable(pages[0], skip=pages[1:])
+    spans = [reader.object_span(ref) for ref in first_page_objects]
+    assert min(start for start, _ in spans) == hint_offset + hint_length
+    assert max(end for _, end in spans) <= lin[b"E"]
+    later = [start for start in reader.offsets.values() if start is not None and start >= lin[b"E"]]
+    assert min(later) == lin[b"E"] # The next page's objects start right after
+    # /T: the white-space before the first entry of the main cross-reference table
+    assert re.fullmatch(rb"xref\s+0 \d+", data[main_section:lin[b"T"]])
+    assert data[lin[b"T"]:lin[b"T"] + 1].isspace()
+    assert data[lin[b"T"] + 1:lin[b"T"] + 19] == b"0000000000 65535 f"
+
+    # Pages show the same image streams as before
+    original_pages = original.pages()
+    for page, original_page in zip(pages, original_pages):
+        assert [stream.buf for _, stream in reader.page_images(page)] == \
+               [stream.buf for _, stream in original.page_images(original_page)]
+    return reader
+
+def test_linearize_pillow_pdf(tmp_path, pillow_pdf):
+    original = PdfReader(_read(pillow_pdf))
+    output = str(tmp_path / "linearized.pdf")
+    stats = pdf_linearize.linearize_pdf(pillow_pdf, output)
+    reader = check_linearized(output, original, SIZES)
+    assert stats["pages"] == len(SIZES)
+    assert stats["bytes"] == len(reader.data)
+    assert stats["first_page_bytes"] == reader.get(int(re.search(rb"(\d+) 0 obj", reader.data).group(1)))[b"E"]
+
+def test_linearize_book_keeps_shared_images_and_bookmarks(book_pdf):
+    path, sizes = book_pdf
+    original = PdfReader(_read(path))
+    pdf_linearize.linearize_pdf(path) # In place
+    reader = check_linearized(path, original, sizes)
+    pages = reader.pages()
+    assert reader.page_images(pages[0])[0][0] == reader.page_images(pages[2])[0][0]
+    root = reader.get(reader.trailer[b"Root"])
+    lin = reader.get(int(re.search(rb"(\d+) 0 obj", reader.data).group(1)))
+    # Bookmarks are opened with the first page, so they sit in its section
+    for ref in reader.reachable(root[b"Outlines"], skip=pages):
+        assert reader.object_span(ref)[1] <= lin[b"E"]
+
+def test_linearize_single_page(tmp_path):
+    path = str(tmp_path / "one.pdf")
+    Image.open(make_jpeg(str(tmp_path / "one.jpg"))).convert("RGB").save(path, "PDF", resolution=100.0)
+    original = PdfReader(_read(path))
+    pdf_linearize.linearize_pdf(path)
+    data = _read(path)
+    reader = PdfReader(data)
+    check_pdf(reader, [(120, 90)])
+    lin = reader.get(int(re.search(rb"(\d+) 0 obj", data).group(1)))
+    assert lin[b"L"] == len(data) and lin[b"N"] == 1
+    assert [stream.buf for _, stream in reader.page_images(reader.pages()[0])] == \
+           [stream.buf for _, stream in original.page_images(original.pages()[0])]
@@ -0,0 +1,92 @@
+import os
+import pytest
+from PIL import Image, PdfParser
+
+from core import pdf_book, pdf_update
+from pdf_checks import PdfReader, check_pdf, jpeg_size, make_jpeg
+
+PAGES = [("page_1.jpg", (120, 90), (200, 40, 40)), ("page_2.jpg", (80, 100), (40, 200, 40)),
+         ("page_3.jpg", (100, 100), (40, 40, 200))]
+
+@pytest.fixture
+def recorded_pdf(tmp_path):
+    """A three-page PDF written like save_pdf, with its page record. Returns (pdf path, page JPEG paths)."""
+    jpegs = [make_jpeg(str(tmp_path / name), size, color) for name, size, color in PAGES]
+    images = [Image.open(path).convert("RGB") for path in jpegs]
+    path = str(tmp_path / "itinerary_output.pdf")
+    images[0].save(path, "PDF", resolution=100.0, save_all=True, append_images=images[1:])
+    pdf_update.record_pages(path, [(name, f"key-{name}") for name, _, _ in PAGES])
+    return path, jpegs
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_update_appends_to_the_old_bytes(tmp_path, recorded_pdf):
+    path, jpegs = recorded_pdf
+    before = _read(path)
+    new_page = make_jpeg(str(tmp_path / "new_page_2.jpg"), (140, 70), (240, 200, 0))
+    stats = pdf_update.update_pdf(path, [("page_1.jpg", "key-page_1.jpg", None),
+                                         ("page_2.jpg", "key-page_2.jpg-v2", new_page),
+                                         ("page_3.jpg", "key-page_3.jpg", None)])
+    after = _read(path)
+    assert after[:len(before)] == before
+    assert stats == {"kept": 2, "embedded": 1, "dropped": 1, "bytes_appended": len(after) - len(before)}
+
+    with open(path, "rb") as f:
+        assert len(PdfParser.PdfParser(f=f).pages) == 3
+    reader = PdfReader(after)
+    assert len(reader.sections) == 2
+    old_pages = PdfReader(before).pages()
+    pages = check_pdf(reader, [(120, 90), (140, 70), (100, 100)])
+    assert pages[0] == old_pages[0] and pages[2] == old_pages[2] # Kept pages keep their objects
+    (_, stream), = reader.page_images(pages[1])
+    assert stream.buf == pdf_book.pdf_jpeg(new_page)
+    # The replaced page's objects are freed
+    assert reader.offsets[old_pages[1].object_id] is None
+    assert [entry["key"] for entry in pdf_update.recorded_pages(path)] == [
+        "key-page_1.jpg", "key-page_2.jpg-v2", "key-page_3.jpg"]
+
+def test_update_drops_and_reorders_pages(recorded_pdf):
+    path, _ = recorded_pdf
+    before = _read(path)
+    stats = pdf_update.update_pdf(path, [("page_3.jpg", "key-page_3.jpg", None),
+                                         ("page_1.jpg", "key-page_1.jpg", None)])
+    assert stats["kept"] == 2 and stats["dropped"] == 1 and stats["embedded"] == 0
+    after = _read(path)
+    assert after[:len(before)] == before
+    old_pages = PdfReader(before).pages()
+    pages = check_pdf(PdfReader(after), [(100, 100), (120, 90)])
+    assert pages == [old_pages[2], old_pages[0]]
+
+def test_repeated_updates_chain_their_sections(tmp_path, recorded_pdf):
+    path, _ = recorded_pdf
+    sizes = [size for _, size, _ in PAGES]
+    for i in range(3):
+        before = _read(path)
+        new_page = make_jpeg(str(tmp_path / f"v{i}.jpg"), (50 + i * 10, 60), (i * 60, 100, 100))
+        previous = pdf_update.recorded_pages(path)
+        pages = [(entry["file"], entry["key"], None) for entry in previous]
+        pages[0] = ("page_1.jpg", f"key-v{i}", new_page)
+        pdf_update.update_pdf(path, pages)
+        sizes[0] = jpeg_size(pdf_book.pdf_jpeg(new_page))
+        after = _read(path)
+        assert after[:len(before)] == before
+        reader = PdfReader(after)
+        assert len(reader.sections) == i + 2
+        check_pdf(reader, sizes)
+
+def test_update_refuses_a_changed_pdf(recorded_pdf):
+    path, _ = recorded_pdf
+    with open(path, "ab") as f:
+        f.write(b"\n% rewritten elsewhere\n")
+    with pytest.raises(ValueError):
+        pdf_update.update_pdf(path, [("page_1.jpg", "key-page_1.jpg", None)])
+
+def test_update_refuses_unknown_kept_pages(recorded_pdf):
+    path, _ = recorded_pdf
+    before = _read(path)
+    with pytest.raises(ValueError):
+        pdf_update.update_pdf(path, [("page_1.jpg", "key-unknown", None)])
+    assert _read(path) == before
+    assert os.path.exists(pdf_update.manifest_path(path))